@@ -1,25 +1,27 @@
 """BM25-based MongoDB Atlas retrieval helpers."""
 from __future__ import annotations
 
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
 from .config import settings
 from .db import get_collection
-from .normalize import normalize_query_text, normalize_acceptance_metadata, sanitize_metadata
+from .hydration import hydrate
+from .normalize import normalize_query_text
+from .projection import (
+    document_from_result,
+    id_projection_stages,
+    result_projection_stages,
+    stored_source_fields,
+)
+from .request_context import mongo_time_limit
 
 
-async def search_with_atlas_pipeline(query: str, limit: int) -> Tuple[List[Dict[str, Any]], int]:
-    """Perform BM25 style full-text search using MongoDB Atlas $search stage."""
-    query = normalize_query_text(query)
-    if not query:
-        return [], 0
-
-    coll = get_collection()
+def build_search_stage(query: str) -> Dict[str, Any]:
+    """Return the bare ``$search`` text stage for an already-normalized query."""
     search_fields = settings.search_fields or []
     if not search_fields:
         search_fields = ["text"]
-
-    search_stage: Dict[str, Any] = {
+    return {
         "$search": {
             "index": settings.bm25_index_name,
             "text": {
@@ -29,26 +31,69 @@ async def search_with_atlas_pipeline(query: str, limit: int) -> Tuple[List[Dict[
         }
     }
 
-    pipeline: List[Dict[str, Any]] = [
-        search_stage,
-        {"$project": {"score": {"$meta": "searchScore"}, "document": "$$ROOT"}},
-        {"$limit": limit},
-    ]
+
+def build_search_pipeline(query: str, limit: int, fields: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+    """Build the BM25 aggregation honoring the configured result source and count mode."""
+    search_stage = build_search_stage(query)
+
+    # The match count rides along on every hit via $$SEARCH_META, so no second query is needed.
+    count_type = settings.bm25_count_type
+    extra: Dict[str, Any] = {}
+    if count_type in ("lowerBound", "total"):
+        search_stage["$search"]["count"] = {"type": count_type}
+        extra["meta"] = "$$SEARCH_META"
+
+    if settings.result_source == "ids":
+        projection = id_projection_stages("searchScore", extra)
+    elif stored_source_fields(fields) is not None:
+        # mongot returns the index's stored fields directly, skipping the mongod lookup behind $$ROOT;
+        # a requested ``fields`` subset is still projected out of the stored document.
+        search_stage["$search"]["returnStoredSource"] = True
+        projection = result_projection_stages("searchScore", fields, extra)
+    else:
+        projection = result_projection_stages("searchScore", fields, extra)
+
+    return [search_stage, {"$limit": limit}, *projection]
+
+
+async def search_with_atlas_pipeline(
+    query: str, limit: int, fields: Optional[Sequence[str]] = None
+) -> Tuple[List[Dict[str, Any]], int]:
+    """Perform BM25 style full-text search using MongoDB Atlas $search stage."""
+    query = normalize_query_text(query)
+    if not query:
+        return [], 0
+
+    coll = get_collection()
+    pipeline = build_search_pipeline(query, limit, fields)
 
     docs: List[Dict[str, Any]] = []
-    cursor = coll.aggregate(pipeline)
-    async for doc in cursor:
-        root = doc.get("document", {}) or {}
-        content = root.get("content") or root.get("text") or root.get("summary") or ""
-        metadata = {k: v for k, v in root.items() if k not in {"content", "text", "summary", "embedding"}}
-        metadata = normalize_acceptance_metadata(sanitize_metadata(metadata))
-        docs.append({
-            "content": content,
-            "score": float(doc.get("score", 0.0) or 0.0),
-            "metadata": metadata,
-        })
-
-    return docs, len(docs)
-
-
-__all__ = ["search_with_atlas_pipeline"]
+    total: Optional[int] = None
+    cursor = coll.aggregate(pipeline, **mongo_time_limit())
+    if settings.result_source == "ids":
+        hits = []
+        async for doc in cursor:
+            total = count_from_meta(doc) if total is None else total
+            hits.append((doc.get("_id"), doc.get("score", 0.0)))
+        docs = await hydrate(hits, fields)
+    else:
+        async for doc in cursor:
+            total = count_from_meta(doc) if total is None else total
+            docs.append(document_from_result(doc))
+
+    return docs, max(total or 0, len(docs))
+
+
+def count_from_meta(doc: Dict[str, Any]) -> Optional[int]:
+    """Read the ``$$SEARCH_META`` match count attached to a hit, if any."""
+    count = (doc.get("meta") or {}).get("count") or {}
+    value = count.get("total", count.get("lowerBound"))
+    return int(value) if isinstance(value, (int, float)) else None
+
+
+__all__ = [
+    "build_search_stage",
+    "build_search_pipeline",
+    "count_from_meta",
+    "search_with_atlas_pipeline",
+]
@@ -0,0 +1,103 @@
+"""Write-behind helper: a bounded queue drained by one daemon thread per process."""
+from __future__ import annotations
+
+import logging
+import os
+import queue
+import threading
+from typing import Callable, Generic, List, Optional, TypeVar
+
+from . import metrics
+
+
+logger = logging.getLogger("uvicorn.error")
+
+T = TypeVar("T")
+
+
+class BackgroundWriter(Generic[T]):
+    """Queue items from the event loop and hand them to ``write`` in batches on a worker thread.
+
+    ``put`` never blocks: once ``max_pending`` items are waiting, new ones are dropped and
+    counted in ``dropped_metric``. ``write`` receives up to ``max_batch`` items at a time (all
+    waiting items when ``None``) and should handle its own errors.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        write: Callable[[List[T]], None],
+        max_pending: int,
+        dropped_metric: str,
+        max_batch: Optional[int] = None,
+    ) -> None:
+        self._name = name
+        self._write = write
+        self._max_pending = max(1, max_pending)
+        self._dropped_metric = dropped_metric
+        self._max_batch = max_batch
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[Optional[T]]" = queue.Queue(maxsize=self._max_pending)
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+    def put(self, item: T) -> bool:
+        """Queue ``item`` for the writer thread; returns ``False`` if it was dropped."""
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            metrics.increment(self._dropped_metric)
+            return False
+        return True
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Write everything already queued, then stop the thread (a later ``put`` restarts it)."""
+        thread = self._thread
+        if thread is not None and self._pid == os.getpid() and thread.is_alive():
+            self._queue.put(None)
+            thread.join(timeout=timeout)
+        self._thread = None
+        self._pid = None
+
+    def _running(self) -> bool:
+        return self._thread is not None and self._pid == os.getpid() and self._thread.is_alive()
+
+    def _ensure_thread(self) -> None:
+        if self._running():
+            return
+        with self._lock:
+            if self._running():
+                return
+            if self._pid != os.getpid():
+                # A forked worker inherits the parent's queue object but not its thread.
+                self._queue = queue.Queue(maxsize=self._max_pending)
+            self._thread = threading.Thread(target=self._loop, args=(self._queue,), name=self._name, daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def _loop(self, pending: "queue.Queue[Optional[T]]") -> None:
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            batch = [item]
+            stop = False
+            while self._max_batch is None or len(batch) < self._max_batch:
+                try:
+                    item = pending.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            try:
+                self._write(batch)
+            except Exception:  # the thread must outlive a failed batch
+                logger.exception("%s failed to write %d queued items", self._name, len(batch))
+            if stop:
+                return
+
+
+__all__ = ["BackgroundWriter"]
@@ -0,0 +1,223 @@
+"""Adaptive ``numCandidates`` for ``$vectorSearch`` driven by measured recall.
+
+Recent query vectors are sampled into a small reservoir. A background job periodically
+replays them per k-bucket against an exact ``$vectorSearch`` (``exact: true``) and picks
+the smallest multiplier whose ANN results reach ``vector_recall_target``; the policy is
+then applied as ``numCandidates = clamp(k * multiplier)``.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+from fastapi import FastAPI
+
+from . import metrics
+from .config import settings
+from .db import get_collection
+
+
+logger = logging.getLogger("uvicorn.error")
+
+# Atlas accepts numCandidates up to 10000 and requires numCandidates >= limit.
+MAX_NUM_CANDIDATES = 10_000
+MULTIPLIER_LADDER = (1, 2, 3, 5, 8, 10, 15, 20, 30, 50)
+
+
+class _Bucket:
+    def __init__(self, max_k: Optional[int], multiplier: int) -> None:
+        self.max_k = max_k
+        self.multiplier = multiplier
+        self.samples: List[Tuple[List[float], int]] = []
+        self.seen = 0
+        self.recall: Optional[float] = None
+        self.recall_by_multiplier: Dict[int, float] = {}
+        self.measured_at: Optional[float] = None
+        self.queries_measured = 0
+
+
+class _CandidatePolicy:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.buckets: List[_Bucket] = []
+        self.task: Optional[asyncio.Task] = None
+        self.last_run: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.reset()
+
+    def reset(self) -> None:
+        limits: List[Optional[int]] = sorted(set(settings.vector_k_buckets or []))
+        with self.lock:
+            self.buckets = [_Bucket(limit, settings.vector_candidate_multiplier) for limit in [*limits, None]]
+
+    def bucket_for(self, k: int) -> _Bucket:
+        for bucket in self.buckets:
+            if bucket.max_k is None or k <= bucket.max_k:
+                return bucket
+        return self.buckets[-1]
+
+
+_policy = _CandidatePolicy()
+
+
+def clamp_candidates(k: int, multiplier: int) -> int:
+    floor = max(settings.vector_min_candidates, k)
+    return min(MAX_NUM_CANDIDATES, max(floor, k * multiplier))
+
+
+def num_candidates_for(k: int) -> int:
+    """``numCandidates`` for a ``$vectorSearch`` with ``limit=k`` under the current policy."""
+    if not settings.adaptive_candidates_enabled:
+        return clamp_candidates(k, settings.vector_candidate_multiplier)
+    return clamp_candidates(k, _policy.bucket_for(k).multiplier)
+
+
+def record_vector_query(embedding: Sequence[float], k: int) -> None:
+    """Reservoir-sample a served query vector so the tuner replays realistic traffic."""
+    if not settings.adaptive_candidates_enabled or k <= 0 or not embedding:
+        return
+    size = settings.vector_recall_sample_size
+    with _policy.lock:
+        bucket = _policy.bucket_for(k)
+        bucket.seen += 1
+        if len(bucket.samples) < size:
+            bucket.samples.append((list(embedding), k))
+        else:
+            slot = random.randrange(bucket.seen)
+            if slot < size:
+                bucket.samples[slot] = (list(embedding), k)
+
+
+async def _top_ids(embedding: List[float], k: int, num_candidates: Optional[int]) -> Set[str]:
+    from .vector_search import build_vector_stage
+
+    stage = build_vector_stage(embedding, k, num_candidates or 0, exact=num_candidates is None)
+    pipeline = [stage, {"$project": {"_id": 1}}]
+    return {str(doc.get("_id")) async for doc in get_collection().aggregate(pipeline)}
+
+
+async def _recall_at(samples: Sequence[Tuple[List[float], int, Set[str]]], multiplier: int) -> float:
+    total = 0.0
+    for embedding, k, truth in samples:
+        if not truth:
+            total += 1.0
+            continue
+        found = await _top_ids(embedding, k, clamp_candidates(k, multiplier))
+        total += len(found & truth) / len(truth)
+    return total / max(len(samples), 1)
+
+
+async def tune_bucket(bucket: _Bucket) -> None:
+    """Binary-search the ladder for the smallest multiplier meeting the recall target."""
+    with _policy.lock:
+        pool = list(bucket.samples)
+    if not pool:
+        return
+    picked = random.sample(pool, min(len(pool), settings.vector_recall_queries_per_run))
+    samples = [(embedding, k, await _top_ids(embedding, k, None)) for embedding, k in picked]
+
+    target = settings.vector_recall_target
+    recalls: Dict[int, float] = {}
+    lo, hi = 0, len(MULTIPLIER_LADDER) - 1
+    best = MULTIPLIER_LADDER[hi]
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        multiplier = MULTIPLIER_LADDER[mid]
+        recalls[multiplier] = await _recall_at(samples, multiplier)
+        if recalls[multiplier] >= target:
+            best = multiplier
+            hi = mid - 1
+        else:
+            lo = mid + 1
+    if best not in recalls:
+        recalls[best] = await _recall_at(samples, best)
+
+    with _policy.lock:
+        bucket.multiplier = best
+        bucket.recall = recalls[best]
+        bucket.recall_by_multiplier = dict(sorted(recalls.items()))
+        bucket.measured_at = time.time()
+        bucket.queries_measured = len(samples)
+    label = bucket.max_k if bucket.max_k is not None else "max"
+    metrics.set_gauge(f"vector_candidates_multiplier_k{label}", best)
+    metrics.set_gauge(f"vector_candidates_recall_k{label}", recalls[best])
+    logger.info(
+        "numCandidates policy k<=%s: multiplier=%d recall=%.3f (target %.3f, %d queries)",
+        label, best, recalls[best], target, len(samples),
+    )
+
+
+async def run_candidate_tuning() -> None:
+    start = time.perf_counter()
+    for bucket in list(_policy.buckets):
+        await tune_bucket(bucket)
+    _policy.last_run = time.time()
+    metrics.observe("vector_candidates_tuning_ms", (time.perf_counter() - start) * 1000)
+
+
+def candidate_policy_snapshot() -> Dict[str, Any]:
+    with _policy.lock:
+        buckets = [
+            {
+                "max_k": bucket.max_k,
+                "multiplier": bucket.multiplier,
+                "observed_recall": bucket.recall,
+                "recall_by_multiplier": bucket.recall_by_multiplier,
+                "queries_measured": bucket.queries_measured,
+                "samples": len(bucket.samples),
+                "measured_at": bucket.measured_at,
+            }
+            for bucket in _policy.buckets
+        ]
+    return {
+        "enabled": settings.adaptive_candidates_enabled,
+        "recall_target": settings.vector_recall_target,
+        "min_candidates": settings.vector_min_candidates,
+        "interval_seconds": settings.vector_recall_interval_seconds,
+        "last_run": _policy.last_run,
+        "last_error": _policy.last_error,
+        "buckets": buckets,
+    }
+
+
+async def start_candidate_tuning(app: FastAPI) -> None:
+    if not settings.adaptive_candidates_enabled or _policy.task is not None:
+        return
+
+    async def _run() -> None:
+        while True:
+            await asyncio.sleep(settings.vector_recall_interval_seconds)
+            try:
+                await run_candidate_tuning()
+                _policy.last_error = None
+            except Exception as exc:
+                _policy.last_error = str(exc)
+                logger.exception("numCandidates tuning failed; keeping the current policy")
+
+    _policy.task = asyncio.create_task(_run())
+    app.state.candidate_tuning_task = _policy.task
+
+
+async def stop_candidate_tuning(app: FastAPI) -> None:
+    if _policy.task is not None and not _policy.task.done():
+        _policy.task.cancel()
+    _policy.task = None
+    app.state.candidate_tuning_task = None
+
+
+__all__ = [
+    "MAX_NUM_CANDIDATES",
+    "MULTIPLIER_LADDER",
+    "clamp_candidates",
+    "num_candidates_for",
+    "record_vector_query",
+    "tune_bucket",
+    "run_candidate_tuning",
+    "candidate_policy_snapshot",
+    "start_candidate_tuning",
+    "stop_candidate_tuning",
+]
@@ -0,0 +1,419 @@
+"""Change-stream sync keeping in-process indexes and caches in step with the collection.
+
+A background task tails ``collection.watch()`` and hands batches of upserted documents
+and deleted ids to every registered target. The resume token is persisted after each
+batch so a restart continues where it left off; if the token has aged out of the oplog
+(or the stream is invalidated) every target is rebuilt from scratch.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from bson import json_util
+from fastapi import FastAPI
+from pymongo.errors import OperationFailure, PyMongoError
+
+from . import metrics
+from .config import settings
+from .db import get_collection
+from .exact_vector import (
+    apply_exact_vector_changes,
+    exact_vector_building,
+    exact_vector_from_dump,
+    exact_vector_pending_changes,
+    exact_vector_ready,
+    resync_exact_vectors,
+)
+from .hydration import clear_hydration_cache, invalidate_documents
+from .local_ann import (
+    apply_local_ann_changes,
+    local_ann_building,
+    local_ann_from_snapshot,
+    local_ann_pending_changes,
+    local_ann_ready,
+    resync_local_ann,
+)
+from .local_bm25 import (
+    apply_local_bm25_changes,
+    local_bm25_building,
+    local_bm25_from_snapshot,
+    local_bm25_pending_changes,
+    local_bm25_ready,
+    resync_local_bm25,
+)
+
+
+logger = logging.getLogger("uvicorn.error")
+
+ApplyChanges = Callable[[Sequence[Dict[str, Any]], Sequence[Any]], Awaitable[None]]
+Resync = Callable[[], Awaitable[None]]
+
+# ChangeStreamHistoryLost / ChangeStreamFatalError: the resume point is gone.
+_TOKEN_LOST_CODES = {280, 286}
+_MAX_REPLAY_BATCHES = 1000
+
+
+class ResyncRequired(Exception):
+    """The stream cannot continue from its resume point; every target must be rebuilt."""
+
+
+class SyncTarget:
+    """A local index or cache fed by the change stream.
+
+    ``ready`` reports whether the target can take changes yet (batches are buffered until it
+    can), ``pending`` how many changes it holds outside its base structure (used to trigger a
+    rebuild), ``stale`` whether it was loaded from a snapshot that may predate the stream, and
+    ``building`` the startup build task while it is still running.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        apply: ApplyChanges,
+        resync: Resync,
+        ready: Optional[Callable[[], bool]] = None,
+        pending: Optional[Callable[[], int]] = None,
+        stale: Optional[Callable[[], bool]] = None,
+        building: Optional[Callable[[], Optional[asyncio.Task]]] = None,
+    ) -> None:
+        self.name = name
+        self.apply = apply
+        self.resync = resync
+        self.ready = ready
+        self.pending = pending
+        self.stale = stale
+        self.building = building
+        self.resyncing = False
+        self.needs_resync = False
+        self.draining = False
+        # Batches not yet applied, oldest first; only ``_drain`` removes entries.
+        self.replay: List[Tuple[List[Dict[str, Any]], List[Any]]] = []
+
+
+class _ChangeSyncState:
+    task: Optional[asyncio.Task] = None
+    targets: Dict[str, SyncTarget] = {}
+    background: Set[asyncio.Task] = set()
+
+
+_state = _ChangeSyncState()
+
+
+def register_sync_target(
+    name: str,
+    apply: ApplyChanges,
+    resync: Resync,
+    ready: Optional[Callable[[], bool]] = None,
+    pending: Optional[Callable[[], int]] = None,
+    stale: Optional[Callable[[], bool]] = None,
+    building: Optional[Callable[[], Optional[asyncio.Task]]] = None,
+) -> None:
+    _state.targets[name] = SyncTarget(name, apply, resync, ready, pending, stale, building)
+
+
+def sync_targets() -> List[str]:
+    return sorted(_state.targets)
+
+
+async def _invalidate_hydrated(upserts: Sequence[Dict[str, Any]], deletes: Sequence[Any]) -> None:
+    invalidate_documents([doc.get("_id") for doc in upserts] + list(deletes))
+
+
+async def _clear_hydrated() -> None:
+    clear_hydration_cache()
+
+
+def _register_builtin_targets() -> None:
+    register_sync_target("hydration", _invalidate_hydrated, _clear_hydrated)
+    if settings.bm25_backend == "local":
+        register_sync_target(
+            "local_bm25",
+            apply_local_bm25_changes,
+            resync_local_bm25,
+            ready=local_bm25_ready,
+            pending=local_bm25_pending_changes,
+            stale=local_bm25_from_snapshot,
+            building=local_bm25_building,
+        )
+    if settings.vector_backend == "local-ivf":
+        register_sync_target(
+            "local_ann",
+            apply_local_ann_changes,
+            resync_local_ann,
+            ready=local_ann_ready,
+            pending=local_ann_pending_changes,
+            stale=local_ann_from_snapshot,
+            building=local_ann_building,
+        )
+    if settings.vector_backend == "exact" or settings.exact_vector_fallback:
+        register_sync_target(
+            "exact_vector",
+            apply_exact_vector_changes,
+            resync_exact_vectors,
+            ready=exact_vector_ready,
+            pending=exact_vector_pending_changes,
+            stale=exact_vector_from_dump,
+            building=exact_vector_building,
+        )
+
+
+def load_resume_token() -> Optional[Dict[str, Any]]:
+    path = settings.change_sync_token_path
+    if not path or not Path(path).exists():
+        return None
+    try:
+        return json_util.loads(Path(path).read_text(encoding="utf-8"))
+    except Exception as exc:
+        logger.warning("Ignoring unreadable resume token %s: %s", path, exc)
+        return None
+
+
+def save_resume_token(token: Optional[Dict[str, Any]]) -> None:
+    path = settings.change_sync_token_path
+    if not path or token is None:
+        return
+    target = Path(path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    # Every worker tails the stream and saves the token; a private temp file keeps their writes apart.
+    with tempfile.NamedTemporaryFile(
+        "w", encoding="utf-8", dir=target.parent, prefix=f"{target.name}.", suffix=".tmp", delete=False
+    ) as fh:
+        fh.write(json_util.dumps(token))
+    try:
+        os.replace(fh.name, target)
+    except OSError:
+        Path(fh.name).unlink(missing_ok=True)
+        raise
+
+
+def clear_resume_token() -> None:
+    path = settings.change_sync_token_path
+    if path and Path(path).exists():
+        Path(path).unlink()
+
+
+def _event_time(change: Dict[str, Any]) -> Optional[float]:
+    wall = change.get("wallTime")
+    if isinstance(wall, datetime):
+        return wall.timestamp()
+    cluster = change.get("clusterTime")
+    return float(cluster.time) if cluster is not None else None
+
+
+def _collect(change: Dict[str, Any], upserts: Dict[str, Dict[str, Any]], deletes: Dict[str, Any]) -> None:
+    op = change.get("operationType")
+    if op in ("invalidate", "drop", "rename", "dropDatabase"):
+        raise ResyncRequired(f"change stream {op}")
+    raw_id = (change.get("documentKey") or {}).get("_id")
+    if raw_id is None:
+        return
+    key = str(raw_id)
+    doc = change.get("fullDocument")
+    if op in ("insert", "replace", "update") and doc is not None:
+        upserts[key] = doc
+        deletes.pop(key, None)
+    elif op in ("insert", "replace", "update", "delete"):
+        # An update whose document is already gone looks up to null: treat it as a delete.
+        deletes[key] = raw_id
+        upserts.pop(key, None)
+
+
+def _track(coro: Awaitable[None]) -> None:
+    task = asyncio.ensure_future(coro)
+    _state.background.add(task)
+    task.add_done_callback(_state.background.discard)
+
+
+def _schedule_resync(target: SyncTarget, reason: str) -> None:
+    if target.resyncing:
+        return
+    target.resyncing = True
+    target.needs_resync = False
+
+    async def _run() -> None:
+        start = time.perf_counter()
+        try:
+            logger.info("Resyncing %s (%s)", target.name, reason)
+            await target.resync()
+            metrics.increment("change_sync_resyncs_total")
+            metrics.observe("change_sync_resync_ms", (time.perf_counter() - start) * 1000)
+        except Exception:
+            logger.exception("Resync of %s failed", target.name)
+            target.needs_resync = True
+        finally:
+            target.resyncing = False
+        # Changes that arrived during the rebuild may postdate what it read; replay them.
+        if not target.needs_resync:
+            await _drain(target)
+
+    _track(_run())
+
+
+async def _after_initial_build(target: SyncTarget, build: asyncio.Task, reason: str) -> None:
+    """Let a startup build finish instead of racing it; rebuild only if it came from a snapshot."""
+    await asyncio.wait([build])
+    if target.stale is None or target.stale() or not (target.ready is None or target.ready()):
+        _schedule_resync(target, reason)
+    else:
+        await _drain(target)
+
+
+def _resync_all(reason: str) -> None:
+    for target in _state.targets.values():
+        build = target.building() if target.building is not None else None
+        if build is not None and not build.done():
+            _track(_after_initial_build(target, build, reason))
+        else:
+            _schedule_resync(target, reason)
+
+
+async def _drain(target: SyncTarget) -> None:
+    """Apply buffered batches strictly oldest first; one drainer at a time per target."""
+    if target.draining:
+        return
+    target.draining = True
+    try:
+        while target.replay and not target.resyncing:
+            upserts, deletes = target.replay[0]
+            await target.apply(upserts, deletes)
+            target.replay.pop(0)
+    except Exception:
+        logger.exception("Applying changes to %s failed", target.name)
+        target.needs_resync = True
+        return
+    finally:
+        target.draining = False
+    threshold = settings.change_sync_rebuild_threshold
+    if target.pending is not None and threshold > 0 and target.pending() >= threshold:
+        _schedule_resync(target, f"{target.pending()} pending changes")
+
+
+async def _apply_to(target: SyncTarget, upserts: List[Dict[str, Any]], deletes: List[Any]) -> None:
+    if len(target.replay) >= _MAX_REPLAY_BATCHES:
+        target.replay.clear()
+        target.needs_resync = True
+    target.replay.append((upserts, deletes))
+    if target.resyncing or (target.ready is not None and not target.ready()):
+        return
+    if target.needs_resync:
+        _schedule_resync(target, "changes dropped while unavailable")
+        return
+    await _drain(target)
+
+
+async def _apply_batch(upserts: Dict[str, Dict[str, Any]], deletes: Dict[str, Any]) -> None:
+    docs = list(upserts.values())
+    ids = list(deletes.values())
+    for target in list(_state.targets.values()):
+        await _apply_to(target, docs, ids)
+    metrics.increment("change_sync_events_total", len(docs) + len(ids))
+
+
+async def _tail() -> None:
+    token = load_resume_token()
+    options: Dict[str, Any] = {
+        "full_document": "updateLookup",
+        "max_await_time_ms": settings.change_sync_max_await_ms,
+        "batch_size": settings.change_sync_batch_size,
+    }
+    if token is not None:
+        options["resume_after"] = token
+    async with get_collection().watch(**options) as stream:
+        if token is None:
+            _resync_all("no resume token")
+            save_resume_token(stream.resume_token)
+        else:
+            for target in _state.targets.values():
+                if target.stale is not None and target.stale():
+                    _schedule_resync(target, "loaded from a snapshot older than the stream")
+        logger.info("Change stream sync tailing %s (%d targets)", settings.collection_name, len(_state.targets))
+
+        upserts: Dict[str, Dict[str, Any]] = {}
+        deletes: Dict[str, Any] = {}
+        saved = stream.resume_token
+        while stream.alive:
+            change = await stream.try_next()
+            if change is not None:
+                _collect(change, upserts, deletes)
+                event_time = _event_time(change)
+                if event_time is not None:
+                    metrics.set_gauge("change_sync_lag_seconds", max(0.0, time.time() - event_time))
+                if len(upserts) + len(deletes) < settings.change_sync_batch_size:
+                    continue
+            elif not (upserts or deletes):
+                metrics.set_gauge("change_sync_lag_seconds", 0.0)
+            if upserts or deletes:
+                await _apply_batch(upserts, deletes)
+                upserts, deletes = {}, {}
+            if stream.resume_token != saved:
+                saved = stream.resume_token
+                save_resume_token(saved)
+
+
+async def _run() -> None:
+    backoff = 1.0
+    while True:
+        try:
+            await _tail()
+            backoff = 1.0
+        except asyncio.CancelledError:
+            raise
+        except ResyncRequired as exc:
+            logger.warning("%s; starting a full resync", exc)
+            clear_resume_token()
+        except OperationFailure as exc:
+            if exc.code in _TOKEN_LOST_CODES:
+                logger.warning("Resume token expired (%s); starting a full resync", exc)
+                clear_resume_token()
+                continue
+            logger.error("Change stream failed: %s", exc)
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 60.0)
+        except PyMongoError as exc:
+            logger.error("Change stream interrupted: %s", exc)
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 60.0)
+        except Exception:
+            # Anything else (e.g. the token file) must not end the task and leave indexes silently stale.
+            logger.exception("Change stream sync failed; retrying")
+            metrics.increment("change_sync_errors_total")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 60.0)
+
+
+async def start_change_sync(app: FastAPI) -> None:
+    """Start tailing the change stream (requires a replica set or Atlas cluster)."""
+    if not settings.change_sync_enabled or _state.task is not None:
+        return
+    _register_builtin_targets()
+    _state.task = asyncio.create_task(_run())
+    app.state.change_sync_task = _state.task
+
+
+async def stop_change_sync(app: FastAPI) -> None:
+    for task in [_state.task, *_state.background]:
+        if task is not None and not task.done():
+            task.cancel()
+    _state.task = None
+    _state.background.clear()
+    app.state.change_sync_task = None
+
+
+__all__ = [
+    "SyncTarget",
+    "ResyncRequired",
+    "register_sync_target",
+    "sync_targets",
+    "load_resume_token",
+    "save_resume_token",
+    "clear_resume_token",
+    "start_change_sync",
+    "stop_change_sync",
+]
@@ -1,9 +1,14 @@
 from pathlib import Path
 from typing import List
 
-from pydantic import AnyUrl, Field
+from pydantic import AnyUrl, Field, field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+from .fusion import FUSION_STRATEGIES
+
+
+HYBRID_EXECUTION_MODES = ("two_query", "union", "rank_fusion")
+
 
 class Settings(BaseSettings):
     """Application configuration loaded from environment variables or .env."""
@@ -23,13 +28,86 @@ class Settings(BaseSettings):
     # Search tuning
     search_fields: List[str] = Field(default_factory=lambda: ["text", "summary", "content"], env="SEARCH_FIELDS")
     default_limit: int = Field(10, env="DEFAULT_LIMIT")
+    # $search count mode feeding total_count: "lowerBound" (cheap, capped), "total" (exact) or "none"
+    bm25_count_type: str = Field("lowerBound", env="BM25_COUNT_TYPE")
     max_limit: int = Field(100, env="MAX_LIMIT")
+    # Heavy fields removed inside the aggregation so they are never shipped from Mongo
+    result_exclude_fields: List[str] = Field(default_factory=lambda: ["embedding"], env="RESULT_EXCLUDE_FIELDS")
+    # "full" ships documents from the aggregation; "ids" returns _id + score and hydrates from a cache;
+    # "stored" uses Atlas Search returnStoredSource with the fields stored in the search index
+    result_source: str = Field("full", env="RESULT_SOURCE")
+    stored_source_fields: List[str] = Field(
+        default_factory=lambda: ["content", "text", "summary", "title", "acceptanceCriteria"],
+        env="STORED_SOURCE_FIELDS",
+    )
+    hydration_cache_max_entries: int = Field(20_000, env="HYDRATION_CACHE_MAX_ENTRIES")
+    hydration_cache_ttl_seconds: float = Field(600.0, env="HYDRATION_CACHE_TTL_SECONDS")
+
+    # BM25 retrieval backend: "atlas" ($search) or "local" (in-process index, Atlas until it is built)
+    bm25_backend: str = Field("atlas", env="BM25_BACKEND")
+    local_bm25_snapshot_path: str = Field("", env="LOCAL_BM25_SNAPSHOT_PATH")
+    local_bm25_k1: float = Field(1.2, env="LOCAL_BM25_K1")
+    local_bm25_b: float = Field(0.75, env="LOCAL_BM25_B")
+
+    # Vector retrieval backend: "atlas" ($vectorSearch), "local-ivf" (in-process IVF-flat) or
+    # "exact" (memory-mapped brute force); local backends use Atlas until they are ready
+    vector_backend: str = Field("atlas", env="VECTOR_BACKEND")
+    local_ann_path: str = Field("", env="LOCAL_ANN_PATH")
+    local_ann_lists: int = Field(0, env="LOCAL_ANN_LISTS")  # 0 = sqrt(number of vectors)
+    local_ann_nprobe: int = Field(8, env="LOCAL_ANN_NPROBE")
+    # Dump base path: manifest at <path>.json, versioned matrix + ids under <path>.d/
+    exact_vector_path: str = Field(
+        str(Path(__file__).resolve().parent.parent / ".cache" / "vectors"), env="EXACT_VECTOR_PATH"
+    )
+    exact_vector_dtype: str = Field("float32", env="EXACT_VECTOR_DTYPE")  # float32 | float16
+    # Rows scored per step; float16 dumps are upcast one block at a time, so this bounds per-query memory
+    exact_vector_block_rows: int = Field(8192, env="EXACT_VECTOR_BLOCK_ROWS")
+    exact_vector_fallback: bool = Field(False, env="EXACT_VECTOR_FALLBACK")  # serve exact results if Atlas fails
+
+    # $vectorSearch numCandidates = clamp(k * multiplier); with adaptive tuning the multiplier is
+    # chosen per k-bucket from recall measured against exact search on sampled recent queries
+    vector_candidate_multiplier: int = Field(10, env="VECTOR_CANDIDATE_MULTIPLIER")
+    vector_min_candidates: int = Field(100, env="VECTOR_MIN_CANDIDATES")
+    adaptive_candidates_enabled: bool = Field(True, env="ADAPTIVE_CANDIDATES_ENABLED")
+    vector_k_buckets: List[int] = Field(default_factory=lambda: [10, 25, 50, 100], env="VECTOR_K_BUCKETS")
+    vector_recall_target: float = Field(0.95, env="VECTOR_RECALL_TARGET")
+    vector_recall_sample_size: int = Field(200, env="VECTOR_RECALL_SAMPLE_SIZE")
+    vector_recall_queries_per_run: int = Field(20, env="VECTOR_RECALL_QUERIES_PER_RUN")
+    vector_recall_interval_seconds: float = Field(900, env="VECTOR_RECALL_INTERVAL_SECONDS")
+
+    # Change-stream sync of local indexes and caches (needs a replica set / Atlas)
+    change_sync_enabled: bool = Field(False, env="CHANGE_SYNC_ENABLED")
+    change_sync_token_path: str = Field(
+        str(Path(__file__).resolve().parent.parent / ".cache" / "change_stream_token.json"), env="CHANGE_SYNC_TOKEN_PATH"
+    )
+    change_sync_batch_size: int = Field(500, env="CHANGE_SYNC_BATCH_SIZE")
+    change_sync_max_await_ms: int = Field(1000, env="CHANGE_SYNC_MAX_AWAIT_MS")
+    change_sync_rebuild_threshold: int = Field(5000, env="CHANGE_SYNC_REBUILD_THRESHOLD")  # 0 = never rebuild
+
+    # Per-request deadline (overridable per request via X-Request-Timeout-Ms or body timeout_ms)
+    request_timeout_ms: int = Field(15000, env="REQUEST_TIMEOUT_MS")
+    max_request_timeout_ms: int = Field(60000, env="MAX_REQUEST_TIMEOUT_MS")
+    rerank_min_budget_ms: int = Field(300, env="RERANK_MIN_BUDGET_MS")  # skip the LLM call below this
 
     # Mongo connection pool tuning
     mongo_max_pool_size: int = Field(50, env="MONGO_MAX_POOL_SIZE")
     mongo_server_selection_timeout_ms: int = Field(5000, env="MONGO_SERVER_SELECTION_TIMEOUT_MS")
     langchain_timeout_seconds: float = Field(2.0, env="LANGCHAIN_TIMEOUT_SECONDS")
 
+    # Hybrid retrieval execution: "two_query" (separate $search and $vectorSearch), "union"
+    # ($vectorSearch + $unionWith $search in one aggregation) or "rank_fusion" ($rankFusion, MongoDB 8.1+)
+    hybrid_execution: str = Field("two_query", env="HYBRID_EXECUTION")
+    # Pipelined hybrid search: how long vector hits wait for the BM25 ids before reranking
+    hybrid_overlap_wait_ms: float = Field(150.0, env="HYBRID_OVERLAP_WAIT_MS")
+
+    # Share one hybrid pipeline run between identical concurrent requests
+    hybrid_singleflight_enabled: bool = Field(True, env="HYBRID_SINGLEFLIGHT_ENABLED")
+
+    # /hybrid_search/batch: item cap, searches in flight at once, and texts per up-front embedding call
+    batch_max_items: int = Field(500, env="BATCH_MAX_ITEMS")
+    batch_concurrency: int = Field(8, env="BATCH_CONCURRENCY")
+    batch_embedding_max_inputs: int = Field(256, env="BATCH_EMBEDDING_MAX_INPUTS")
+
     # Vector search / embedding settings
     vector_index_name: str = Field(None, env="VECTOR_INDEX_NAME")
     embedding_api_base: str = Field(None, env="EMBEDDING_API_BASE")
@@ -37,10 +115,68 @@ class Settings(BaseSettings):
     embedding_user_email: str = Field(None, env="EMBEDDING_USER_EMAIL")
     embedding_auth_token: str = Field(None, env="EMBEDDING_AUTH_TOKEN")
 
+    # Embedding HTTP client pool
+    embedding_pool_size: int = Field(20, env="EMBEDDING_POOL_SIZE")
+    embedding_timeout_seconds: float = Field(30.0, env="EMBEDDING_TIMEOUT_SECONDS")
+    embedding_connect_timeout_seconds: float = Field(5.0, env="EMBEDDING_CONNECT_TIMEOUT_SECONDS")
+    embedding_keepalive_seconds: float = Field(60.0, env="EMBEDDING_KEEPALIVE_SECONDS")
+    embedding_max_retries: int = Field(2, env="EMBEDDING_MAX_RETRIES")
+    embedding_retry_backoff_seconds: float = Field(0.5, env="EMBEDDING_RETRY_BACKOFF_SECONDS")
+
+    # Embedding micro-batching
+    embedding_batching_enabled: bool = Field(True, env="EMBEDDING_BATCHING_ENABLED")
+    embedding_batch_window_ms: float = Field(3.0, env="EMBEDDING_BATCH_WINDOW_MS")
+    embedding_batch_max_size: int = Field(32, env="EMBEDDING_BATCH_MAX_SIZE")
+
+    # Persistent embedding cache shared by all workers on the host (empty path disables it)
+    embedding_cache_path: str = Field(
+        str(Path(__file__).resolve().parent.parent / ".cache" / "embeddings.sqlite3"), env="EMBEDDING_CACHE_PATH"
+    )
+    embedding_cache_max_entries: int = Field(200_000, env="EMBEDDING_CACHE_MAX_ENTRIES")
+    embedding_cache_ttl_seconds: float = Field(30 * 24 * 3600, env="EMBEDDING_CACHE_TTL_SECONDS")
+
     # Groq re-ranking
     groq_api_base: str = Field("https://api.groq.com/openai/v1", env="GROQ_API_BASE")
     groq_api_key: str = Field(None, env="GROQ_API_KEY")
     groq_model: str = Field(None, env="GROQ_MODEL")
+    groq_pool_size: int = Field(20, env="GROQ_POOL_SIZE")
+    groq_timeout_seconds: float = Field(20.0, env="GROQ_TIMEOUT_SECONDS")
+    groq_connect_timeout_seconds: float = Field(5.0, env="GROQ_CONNECT_TIMEOUT_SECONDS")
+    groq_keepalive_seconds: float = Field(60.0, env="GROQ_KEEPALIVE_SECONDS")
+    # Reranker used by hybrid search: "groq", "local" (NumPy features, no network), "distilled" or "none"
+    reranker: str = Field("groq", env="RERANKER")
+    # Opt-in JSONL log of Groq scores for distillation, and the trained model used by RERANKER=distilled
+    rerank_capture_path: str = Field("", env="RERANK_CAPTURE_PATH")
+    distilled_model_path: str = Field("", env="DISTILLED_MODEL_PATH")
+    # "per_group" reranks bm25 and vector candidates separately; "joint" scores their union in one call
+    rerank_mode: str = Field("per_group", env="RERANK_MODE")
+    # Score fusion for hybrid results: "none" (per-source quotas), "rrf", "minmax", "zscore" or "weighted"
+    fusion_strategy: str = Field("none", env="FUSION_STRATEGY")
+    fusion_rrf_k: int = Field(60, env="FUSION_RRF_K")
+    # /related/{doc_id}: terms of the seed document searched lexically, and how the two sides are fused
+    related_key_terms: int = Field(12, env="RELATED_KEY_TERMS")
+    related_fusion: str = Field("rrf", env="RELATED_FUSION")
+    rerank_cache_max_entries: int = Field(50_000, env="RERANK_CACHE_MAX_ENTRIES")
+    rerank_cache_ttl_seconds: float = Field(3600.0, env="RERANK_CACHE_TTL_SECONDS")
+    # Batch requests pool Groq scoring for different queries into one prompt of up to this many candidates
+    rerank_batch_window_ms: float = Field(10.0, env="RERANK_BATCH_WINDOW_MS")
+    rerank_batch_max_candidates: int = Field(60, env="RERANK_BATCH_MAX_CANDIDATES")
+
+    @field_validator("hybrid_execution")
+    @classmethod
+    def _check_hybrid_execution(cls, value: str) -> str:
+        # A typo would otherwise fall through to the $unionWith pipeline.
+        if value not in HYBRID_EXECUTION_MODES:
+            raise ValueError(f"HYBRID_EXECUTION must be one of {', '.join(HYBRID_EXECUTION_MODES)}")
+        return value
+
+    @field_validator("related_fusion")
+    @classmethod
+    def _check_related_fusion(cls, value: str) -> str:
+        # /related always fuses its two sides, so "none" is not an option here.
+        if value not in FUSION_STRATEGIES[1:]:
+            raise ValueError(f"RELATED_FUSION must be one of {', '.join(FUSION_STRATEGIES[1:])}")
+        return value
 
 
 settings = Settings()
@@ -0,0 +1,134 @@
+"""Capture Groq relevance labels and serve a distilled linear model as a local reranker."""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from . import metrics
+from .background_writer import BackgroundWriter
+from .config import settings
+from .dedup import identifier_for_doc
+from .local_rerank import DEFAULT_WEIGHTS, FEATURE_NAMES, apply_scores, candidate_features
+
+
+logger = logging.getLogger("uvicorn.error")
+
+
+class _LoadedModel:
+    path: Optional[str] = None
+    mtime: Optional[float] = None
+    weights: np.ndarray = DEFAULT_WEIGHTS
+    bias: float = 0.0
+
+
+_model = _LoadedModel()
+
+# Scored batches waiting for the capture writer; beyond this, new batches are dropped.
+_CAPTURE_QUEUE_MAX = 1000
+
+_Capture = Tuple[str, List[Dict[str, Any]], Dict[int, float], str, float]
+
+
+def capture_enabled() -> bool:
+    return bool(settings.rerank_capture_path)
+
+
+def capture_scores(
+    query: str,
+    candidates: Sequence[Dict[str, Any]],
+    scores: Mapping[int, float],
+    group: str,
+) -> None:
+    """Queue one ``(query, features, groq_score)`` record per scored candidate for the capture log.
+
+    A background thread computes the features and appends the records, so the Groq call path
+    never touches the file. Features are computed over the whole candidate set, exactly as the
+    distilled reranker will see them at serving time.
+    """
+    if not capture_enabled() or not scores:
+        return
+    _capture_writer.put((query, list(candidates), dict(scores), group, time.time()))
+
+
+def _write_captures(batch: List[_Capture]) -> None:
+    try:
+        path = Path(settings.rerank_capture_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        lines: List[str] = []
+        for query, candidates, scores, group, now in batch:
+            features = candidate_features(query, candidates)
+            for idx, score in scores.items():
+                record = {
+                    "ts": now,
+                    "model": settings.groq_model,
+                    "group": group,
+                    "query": query,
+                    "doc_id": identifier_for_doc(candidates[idx]),
+                    "features": [round(float(v), 6) for v in features[idx]],
+                    "groq_score": float(score),
+                }
+                lines.append(json.dumps(record) + "\n")
+        with path.open("a", encoding="utf-8") as fh:
+            fh.writelines(lines)
+        metrics.increment("rerank_captured_samples", len(lines))
+    except Exception as exc:  # capture must never break reranking
+        logger.warning("Rerank capture failed: %s", exc)
+
+
+_capture_writer: BackgroundWriter[_Capture] = BackgroundWriter(
+    "rerank-capture-writer", _write_captures, max_pending=_CAPTURE_QUEUE_MAX, dropped_metric="rerank_capture_dropped"
+)
+
+
+def close_capture() -> None:
+    """Flush queued capture records and stop the writer thread."""
+    _capture_writer.close()
+
+
+def load_model(path: str) -> Tuple[np.ndarray, float]:
+    with open(path, "r", encoding="utf-8") as fh:
+        model = json.load(fh)
+    names = tuple(model.get("feature_names") or ())
+    if names != FEATURE_NAMES:
+        raise ValueError(f"model features {names} do not match {FEATURE_NAMES}")
+    return np.asarray(model["weights"], dtype=np.float32), float(model.get("bias", 0.0))
+
+
+def _current_model() -> Tuple[np.ndarray, float]:
+    """Return the configured model, reloading when the file changes on disk."""
+    path = settings.distilled_model_path
+    if not path:
+        return DEFAULT_WEIGHTS, 0.0
+    try:
+        mtime = os.path.getmtime(path)
+        if path != _model.path or mtime != _model.mtime:
+            _model.weights, _model.bias = load_model(path)
+            _model.path, _model.mtime = path, mtime
+            logger.info("Loaded distilled reranker from %s", path)
+    except (OSError, ValueError, KeyError) as exc:
+        logger.warning("Distilled reranker unavailable (%s), using default local weights", exc)
+        return DEFAULT_WEIGHTS, 0.0
+    return _model.weights, _model.bias
+
+
+async def distilled_rerank(query: str, docs: List[Dict[str, Any]], top_k: int, group: str) -> List[Dict[str, Any]]:
+    if top_k <= 0 or not docs:
+        return []
+    weights, bias = _current_model()
+    scores = candidate_features(query, docs) @ weights + bias
+    return apply_scores(docs, scores, top_k, "distilled")
+
+
+__all__ = [
+    "capture_enabled",
+    "capture_scores",
+    "close_capture",
+    "load_model",
+    "distilled_rerank",
+]
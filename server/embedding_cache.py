@@ -0,0 +1,241 @@
+"""Persistent, host-wide embedding cache backed by SQLite with packed float32 vectors.
+
+The functions here block on SQLite, so async callers run lookups through ``asyncio.to_thread``.
+Writes are write-behind: ``put_cached_embedding`` only queues the row, and a per-process writer
+thread inserts queued rows in batches and runs the size/TTL sweep off the request path.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from . import metrics
+from .background_writer import BackgroundWriter
+from .config import settings
+
+
+logger = logging.getLogger("uvicorn.error")
+
+# Refresh last_used at most this often per entry so hot keys do not turn every read into a write.
+_TOUCH_INTERVAL_SECONDS = 60.0
+# Run the size/TTL sweep once per this many inserts.
+_EVICT_EVERY_PUTS = 64
+# Rows waiting for the writer thread; beyond this, new writes are dropped rather than buffered.
+_WRITE_QUEUE_MAX = 10_000
+# Rows inserted per writer transaction.
+_WRITE_BATCH = 256
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    model TEXT NOT NULL,
+    text_hash TEXT NOT NULL,
+    dims INTEGER NOT NULL,
+    vector BLOB NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (model, text_hash)
+);
+CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used);
+"""
+
+
+_Row = Tuple[str, str, List[float], float]
+
+
+class _CacheState:
+    conn: Optional[sqlite3.Connection] = None
+    pid: Optional[int] = None
+    puts: int = 0
+
+
+_state = _CacheState()
+_lock = threading.Lock()
+
+
+def cache_enabled() -> bool:
+    return bool(settings.embedding_cache_path)
+
+
+def _connection() -> sqlite3.Connection:
+    # One connection per worker process; WAL lets every uvicorn worker read while one writes.
+    if _state.conn is not None and _state.pid == os.getpid():
+        return _state.conn
+    path = Path(settings.embedding_cache_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(path), timeout=0.05, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(_SCHEMA)
+    _state.conn = conn
+    _state.pid = os.getpid()
+    return conn
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def pack_vector(vector: List[float]) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def unpack_vector(blob: bytes) -> List[float]:
+    values = array("f")
+    values.frombytes(blob)
+    return values.tolist()
+
+
+def get_cached_embedding(model: str, text: str) -> Optional[List[float]]:
+    """Return the cached vector for ``(model, normalized text)`` or ``None`` on miss/expiry."""
+    if not cache_enabled():
+        return None
+    key = _text_hash(text)
+    now = time.time()
+    try:
+        with _lock:
+            conn = _connection()
+            row = conn.execute(
+                "SELECT vector, created_at, last_used FROM embeddings WHERE model = ? AND text_hash = ?",
+                (model, key),
+            ).fetchone()
+            if row is None:
+                metrics.increment("embedding_cache_misses")
+                return None
+            blob, created_at, last_used = row
+            ttl = settings.embedding_cache_ttl_seconds
+            if ttl > 0 and now - created_at > ttl:
+                conn.execute("DELETE FROM embeddings WHERE model = ? AND text_hash = ?", (model, key))
+                metrics.increment("embedding_cache_misses")
+                metrics.increment("embedding_cache_expired")
+                return None
+            if now - last_used > _TOUCH_INTERVAL_SECONDS:
+                # Best effort: a writer holding the lock must not cost us a vector we already have.
+                try:
+                    conn.execute(
+                        "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                        (now, model, key),
+                    )
+                except sqlite3.Error as exc:
+                    logger.debug("Embedding cache touch skipped: %s", exc)
+                    metrics.increment("embedding_cache_touch_skipped")
+    except sqlite3.Error as exc:
+        logger.warning("Embedding cache read failed: %s", exc)
+        metrics.increment("embedding_cache_errors")
+        return None
+    metrics.increment("embedding_cache_hits")
+    return unpack_vector(blob)
+
+
+def get_cached_embeddings(model: str, texts: Sequence[str]) -> Dict[str, List[float]]:
+    """Look up several normalized texts in one call (one thread hop for async callers)."""
+    found: Dict[str, List[float]] = {}
+    for text in texts:
+        embedding = get_cached_embedding(model, text)
+        if embedding is not None:
+            found[text] = embedding
+    return found
+
+
+def put_cached_embedding(model: str, text: str, vector: List[float]) -> None:
+    """Queue ``vector`` for the background writer; never blocks on SQLite."""
+    if not cache_enabled():
+        return
+    _writer.put((model, text, list(vector), time.time()))
+
+
+def _write_rows(rows: List[_Row]) -> None:
+    try:
+        with _lock:
+            conn = _connection()
+            conn.execute("BEGIN")
+            try:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (model, text_hash, dims, vector, created_at, last_used) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (model, _text_hash(text), len(vector), pack_vector(vector), now, now)
+                        for model, text, vector, now in rows
+                    ],
+                )
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                conn.execute("ROLLBACK")
+                raise
+            before = _state.puts
+            _state.puts += len(rows)
+            if _state.puts // _EVICT_EVERY_PUTS != before // _EVICT_EVERY_PUTS:
+                _evict(conn, time.time())
+    except sqlite3.Error as exc:
+        logger.warning("Embedding cache write failed: %s", exc)
+        metrics.increment("embedding_cache_errors")
+
+
+_writer: BackgroundWriter[_Row] = BackgroundWriter(
+    "embedding-cache-writer",
+    _write_rows,
+    max_pending=_WRITE_QUEUE_MAX,
+    dropped_metric="embedding_cache_dropped_writes",
+    max_batch=_WRITE_BATCH,
+)
+
+
+def sample_cached_embeddings(model: str, dims: int, limit: int) -> List[List[float]]:
+    """Up to ``limit`` random cached query vectors of ``dims`` dimensions (for offline evaluation)."""
+    if not cache_enabled() or limit <= 0:
+        return []
+    try:
+        with _lock:
+            rows = _connection().execute(
+                "SELECT vector FROM embeddings WHERE model = ? AND dims = ? ORDER BY RANDOM() LIMIT ?",
+                (model, dims, limit),
+            ).fetchall()
+    except sqlite3.Error as exc:
+        logger.warning("Embedding cache sample failed: %s", exc)
+        return []
+    return [unpack_vector(blob) for (blob,) in rows]
+
+
+def _evict(conn: sqlite3.Connection, now: float) -> None:
+    """Drop expired rows, then least-recently-used rows beyond the configured size bound."""
+    ttl = settings.embedding_cache_ttl_seconds
+    if ttl > 0:
+        conn.execute("DELETE FROM embeddings WHERE created_at < ?", (now - ttl,))
+    max_entries = settings.embedding_cache_max_entries
+    (count,) = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+    excess = count - max_entries
+    if max_entries > 0 and excess > 0:
+        conn.execute(
+            "DELETE FROM embeddings WHERE rowid IN "
+            "(SELECT rowid FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+            (excess,),
+        )
+        metrics.increment("embedding_cache_evictions", excess)
+
+
+def close_embedding_cache() -> None:
+    """Flush queued writes, stop the writer thread and close this process's connection."""
+    _writer.close()
+    with _lock:
+        if _state.conn is not None:
+            _state.conn.close()
+        _state.conn = None
+        _state.pid = None
+
+
+__all__ = [
+    "cache_enabled",
+    "get_cached_embedding",
+    "get_cached_embeddings",
+    "put_cached_embedding",
+    "sample_cached_embeddings",
+    "close_embedding_cache",
+    "pack_vector",
+    "unpack_vector",
+]
@@ -0,0 +1,408 @@
+"""Exact brute-force vector search over a memory-mapped embedding matrix.
+
+The matrix is a ``.npy`` file of unit-normalized rows (float32 or float16) with the
+document ids alongside in an ``ids.npz``. Each dump is written to its own version directory
+under ``<path>.d/`` and published by atomically replacing the manifest ``<path>.json``, so
+readers always pair ids with the matrix they were dumped with. Workers open the matrix with
+``mmap_mode="r"`` so they share the same pages through the OS page cache; a lock file
+elects one worker to dump while the others wait for its manifest and reopen that dump.
+
+Dump the matrix from the repository root::
+
+    python -m server.exact_vector dump [--dtype float16]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from fastapi import FastAPI
+
+from . import metrics
+from .config import settings
+from .hydration import hydrate
+from .local_ann import (
+    VectorDelta,
+    cosine_to_score,
+    embedding_changes,
+    merge_hits,
+    normalize_rows,
+    read_embeddings,
+)
+from .local_bm25 import pack_ids, unpack_ids
+from .normalize import normalize_query_text
+from .vector_search import get_embedding
+
+
+logger = logging.getLogger("uvicorn.error")
+
+VECTOR_DTYPES = ("float32", "float16")
+
+
+# Versions kept on disk besides the published one, for readers still mapping an older dump.
+_KEEP_VERSIONS = 2
+# A dump lock older than this is assumed to belong to a crashed worker.
+_LOCK_STALE_SECONDS = 1800.0
+
+
+def _manifest_path(path: str) -> str:
+    return f"{path}.json"
+
+
+def _versions_dir(path: str) -> Path:
+    return Path(f"{path}.d")
+
+
+def _lock_path(path: str) -> str:
+    return f"{path}.lock"
+
+
+def read_manifest(path: str) -> Optional[Dict[str, Any]]:
+    """The published dump's manifest (absolute ``vectors``/``ids`` paths), or ``None`` if there is none."""
+    try:
+        manifest = json.loads(Path(_manifest_path(path)).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    version_dir = _versions_dir(path) / manifest["version"]
+    return {**manifest, "vectors": str(version_dir / "vectors.npy"), "ids": str(version_dir / "ids.npz")}
+
+
+def _prune_versions(path: str, current: str) -> None:
+    # Staging directories and versions renamed in the last minute may belong to a writer
+    # that has not published its manifest yet.
+    cutoff = time.time() - 60.0
+    versions = sorted(
+        p for p in _versions_dir(path).iterdir()
+        if p.is_dir() and not p.name.startswith(".") and p.name != current and p.stat().st_mtime < cutoff
+    )
+    for old in versions[: max(0, len(versions) - _KEEP_VERSIONS)]:
+        # Windows refuses to delete files another worker still maps; the next dump retries.
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def dump_vectors(
+    path: str, raw_ids: Sequence[Any], matrix: np.ndarray, dtype: str = "float32", read_at: Optional[float] = None
+) -> None:
+    """Write normalized rows and ids as a new version and publish both with one manifest swap.
+
+    ``read_at`` is when the rows were read from the collection; other workers use it to decide
+    whether the dump already covers the changes they have seen.
+    """
+    if dtype not in VECTOR_DTYPES:
+        raise ValueError(f"dtype must be one of {', '.join(VECTOR_DTYPES)}")
+    versions = _versions_dir(path)
+    versions.mkdir(parents=True, exist_ok=True)
+    rows = normalize_rows(np.asarray(matrix, dtype=np.float32)) if len(matrix) else matrix
+
+    staging = Path(tempfile.mkdtemp(dir=versions, prefix=".staging-"))
+    try:
+        out = np.lib.format.open_memmap(str(staging / "vectors.npy"), mode="w+", dtype=dtype, shape=rows.shape)
+        out[:] = rows
+        out.flush()
+        del out
+        with open(staging / "ids.npz", "wb") as fh:
+            np.savez(fh, ids=pack_ids(raw_ids))
+        version = f"{time.time_ns()}-{os.getpid()}"
+        os.rename(staging, versions / version)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    manifest = {"version": version, "rows": int(rows.shape[0]), "dtype": dtype, "read_at": read_at or time.time()}
+    with tempfile.NamedTemporaryFile(
+        "w", encoding="utf-8", dir=versions, prefix=".manifest-", suffix=".tmp", delete=False
+    ) as fh:
+        json.dump(manifest, fh)
+    os.replace(fh.name, _manifest_path(path))
+    _prune_versions(path, version)
+
+
+def _lock_held(path: str) -> bool:
+    """True while a live worker holds the dump lock (a lock older than the stale limit does not count)."""
+    try:
+        return time.time() - os.path.getmtime(_lock_path(path)) < _LOCK_STALE_SECONDS
+    except OSError:
+        return False
+
+
+def _try_lock(path: str) -> bool:
+    """Create the dump lock file exclusively; a stale lock from a crashed worker is taken over."""
+    lock = _lock_path(path)
+    Path(lock).parent.mkdir(parents=True, exist_ok=True)
+    try:
+        fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        if _lock_held(path):
+            return False
+        try:
+            os.unlink(lock)
+        except OSError:
+            return False
+        return _try_lock(path)
+    with os.fdopen(fd, "w") as fh:
+        fh.write(str(os.getpid()))
+    return True
+
+
+def _unlock(path: str) -> None:
+    try:
+        os.unlink(_lock_path(path))
+    except OSError:
+        pass
+
+
+class ExactVectorIndex:
+    """Read-only view over a dumped matrix; scores every row for each query."""
+
+    def __init__(self, path: str, block_rows: int = 8192) -> None:
+        manifest = read_manifest(path)
+        if manifest is None:
+            raise FileNotFoundError(f"no published vector dump at {_manifest_path(path)}")
+        self.path = path
+        self.version = manifest["version"]
+        self.block_rows = max(1, block_rows)
+        self.vectors = np.load(manifest["vectors"], mmap_mode="r")
+        self.raw_ids = unpack_ids(np.load(manifest["ids"])["ids"])
+        if len(self.raw_ids) != len(self.vectors):
+            raise ValueError(f"{path}: {len(self.vectors)} vectors but {len(self.raw_ids)} ids")
+        self.changes = VectorDelta(self.raw_ids)
+
+    def __len__(self) -> int:
+        return len(self.raw_ids)
+
+    def search(self, query: Sequence[float], k: int) -> List[Tuple[Any, float]]:
+        if k <= 0:
+            return []
+        q = normalize_rows(np.asarray(query, dtype=np.float32)[None, :])[0]
+        overlay = self.changes.search(q, k)
+        n = len(self.raw_ids)
+        if n == 0:
+            return overlay
+        alive = self.changes.alive
+        masked = not alive.all()
+        cand_rows: List[np.ndarray] = []
+        cand_sims: List[np.ndarray] = []
+        for start in range(0, n, self.block_rows):
+            # No copy for float32 dumps; float16 blocks are upcast (block_rows x dims x 4 bytes per query).
+            block = np.asarray(self.vectors[start:start + self.block_rows], dtype=np.float32)
+            sims = block @ q
+            if masked:
+                sims[~alive[start:start + len(sims)]] = -np.inf
+            take = min(k, len(sims))
+            top = np.argpartition(-sims, take - 1)[:take]
+            cand_rows.append(top + start)
+            cand_sims.append(sims[top])
+        rows = np.concatenate(cand_rows)
+        sims = np.concatenate(cand_sims)
+        take = min(k, len(sims))
+        top = np.argpartition(-sims, take - 1)[:take]
+        top = top[np.argsort(-sims[top], kind="stable")]
+        top = top[np.isfinite(sims[top])]
+        scores = cosine_to_score(sims[top])
+        hits = [(self.raw_ids[rows[i]], float(s)) for i, s in zip(top, scores)]
+        return merge_hits(hits, overlay, k) if overlay else hits
+
+
+class _ExactVectorState:
+    index: Optional[ExactVectorIndex] = None
+    task: Optional[asyncio.Task] = None
+    from_dump = False
+
+
+_state = _ExactVectorState()
+
+
+def exact_vector_ready() -> bool:
+    return _state.index is not None
+
+
+def get_exact_vector_index() -> Optional[ExactVectorIndex]:
+    return _state.index
+
+
+def _covers(path: str, since: float) -> bool:
+    """True when the published dump read the collection at or after ``since``."""
+    manifest = read_manifest(path)
+    return manifest is not None and float(manifest.get("read_at") or 0.0) >= since
+
+
+async def _dump_or_wait(path: str, since: float) -> None:
+    """Make sure a dump that read the collection at or after ``since`` is published.
+
+    Only the worker holding the lock file dumps. The others wait for it to release the lock and
+    reopen its manifest, and dump themselves only if that dump still predates ``since``.
+    """
+    while not _covers(path, since):
+        if not _try_lock(path):
+            while _lock_held(path):
+                await asyncio.sleep(1.0)
+            continue
+        try:
+            # Another worker may have published between our check and taking the lock.
+            if _covers(path, since):
+                return
+            read_at = time.time()
+            raw_ids, matrix = await read_embeddings()
+            await asyncio.to_thread(dump_vectors, path, raw_ids, matrix, settings.exact_vector_dtype, read_at)
+            logger.info("Dumped %d vectors to %s (%s)", len(raw_ids), path, settings.exact_vector_dtype)
+        finally:
+            _unlock(path)
+
+
+async def build_exact_vectors(use_dump: bool = True) -> ExactVectorIndex:
+    """Open the published dump if present, otherwise dump the collection's embeddings first.
+
+    With ``use_dump=False`` (a resync) the matrix must reflect the collection as of this call; a
+    dump another worker read after that point already does, so it is reopened instead of redone.
+    """
+    start = time.perf_counter()
+    path = settings.exact_vector_path
+    from_dump = bool(use_dump and read_manifest(path) is not None)
+    if not from_dump:
+        # A resync needs a dump read after this point; on first start any published dump will do.
+        await _dump_or_wait(path, time.time() if not use_dump else 0.0)
+    try:
+        index = await asyncio.to_thread(ExactVectorIndex, path, settings.exact_vector_block_rows)
+    except (ValueError, KeyError) as exc:
+        # Dumps written before ids were BSON-packed need pickle to open; replace them instead.
+        logger.warning("Exact vector dump %s unreadable (%s); dumping the collection again", path, exc)
+        from_dump = False
+        await _dump_or_wait(path, time.time())
+        index = await asyncio.to_thread(ExactVectorIndex, path, settings.exact_vector_block_rows)
+    _state.index = index
+    _state.from_dump = from_dump
+    metrics.set_gauge("exact_vector_rows", len(index))
+    metrics.observe("exact_vector_open_ms", (time.perf_counter() - start) * 1000)
+    logger.info("Opened exact vector matrix %s (%d vectors)", path, len(index))
+    return index
+
+
+async def search_exact_vector(
+    query: str, k: int, fields: Optional[Sequence[str]] = None, embedding: Optional[List[float]] = None
+) -> Tuple[List[Dict[str, Any]], int, str]:
+    """Same contract as ``vector_search.search_vector``, scored exactly against every stored vector."""
+    query = normalize_query_text(query)
+    index = _state.index
+    if k <= 0 or (not query and embedding is None) or index is None:
+        return [], 0, "exact"
+    if embedding is None:
+        embedding = await get_embedding(query)
+    hits = await asyncio.to_thread(index.search, embedding, k)
+    docs = await hydrate(hits, fields)
+    logger.info("vector search operator=exact returned %d", len(docs))
+    return docs, len(docs), "exact"
+
+
+def exact_vector_building() -> Optional[asyncio.Task]:
+    """The startup build task while it is still running, so change sync can wait for it."""
+    task = _state.task
+    return task if task is not None and not task.done() else None
+
+
+def exact_vector_from_dump() -> bool:
+    """True when the live matrix was opened from an earlier dump and may predate recent changes."""
+    return _state.index is not None and _state.from_dump
+
+
+def exact_vector_pending_changes() -> int:
+    return _state.index.changes.pending() if _state.index is not None else 0
+
+
+async def apply_exact_vector_changes(upserts: Sequence[Dict[str, Any]], deletes: Sequence[Any]) -> None:
+    """Change-stream hook: tombstone replaced rows and overlay new vectors until the next dump."""
+    index = _state.index
+    if index is None:
+        return
+    index.changes.apply(*embedding_changes(upserts, deletes))
+    metrics.set_gauge("exact_vector_pending_changes", index.changes.pending())
+
+
+async def resync_exact_vectors() -> None:
+    """Change-stream hook: re-dump the matrix from the collection and reopen it."""
+    if settings.vector_backend == "exact" or settings.exact_vector_fallback:
+        await build_exact_vectors(use_dump=False)
+        metrics.set_gauge("exact_vector_pending_changes", 0)
+
+
+async def start_exact_vectors(app: FastAPI) -> None:
+    """Open (or dump) the matrix in the background when it serves or backs up vector search."""
+    wanted = settings.vector_backend == "exact" or settings.exact_vector_fallback
+    if not wanted or _state.task is not None:
+        return
+
+    async def _run() -> None:
+        try:
+            await build_exact_vectors()
+        except Exception:
+            logger.exception("Exact vector matrix unavailable; vector search stays on Atlas")
+
+    _state.task = asyncio.create_task(_run())
+    app.state.exact_vector_task = _state.task
+
+
+async def stop_exact_vectors(app: FastAPI) -> None:
+    if _state.task is not None and not _state.task.done():
+        _state.task.cancel()
+    _state.task = None
+    app.state.exact_vector_task = None
+
+
+async def _dump_main(args: argparse.Namespace) -> None:
+    from .db import close_mongo_connection, connect_to_mongo
+
+    app = FastAPI()
+    await connect_to_mongo(app)
+    read_at = time.time()
+    try:
+        raw_ids, matrix = await read_embeddings()
+    finally:
+        await close_mongo_connection(app)
+    if not _try_lock(args.output):
+        raise SystemExit(f"{_lock_path(args.output)} is held by a worker that is dumping; try again later")
+    try:
+        dump_vectors(args.output, raw_ids, matrix, args.dtype, read_at)
+    finally:
+        _unlock(args.output)
+    print(f"Wrote {len(raw_ids)} vectors to {args.output} ({args.dtype})")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Exact vector matrix tools.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    dump = sub.add_parser("dump", help="dump the collection's embeddings to a memory-mappable matrix")
+    dump.add_argument("--output", default=settings.exact_vector_path)
+    dump.add_argument("--dtype", choices=VECTOR_DTYPES, default=settings.exact_vector_dtype)
+    args = parser.parse_args(argv)
+    asyncio.run(_dump_main(args))
+
+
+__all__ = [
+    "VECTOR_DTYPES",
+    "ExactVectorIndex",
+    "dump_vectors",
+    "read_manifest",
+    "exact_vector_ready",
+    "get_exact_vector_index",
+    "build_exact_vectors",
+    "search_exact_vector",
+    "exact_vector_building",
+    "exact_vector_from_dump",
+    "exact_vector_pending_changes",
+    "apply_exact_vector_changes",
+    "resync_exact_vectors",
+    "start_exact_vectors",
+    "stop_exact_vectors",
+]
+
+
+if __name__ == "__main__":
+    main()
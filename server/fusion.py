@@ -0,0 +1,117 @@
+"""Score fusion strategies for combining ranked result lists from several retrievers."""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Mapping, Optional, Sequence
+
+import numpy as np
+
+from .dedup import identifier_for_doc
+
+FUSION_STRATEGIES = ("none", "rrf", "minmax", "zscore", "weighted")
+
+
+def normalize_max(scores: np.ndarray) -> np.ndarray:
+    """Divide by the maximum (all zeros when the maximum is not positive)."""
+    top = float(scores.max()) if scores.size else 0.0
+    if top <= 0:
+        return np.zeros_like(scores, dtype=np.float64)
+    return scores / top
+
+
+def normalize_minmax(scores: np.ndarray) -> np.ndarray:
+    if not scores.size:
+        return scores.astype(np.float64)
+    low, high = float(scores.min()), float(scores.max())
+    if high - low <= 1e-12:
+        return np.ones_like(scores, dtype=np.float64)
+    return (scores - low) / (high - low)
+
+
+def normalize_zscore(scores: np.ndarray) -> np.ndarray:
+    if not scores.size:
+        return scores.astype(np.float64)
+    std = float(scores.std())
+    if std <= 1e-12:
+        return np.zeros_like(scores, dtype=np.float64)
+    return (scores - float(scores.mean())) / std
+
+
+def fuse_results(
+    result_lists: Mapping[str, Sequence[Dict[str, Any]]],
+    strategy: str,
+    weights: Optional[Mapping[str, float]] = None,
+    rrf_k: int = 60,
+) -> List[Dict[str, Any]]:
+    """Fuse per-source ranked lists into one list ordered by fused score.
+
+    Documents returned by more than one source accumulate every source's contribution
+    instead of being dropped by dedup. Each output document carries ``fused_score`` (also
+    written to ``score``), ``source`` (e.g. ``"bm25+vector"``) and the raw per-source scores
+    in ``metadata["source_scores"]``.
+    """
+    if strategy not in FUSION_STRATEGIES or strategy == "none":
+        raise ValueError(f"fusion strategy must be one of {', '.join(FUSION_STRATEGIES[1:])}")
+
+    sources = [name for name, docs in result_lists.items() if docs]
+    ids: Dict[str, int] = {}
+    first_doc: List[Dict[str, Any]] = []
+    for name in sources:
+        for doc in result_lists[name]:
+            identifier = identifier_for_doc(doc)
+            if identifier not in ids:
+                ids[identifier] = len(first_doc)
+                first_doc.append(doc)
+    if not first_doc:
+        return []
+
+    n_docs, n_sources = len(first_doc), len(sources)
+    raw = np.full((n_docs, n_sources), np.nan)
+    ranks = np.full((n_docs, n_sources), np.inf)
+    for col, name in enumerate(sources):
+        for rank, doc in enumerate(result_lists[name], start=1):
+            row = ids[identifier_for_doc(doc)]
+            if np.isnan(raw[row, col]):  # keep the best-ranked duplicate within a source
+                raw[row, col] = float(doc.get("score", 0.0) or 0.0)
+                ranks[row, col] = rank
+
+    weight_vec = np.array([float((weights or {}).get(name, 1.0)) for name in sources])
+    present = ~np.isnan(raw)
+
+    if strategy == "rrf":
+        contributions = np.where(present, 1.0 / (rrf_k + ranks), 0.0)
+    else:
+        normalizer = {"minmax": normalize_minmax, "zscore": normalize_zscore, "weighted": normalize_max}[strategy]
+        contributions = np.zeros_like(raw)
+        for col in range(n_sources):
+            mask = present[:, col]
+            normalized = normalizer(raw[mask, col])
+            contributions[mask, col] = normalized
+            if strategy == "zscore" and normalized.size:
+                # A source that missed the document counts as its weakest hit, not as average.
+                contributions[~mask, col] = float(normalized.min())
+    fused = contributions @ weight_vec
+
+    order = np.argsort(-fused, kind="stable")
+    out: List[Dict[str, Any]] = []
+    for row in order:
+        doc = first_doc[row]
+        hit_sources = [sources[col] for col in range(n_sources) if present[row, col]]
+        metadata = dict(doc.get("metadata") or {})
+        metadata["source_scores"] = {sources[col]: float(raw[row, col]) for col in range(n_sources) if present[row, col]}
+        out.append({
+            **doc,
+            "score": float(fused[row]),
+            "fused_score": float(fused[row]),
+            "source": "+".join(hit_sources),
+            "metadata": metadata,
+        })
+    return out
+
+
+__all__ = [
+    "FUSION_STRATEGIES",
+    "normalize_max",
+    "normalize_minmax",
+    "normalize_zscore",
+    "fuse_results",
+]
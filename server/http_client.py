@@ -0,0 +1,95 @@
+"""Shared async HTTP clients with keep-alive connection pools for outbound providers."""
+from __future__ import annotations
+
+import importlib.util
+from typing import Optional
+
+import httpx
+from fastapi import FastAPI
+
+from .config import settings
+
+
+class HttpClients:
+    embedding: Optional[httpx.AsyncClient] = None
+    rerank: Optional[httpx.AsyncClient] = None
+
+
+http_clients = HttpClients()
+
+
+def http2_available() -> bool:
+    """HTTP/2 is negotiated only when the optional ``h2`` package is installed."""
+    return importlib.util.find_spec("h2") is not None
+
+
+def _build_client(pool_size: int, timeout_seconds: float, connect_timeout_seconds: float, keepalive_seconds: float) -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=pool_size,
+        max_keepalive_connections=pool_size,
+        keepalive_expiry=keepalive_seconds,
+    )
+    timeout = httpx.Timeout(timeout_seconds, connect=connect_timeout_seconds)
+    return httpx.AsyncClient(http2=http2_available(), limits=limits, timeout=timeout)
+
+
+def _build_embedding_client() -> httpx.AsyncClient:
+    return _build_client(
+        settings.embedding_pool_size,
+        settings.embedding_timeout_seconds,
+        settings.embedding_connect_timeout_seconds,
+        settings.embedding_keepalive_seconds,
+    )
+
+
+def _build_rerank_client() -> httpx.AsyncClient:
+    return _build_client(
+        settings.groq_pool_size,
+        settings.groq_timeout_seconds,
+        settings.groq_connect_timeout_seconds,
+        settings.groq_keepalive_seconds,
+    )
+
+
+async def open_http_clients(app: FastAPI) -> None:
+    """Create pooled clients once per worker and attach them to app.state."""
+    if http_clients.embedding is None:
+        http_clients.embedding = _build_embedding_client()
+    if http_clients.rerank is None:
+        http_clients.rerank = _build_rerank_client()
+    app.state.embedding_client = http_clients.embedding
+    app.state.rerank_client = http_clients.rerank
+
+
+async def close_http_clients(app: FastAPI) -> None:
+    if http_clients.embedding is not None:
+        await http_clients.embedding.aclose()
+        http_clients.embedding = None
+    if http_clients.rerank is not None:
+        await http_clients.rerank.aclose()
+        http_clients.rerank = None
+    app.state.embedding_client = None
+    app.state.rerank_client = None
+
+
+def get_embedding_client() -> httpx.AsyncClient:
+    """Return the pooled embedding client, creating it lazily outside the app lifecycle."""
+    if http_clients.embedding is None:
+        http_clients.embedding = _build_embedding_client()
+    return http_clients.embedding
+
+
+def get_rerank_client() -> httpx.AsyncClient:
+    """Return the pooled Groq client, creating it lazily outside the app lifecycle."""
+    if http_clients.rerank is None:
+        http_clients.rerank = _build_rerank_client()
+    return http_clients.rerank
+
+
+__all__ = [
+    "http2_available",
+    "open_http_clients",
+    "close_http_clients",
+    "get_embedding_client",
+    "get_rerank_client",
+]
@@ -0,0 +1,94 @@
+"""Hydration of id-only search hits from a bounded cache of already-sanitized documents."""
+from __future__ import annotations
+
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from . import metrics
+from .config import settings
+from .db import get_collection
+from .projection import document_from_result
+from .request_context import mongo_time_limit
+from .ttl_cache import TTLCache
+
+
+logger = logging.getLogger("uvicorn.error")
+
+_doc_cache: TTLCache[Dict[str, Any]] = TTLCache(
+    settings.hydration_cache_max_entries, settings.hydration_cache_ttl_seconds
+)
+
+
+def _select_fields(metadata: Dict[str, Any], fields: Optional[Sequence[str]]) -> Dict[str, Any]:
+    if not fields:
+        return dict(metadata)
+    keep = {"_id", *fields}
+    return {k: v for k, v in metadata.items() if k in keep}
+
+
+async def hydrate(hits: Sequence[Tuple[Any, float]], fields: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+    """Turn ``(_id, score)`` hits into result documents, in hit order.
+
+    Cached documents are reused; all misses are fetched with one batched ``$in`` query.
+    Hits whose document no longer exists are dropped.
+    """
+    cached: Dict[str, Dict[str, Any]] = {}
+    missing: List[Any] = []
+    for raw_id, _ in hits:
+        key = str(raw_id)
+        if key in cached:
+            continue
+        doc = _doc_cache.get(key)
+        if doc is None:
+            missing.append(raw_id)
+        else:
+            cached[key] = doc
+    metrics.increment("hydration_cache_hits", len(cached))
+    metrics.increment("hydration_cache_misses", len(missing))
+
+    if missing:
+        excluded = settings.result_exclude_fields or []
+        projection = {field: 0 for field in excluded} or None
+        cursor = get_collection().find({"_id": {"$in": missing}}, projection, **mongo_time_limit(find=True))
+        async for raw in cursor:
+            doc = document_from_result({"document": raw})
+            key = str(raw.get("_id"))
+            entry = {"content": doc["content"], "metadata": doc["metadata"]}
+            _doc_cache.set(key, entry)
+            cached[key] = entry
+
+    results: List[Dict[str, Any]] = []
+    for raw_id, score in hits:
+        entry = cached.get(str(raw_id))
+        if entry is None:
+            continue
+        results.append({
+            "content": entry["content"],
+            "score": float(score or 0.0),
+            "metadata": _select_fields(entry["metadata"], fields),
+        })
+    return results
+
+
+def invalidate_documents(ids: Iterable[Any]) -> int:
+    """Drop documents from the hydration cache (e.g. from a change-stream event)."""
+    removed = _doc_cache.pop_many(str(i) for i in ids)
+    if removed:
+        metrics.increment("hydration_cache_invalidations", removed)
+    return removed
+
+
+def clear_hydration_cache() -> None:
+    _doc_cache.clear()
+
+
+def hydration_cache_stats() -> Dict[str, Any]:
+    return _doc_cache.stats()
+
+
+__all__ = [
+    "hydrate",
+    "invalidate_documents",
+    "clear_hydration_cache",
+    "hydration_cache_stats",
+]
@@ -0,0 +1,439 @@
+"""In-process approximate nearest neighbour search (IVF-flat over NumPy float32 matrices).
+
+Usage for the recall-vs-latency report (from the repository root)::
+
+    python -m server.local_ann report --queries 200 --k 10 --nprobe 1,2,4,8,16
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from fastapi import FastAPI
+
+from . import metrics
+from .config import settings
+from .db import get_collection
+from .embedding_cache import sample_cached_embeddings
+from .hydration import hydrate
+from .local_bm25 import pack_ids, unpack_ids
+from .normalize import normalize_query_text
+from .vector_search import get_embedding
+
+
+logger = logging.getLogger("uvicorn.error")
+
+_ASSIGN_BLOCK = 65_536
+
+
+def normalize_rows(x: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (x / norms).astype(np.float32, copy=False)
+
+
+def cosine_to_score(cosine: np.ndarray) -> np.ndarray:
+    """Match Atlas ``vectorSearchScore`` for cosine similarity: ``(1 + cos) / 2``."""
+    return (1.0 + cosine) / 2.0
+
+
+def exact_top_k(vectors: np.ndarray, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Exact cosine top-k over unit-normalized rows; returns ``(row indices, cosines)``."""
+    sims = vectors @ query
+    k = min(k, sims.shape[0])
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    top = np.argpartition(-sims, k - 1)[:k]
+    top = top[np.argsort(-sims[top], kind="stable")]
+    return top, sims[top]
+
+
+def _spherical_kmeans(x: np.ndarray, n_lists: int, iters: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    sample = x[rng.choice(len(x), size=min(len(x), n_lists * 256), replace=False)]
+    centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+    for _ in range(iters):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        counts = np.bincount(assign, minlength=n_lists)
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()), replace=False)]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+def merge_hits(a: List[Tuple[Any, float]], b: List[Tuple[Any, float]], k: int) -> List[Tuple[Any, float]]:
+    return sorted(a + b, key=lambda hit: hit[1], reverse=True)[:k]
+
+
+class VectorDelta:
+    """Tombstones over an immutable row matrix plus an unindexed overlay of new vectors.
+
+    Local vector indexes use it to absorb change-stream upserts and deletes between rebuilds.
+    """
+
+    def __init__(self, raw_ids: Sequence[Any]) -> None:
+        self.raw_ids = raw_ids
+        self.alive = np.ones(len(raw_ids), dtype=bool)
+        self.extra: Dict[str, Tuple[Any, np.ndarray]] = {}
+        self._rows: Optional[Dict[str, int]] = None
+
+    def _row_of(self, key: str) -> Optional[int]:
+        if self._rows is None:
+            self._rows = {str(raw_id): row for row, raw_id in enumerate(self.raw_ids)}
+        return self._rows.get(key)
+
+    def apply(self, upserts: Iterable[Tuple[Any, Sequence[float]]], deletes: Iterable[Any]) -> None:
+        for raw_id in deletes:
+            key = str(raw_id)
+            row = self._row_of(key)
+            if row is not None:
+                self.alive[row] = False
+            self.extra.pop(key, None)
+        for raw_id, vector in upserts:
+            key = str(raw_id)
+            row = self._row_of(key)
+            if row is not None:
+                self.alive[row] = False
+            self.extra[key] = (raw_id, normalize_rows(np.asarray(vector, dtype=np.float32)[None, :])[0])
+
+    def pending(self) -> int:
+        return int(len(self.alive) - np.count_nonzero(self.alive)) + len(self.extra)
+
+    def search(self, query: np.ndarray, k: int) -> List[Tuple[Any, float]]:
+        """Score the overlay exactly; ``query`` must already be unit-normalized."""
+        if not self.extra or k <= 0:
+            return []
+        entries = list(self.extra.values())
+        top, cosines = exact_top_k(np.stack([vec for _, vec in entries]), query, k)
+        return [(entries[i][0], float(s)) for i, s in zip(top, cosine_to_score(cosines))]
+
+
+class IVFFlatIndex:
+    """Inverted-file index: vectors are grouped by nearest centroid and stored contiguously per list."""
+
+    def __init__(self) -> None:
+        self.centroids = np.zeros((0, 0), dtype=np.float32)
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.raw_ids: List[Any] = []
+        self.changes = VectorDelta(self.raw_ids)
+
+    def __len__(self) -> int:
+        return len(self.raw_ids)
+
+    def build(self, raw_ids: Sequence[Any], vectors: np.ndarray, n_lists: int = 0, iters: int = 10, seed: int = 7) -> "IVFFlatIndex":
+        x = normalize_rows(np.asarray(vectors, dtype=np.float32))
+        n = len(x)
+        if n == 0:
+            return self
+        n_lists = n_lists or max(1, int(np.sqrt(n)))
+        n_lists = min(n_lists, n)
+        self.centroids = _spherical_kmeans(x, n_lists, iters, seed)
+        assign = np.concatenate([
+            np.argmax(x[i:i + _ASSIGN_BLOCK] @ self.centroids.T, axis=1) for i in range(0, n, _ASSIGN_BLOCK)
+        ])
+        order = np.argsort(assign, kind="stable")
+        self.vectors = np.ascontiguousarray(x[order])
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=n_lists))]).astype(np.int64)
+        self.raw_ids = [raw_ids[i] for i in order]
+        self.changes = VectorDelta(self.raw_ids)
+        return self
+
+    def search(self, query: Sequence[float], k: int, nprobe: int) -> List[Tuple[Any, float]]:
+        if k <= 0:
+            return []
+        q = normalize_rows(np.asarray(query, dtype=np.float32)[None, :])[0]
+        overlay = self.changes.search(q, k)
+        if not len(self.raw_ids):
+            return overlay
+        n_lists = len(self.centroids)
+        nprobe = max(1, min(nprobe, n_lists))
+        centroid_sims = self.centroids @ q
+        probe = np.argpartition(-centroid_sims, nprobe - 1)[:nprobe]
+        rows = np.concatenate([np.arange(self.offsets[l], self.offsets[l + 1]) for l in probe])
+        rows = rows[self.changes.alive[rows]]
+        if rows.size == 0:
+            return overlay
+        top, cosines = exact_top_k(self.vectors[rows], q, k)
+        scores = cosine_to_score(cosines)
+        hits = [(self.raw_ids[rows[i]], float(s)) for i, s in zip(top, scores)]
+        return merge_hits(hits, overlay, k) if overlay else hits
+
+    def save(self, path: str) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as fh:
+            np.savez(
+                fh, centroids=self.centroids, vectors=self.vectors, offsets=self.offsets, ids=pack_ids(self.raw_ids)
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "IVFFlatIndex":
+        data = np.load(path)
+        index = cls()
+        index.centroids = data["centroids"]
+        index.vectors = data["vectors"]
+        index.offsets = data["offsets"]
+        index.raw_ids = unpack_ids(data["ids"])
+        index.changes = VectorDelta(index.raw_ids)
+        return index
+
+
+class _LocalAnnState:
+    index: Optional[IVFFlatIndex] = None
+    task: Optional[asyncio.Task] = None
+    from_snapshot = False
+
+
+_state = _LocalAnnState()
+
+
+def local_ann_ready() -> bool:
+    return _state.index is not None
+
+
+def get_local_ann() -> Optional[IVFFlatIndex]:
+    return _state.index
+
+
+async def read_embeddings() -> Tuple[List[Any], np.ndarray]:
+    """Read every ``(_id, embedding)`` pair from the collection as a float32 matrix."""
+    raw_ids: List[Any] = []
+    rows: List[Sequence[float]] = []
+    async for doc in get_collection().find({"embedding": {"$exists": True}}, {"embedding": 1}):
+        embedding = doc.get("embedding")
+        if isinstance(embedding, list) and embedding:
+            raw_ids.append(doc.get("_id"))
+            rows.append(embedding)
+    matrix = np.asarray(rows, dtype=np.float32) if rows else np.zeros((0, 0), dtype=np.float32)
+    return raw_ids, matrix
+
+
+async def build_local_ann(use_snapshot: bool = True) -> IVFFlatIndex:
+    """Load the index from the snapshot file if present, otherwise cluster the collection's embeddings."""
+    start = time.perf_counter()
+    path = settings.local_ann_path
+    index: Optional[IVFFlatIndex] = None
+    from_snapshot = bool(use_snapshot and path and Path(path).exists())
+    if from_snapshot:
+        try:
+            index = await asyncio.to_thread(IVFFlatIndex.load, path)
+            logger.info("Loaded local IVF index %s (%d vectors)", path, len(index))
+        except (OSError, ValueError, KeyError) as exc:
+            # Older snapshots held pickled object arrays; rebuild and overwrite them.
+            logger.warning("Local IVF snapshot %s unreadable (%s); rebuilding from the collection", path, exc)
+            from_snapshot = False
+    if index is None:
+        raw_ids, matrix = await read_embeddings()
+        index = IVFFlatIndex()
+        await asyncio.to_thread(index.build, raw_ids, matrix, settings.local_ann_lists)
+        if path:
+            await asyncio.to_thread(index.save, path)
+        logger.info("Built local IVF index from collection (%d vectors)", len(index))
+    _state.index = index
+    _state.from_snapshot = from_snapshot
+    metrics.set_gauge("local_ann_vectors", len(index))
+    metrics.observe("local_ann_build_ms", (time.perf_counter() - start) * 1000)
+    return index
+
+
+async def search_local_ann(
+    query: str, k: int, fields: Optional[Sequence[str]] = None, embedding: Optional[List[float]] = None
+) -> Tuple[List[Dict[str, Any]], int, str]:
+    """Same contract as ``vector_search.search_vector``, served from the in-process IVF index."""
+    query = normalize_query_text(query)
+    index = _state.index
+    if k <= 0 or (not query and embedding is None) or index is None:
+        return [], 0, "local-ivf"
+    if embedding is None:
+        embedding = await get_embedding(query)
+    hits = index.search(embedding, k, settings.local_ann_nprobe)
+    docs = await hydrate(hits, fields)
+    logger.info("vector search operator=local-ivf returned %d", len(docs))
+    return docs, len(docs), "local-ivf"
+
+
+def embedding_changes(upserts: Sequence[Dict[str, Any]], deletes: Sequence[Any]) -> Tuple[List[Tuple[Any, Any]], List[Any]]:
+    """Split change-stream documents into vector upserts; documents without an embedding count as deletes."""
+    vectors: List[Tuple[Any, Any]] = []
+    removed = list(deletes)
+    for doc in upserts:
+        embedding = doc.get("embedding")
+        if isinstance(embedding, list) and embedding:
+            vectors.append((doc.get("_id"), embedding))
+        else:
+            removed.append(doc.get("_id"))
+    return vectors, removed
+
+
+def local_ann_building() -> Optional[asyncio.Task]:
+    """The startup build task while it is still running, so change sync can wait for it."""
+    task = _state.task
+    return task if task is not None and not task.done() else None
+
+
+def local_ann_from_snapshot() -> bool:
+    """True when the live index came from a snapshot and may predate the latest collection changes."""
+    return _state.index is not None and _state.from_snapshot
+
+
+def local_ann_pending_changes() -> int:
+    return _state.index.changes.pending() if _state.index is not None else 0
+
+
+async def apply_local_ann_changes(upserts: Sequence[Dict[str, Any]], deletes: Sequence[Any]) -> None:
+    """Change-stream hook: tombstone replaced rows and overlay new vectors until the next rebuild."""
+    index = _state.index
+    if index is None:
+        return
+    index.changes.apply(*embedding_changes(upserts, deletes))
+    metrics.set_gauge("local_ann_pending_changes", index.changes.pending())
+
+
+async def resync_local_ann() -> None:
+    """Change-stream hook: re-cluster from the collection (and refresh the snapshot)."""
+    if settings.vector_backend == "local-ivf":
+        await build_local_ann(use_snapshot=False)
+        metrics.set_gauge("local_ann_pending_changes", 0)
+
+
+async def start_local_ann(app: FastAPI) -> None:
+    """Build the index in the background; callers fall back to Atlas until it is ready."""
+    if settings.vector_backend != "local-ivf" or _state.task is not None:
+        return
+
+    async def _run() -> None:
+        try:
+            await build_local_ann()
+        except Exception:
+            logger.exception("Local IVF index build failed; vector search stays on Atlas")
+
+    _state.task = asyncio.create_task(_run())
+    app.state.local_ann_task = _state.task
+
+
+async def stop_local_ann(app: FastAPI) -> None:
+    if _state.task is not None and not _state.task.done():
+        _state.task.cancel()
+    _state.task = None
+    app.state.local_ann_task = None
+
+
+def recall_report(
+    index: IVFFlatIndex,
+    queries: np.ndarray,
+    k: int,
+    nprobes: Sequence[int],
+    exclude: Optional[Sequence[Optional[str]]] = None,
+) -> List[Dict[str, Any]]:
+    """Measure recall@k and mean latency of the index against exact search for each ``nprobe``.
+
+    ``exclude[i]`` is an id dropped from both result lists for query ``i``; pass it when the
+    query is a corpus row, which would otherwise trivially find itself.
+    """
+    queries = normalize_rows(np.asarray(queries, dtype=np.float32))
+    exclude = list(exclude) if exclude is not None else [None] * len(queries)
+
+    def _top(ids: Sequence[Any], skip: Optional[str]) -> set:
+        return set([str(i) for i in ids if str(i) != skip][:k])
+
+    exact_sets: List[set] = []
+    exact_ms = 0.0
+    for q, skip in zip(queries, exclude):
+        t0 = time.perf_counter()
+        top, _ = exact_top_k(index.vectors, q, k + 1)
+        exact_ms += (time.perf_counter() - t0) * 1000
+        exact_sets.append(_top([index.raw_ids[i] for i in top], skip))
+    report = [{"nprobe": "exact", "recall": 1.0, "mean_ms": exact_ms / max(len(queries), 1)}]
+    for nprobe in nprobes:
+        hits = 0
+        elapsed = 0.0
+        for q, truth, skip in zip(queries, exact_sets, exclude):
+            t0 = time.perf_counter()
+            found = index.search(q, k + 1, nprobe)
+            elapsed += (time.perf_counter() - t0) * 1000
+            hits += len(truth & _top([i for i, _ in found], skip))
+        report.append({
+            "nprobe": nprobe,
+            "recall": hits / max(len(queries) * k, 1),
+            "mean_ms": elapsed / max(len(queries), 1),
+        })
+    return report
+
+
+async def _report_main(args: argparse.Namespace) -> None:
+    from .db import close_mongo_connection, connect_to_mongo
+
+    app = FastAPI()
+    await connect_to_mongo(app)
+    try:
+        index = await build_local_ann(use_snapshot=not args.rebuild)
+    finally:
+        await close_mongo_connection(app)
+    nprobes = [int(v) for v in args.nprobe.split(",") if v.strip()]
+
+    # Real query vectors from the embedding cache first; corpus rows only top up the sample,
+    # with each row's own id excluded since it is trivially its nearest neighbour.
+    cached = sample_cached_embeddings(settings.embedding_model, index.vectors.shape[1], args.queries)
+    queries: List[np.ndarray] = [np.asarray(v, dtype=np.float32) for v in cached]
+    exclude: List[Optional[str]] = [None] * len(queries)
+    missing = min(args.queries - len(queries), len(index))
+    if missing > 0:
+        rng = np.random.default_rng(args.seed)
+        for row in rng.choice(len(index), size=missing, replace=False):
+            queries.append(index.vectors[row])
+            exclude.append(str(index.raw_ids[row]))
+    if not queries:
+        raise SystemExit("No query vectors: the embedding cache and the index are both empty")
+    print(f"{len(cached)} cached query vectors, {max(missing, 0)} corpus rows (self excluded)", file=sys.stderr)
+    print(json.dumps(recall_report(index, np.stack(queries), args.k, nprobes, exclude), indent=2))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Local IVF vector index tools.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    report = sub.add_parser("report", help="recall@k and latency against exact search")
+    report.add_argument("--queries", type=int, default=200)
+    report.add_argument("--k", type=int, default=10)
+    report.add_argument("--nprobe", default="1,2,4,8,16")
+    report.add_argument("--seed", type=int, default=3)
+    report.add_argument("--rebuild", action="store_true", help="ignore the snapshot and rebuild from Mongo")
+    args = parser.parse_args(argv)
+    asyncio.run(_report_main(args))
+
+
+__all__ = [
+    "IVFFlatIndex",
+    "VectorDelta",
+    "merge_hits",
+    "normalize_rows",
+    "cosine_to_score",
+    "exact_top_k",
+    "local_ann_ready",
+    "get_local_ann",
+    "read_embeddings",
+    "build_local_ann",
+    "search_local_ann",
+    "embedding_changes",
+    "local_ann_building",
+    "local_ann_from_snapshot",
+    "local_ann_pending_changes",
+    "apply_local_ann_changes",
+    "resync_local_ann",
+    "start_local_ann",
+    "stop_local_ann",
+    "recall_report",
+]
+
+
+if __name__ == "__main__":
+    main()
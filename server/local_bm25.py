@@ -0,0 +1,358 @@
+"""In-process BM25 index over ``settings.search_fields`` with array-backed postings."""
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import bson
+import numpy as np
+from bson.binary import UuidRepresentation
+from bson.codec_options import CodecOptions
+from fastapi import FastAPI
+
+from . import metrics
+from .config import settings
+from .db import get_collection
+from .hydration import hydrate
+from .local_rerank import tokenize
+from .normalize import normalize_query_text
+
+
+logger = logging.getLogger("uvicorn.error")
+
+# Snapshot ids are stored as one BSON array, so every _id type round-trips exactly.
+_ID_CODEC = CodecOptions(uuid_representation=UuidRepresentation.STANDARD)
+
+
+def _doc_text(doc: Dict[str, Any], fields: Sequence[str]) -> str:
+    return " ".join(str(doc.get(field) or "") for field in fields)
+
+
+def pack_ids(raw_ids: Sequence[Any]) -> np.ndarray:
+    """Encode ``_id`` values as a BSON array in a ``uint8`` buffer, loadable without pickle."""
+    return np.frombuffer(bson.encode({"ids": list(raw_ids)}, codec_options=_ID_CODEC), dtype=np.uint8)
+
+
+def unpack_ids(packed: np.ndarray) -> List[Any]:
+    return list(bson.decode(packed.tobytes(), codec_options=_ID_CODEC)["ids"])
+
+
+
+
+class LocalBM25Index:
+    """BM25 (Okapi) index with CSR postings: ``offsets[t]:offsets[t+1]`` slices docs/tfs for term ``t``.
+
+    Postings are immutable; ``apply_changes`` tombstones replaced or deleted rows and keeps
+    new versions in a small delta that is scored alongside them until the next rebuild.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self.vocab: Dict[str, int] = {}
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.postings = np.zeros(0, dtype=np.int32)
+        self.tfs = np.zeros(0, dtype=np.float32)
+        self.doc_len = np.zeros(0, dtype=np.float32)
+        self.raw_ids: List[Any] = []
+        self.avgdl = 0.0
+        self.alive = np.ones(0, dtype=bool)
+        self.delta: Dict[str, Tuple[Any, Counter, int]] = {}
+        self._rows: Optional[Dict[str, int]] = None
+
+    def __len__(self) -> int:
+        return len(self.raw_ids)
+
+    def build(self, docs: Iterable[Tuple[Any, str]]) -> "LocalBM25Index":
+        """Build from ``(_id, text)`` pairs."""
+        term_docs: Dict[str, List[Tuple[int, int]]] = {}
+        raw_ids: List[Any] = []
+        lengths: List[int] = []
+        for doc_idx, (raw_id, text) in enumerate(docs):
+            tokens = tokenize(text)
+            raw_ids.append(raw_id)
+            lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                term_docs.setdefault(term, []).append((doc_idx, tf))
+
+        terms = sorted(term_docs)
+        self.vocab = {term: idx for idx, term in enumerate(terms)}
+        counts = np.array([len(term_docs[t]) for t in terms], dtype=np.int64)
+        self.offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self.postings = np.empty(int(self.offsets[-1]), dtype=np.int32)
+        self.tfs = np.empty(int(self.offsets[-1]), dtype=np.float32)
+        for idx, term in enumerate(terms):
+            start, end = self.offsets[idx], self.offsets[idx + 1]
+            pairs = np.asarray(term_docs[term], dtype=np.int64)
+            self.postings[start:end] = pairs[:, 0]
+            self.tfs[start:end] = pairs[:, 1]
+        self.doc_len = np.asarray(lengths, dtype=np.float32)
+        self.raw_ids = raw_ids
+        self.avgdl = float(self.doc_len.mean()) if len(lengths) else 0.0
+        self._reset_changes()
+        return self
+
+    def _reset_changes(self) -> None:
+        self.alive = np.ones(len(self.raw_ids), dtype=bool)
+        self.delta = {}
+        self._rows = None
+
+    def _row_of(self, key: str) -> Optional[int]:
+        if self._rows is None:
+            self._rows = {str(raw_id): row for row, raw_id in enumerate(self.raw_ids)}
+        return self._rows.get(key)
+
+    def apply_changes(self, upserts: Iterable[Tuple[Any, str]], deletes: Iterable[Any]) -> None:
+        """Apply ``(_id, text)`` upserts and ``_id`` deletes without touching the postings."""
+        for raw_id in deletes:
+            key = str(raw_id)
+            row = self._row_of(key)
+            if row is not None:
+                self.alive[row] = False
+            self.delta.pop(key, None)
+        for raw_id, text in upserts:
+            key = str(raw_id)
+            row = self._row_of(key)
+            if row is not None:
+                self.alive[row] = False
+            tokens = tokenize(text)
+            self.delta[key] = (raw_id, Counter(tokens), len(tokens))
+
+    def pending_changes(self) -> int:
+        return int(len(self.alive) - np.count_nonzero(self.alive)) + len(self.delta)
+
+    def idf(self, term: str) -> float:
+        return self._idf(term, len(self.raw_ids))
+
+    def _idf(self, term: str, n_docs: int) -> float:
+        term_id = self.vocab.get(term)
+        df = 0 if term_id is None else int(self.offsets[term_id + 1] - self.offsets[term_id])
+        return math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+
+    def _search_delta(self, terms: Sequence[str], n_docs: int) -> List[Tuple[Any, float]]:
+        hits: List[Tuple[Any, float]] = []
+        avgdl = max(self.avgdl, 1e-6)
+        for raw_id, counts, length in self.delta.values():
+            norm = self.k1 * (1.0 - self.b + self.b * length / avgdl)
+            score = 0.0
+            for term in terms:
+                tf = counts.get(term, 0)
+                if tf:
+                    score += self._idf(term, n_docs) * tf * (self.k1 + 1.0) / (tf + norm)
+            if score > 0:
+                hits.append((raw_id, score))
+        return hits
+
+    def search(self, query: str, k: int) -> Tuple[List[Tuple[Any, float]], int]:
+        """Return the top ``k`` ``(_id, score)`` hits and the number of matching documents."""
+        n_docs = len(self.raw_ids)
+        terms = list(dict.fromkeys(tokenize(query)))
+        if k <= 0 or not terms:
+            return [], 0
+        hits, total = self._search_postings([self.vocab[t] for t in terms if t in self.vocab], k, n_docs)
+        if not self.delta:
+            return hits, total
+        delta_hits = self._search_delta(terms, n_docs)
+        merged = sorted(hits + delta_hits, key=lambda hit: hit[1], reverse=True)
+        return merged[:k], total + len(delta_hits)
+
+    def _search_postings(self, term_ids: Sequence[int], k: int, n_docs: int) -> Tuple[List[Tuple[Any, float]], int]:
+        if n_docs == 0 or not term_ids:
+            return [], 0
+        scores = np.zeros(n_docs, dtype=np.float32)
+        norm = self.k1 * (1.0 - self.b + self.b * self.doc_len / max(self.avgdl, 1e-6))
+        for term_id in term_ids:
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.postings[start:end]
+            tf = self.tfs[start:end]
+            df = end - start
+            idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+            # Postings hold each doc at most once per term, so fancy-index += is safe here.
+            scores[docs] += idf * tf * (self.k1 + 1.0) / (tf + norm[docs])
+        if not self.alive.all():
+            scores[~self.alive] = 0.0
+
+        matched = np.flatnonzero(scores > 0)
+        if matched.size == 0:
+            return [], 0
+        if matched.size > k:
+            top = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        else:
+            top = matched
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.raw_ids[i], float(scores[i])) for i in top], int(matched.size)
+
+    def save(self, path: str) -> None:
+        # Fixed-width unicode terms and BSON-packed ids keep the snapshot free of object arrays.
+        terms = np.array(sorted(self.vocab, key=self.vocab.__getitem__), dtype=str)
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as fh:
+            np.savez(
+                fh,
+                terms=terms,
+                offsets=self.offsets,
+                postings=self.postings,
+                tfs=self.tfs,
+                doc_len=self.doc_len,
+                ids=pack_ids(self.raw_ids),
+                params=np.array([self.k1, self.b], dtype=np.float64),
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "LocalBM25Index":
+        data = np.load(path)
+        k1, b = data["params"].tolist()
+        index = cls(k1=k1, b=b)
+        index.vocab = {term: idx for idx, term in enumerate(data["terms"].tolist())}
+        index.offsets = data["offsets"]
+        index.postings = data["postings"]
+        index.tfs = data["tfs"]
+        index.doc_len = data["doc_len"]
+        index.raw_ids = unpack_ids(data["ids"])
+        index.avgdl = float(index.doc_len.mean()) if len(index.doc_len) else 0.0
+        index._reset_changes()
+        return index
+
+
+class _LocalBM25State:
+    index: Optional[LocalBM25Index] = None
+    task: Optional[asyncio.Task] = None
+    from_snapshot = False
+
+
+_state = _LocalBM25State()
+
+
+def local_bm25_ready() -> bool:
+    return _state.index is not None
+
+
+def get_local_bm25() -> Optional[LocalBM25Index]:
+    return _state.index
+
+
+async def _read_corpus() -> List[Tuple[Any, str]]:
+    fields = list(settings.search_fields or ["text"])
+    projection = {field: 1 for field in fields}
+    corpus: List[Tuple[Any, str]] = []
+    async for doc in get_collection().find({}, projection):
+        corpus.append((doc.get("_id"), _doc_text(doc, fields)))
+    return corpus
+
+
+async def build_local_bm25(use_snapshot: bool = True) -> LocalBM25Index:
+    """Load the index from the snapshot file if present, otherwise build it from the collection."""
+    start = time.perf_counter()
+    path = settings.local_bm25_snapshot_path
+    index: Optional[LocalBM25Index] = None
+    from_snapshot = bool(use_snapshot and path and Path(path).exists())
+    if from_snapshot:
+        try:
+            index = await asyncio.to_thread(LocalBM25Index.load, path)
+            logger.info("Loaded local BM25 snapshot %s (%d docs)", path, len(index))
+        except (OSError, ValueError, KeyError) as exc:
+            # Older snapshots held pickled object arrays; rebuild and overwrite them.
+            logger.warning("Local BM25 snapshot %s unreadable (%s); rebuilding from the collection", path, exc)
+            from_snapshot = False
+    if index is None:
+        corpus = await _read_corpus()
+        index = LocalBM25Index(settings.local_bm25_k1, settings.local_bm25_b)
+        await asyncio.to_thread(index.build, corpus)
+        if path:
+            await asyncio.to_thread(index.save, path)
+        logger.info("Built local BM25 index from collection (%d docs)", len(index))
+    _state.index = index
+    _state.from_snapshot = from_snapshot
+    metrics.set_gauge("local_bm25_docs", len(index))
+    metrics.observe("local_bm25_build_ms", (time.perf_counter() - start) * 1000)
+    return index
+
+
+async def search_local_bm25(
+    query: str, limit: int, fields: Optional[Sequence[str]] = None
+) -> Tuple[List[Dict[str, Any]], int]:
+    """Same contract as ``search_with_atlas_pipeline``, served from the in-process index."""
+    query = normalize_query_text(query)
+    index = _state.index
+    if not query or index is None:
+        return [], 0
+    hits, total = index.search(query, limit)
+    docs = await hydrate(hits, fields)
+    return docs, max(total, len(docs))
+
+
+def local_bm25_building() -> Optional[asyncio.Task]:
+    """The startup build task while it is still running, so change sync can wait for it."""
+    task = _state.task
+    return task if task is not None and not task.done() else None
+
+
+def local_bm25_from_snapshot() -> bool:
+    """True when the live index came from a snapshot and may predate the latest collection changes."""
+    return _state.index is not None and _state.from_snapshot
+
+
+def local_bm25_pending_changes() -> int:
+    return _state.index.pending_changes() if _state.index is not None else 0
+
+
+async def apply_local_bm25_changes(upserts: Sequence[Dict[str, Any]], deletes: Sequence[Any]) -> None:
+    """Change-stream hook: fold upserted documents and deleted ids into the live index."""
+    index = _state.index
+    if index is None:
+        return
+    fields = list(settings.search_fields or ["text"])
+    index.apply_changes([(doc.get("_id"), _doc_text(doc, fields)) for doc in upserts], deletes)
+    metrics.set_gauge("local_bm25_pending_changes", index.pending_changes())
+
+
+async def resync_local_bm25() -> None:
+    """Change-stream hook: rebuild from the collection (and refresh the snapshot)."""
+    if settings.bm25_backend == "local":
+        await build_local_bm25(use_snapshot=False)
+        metrics.set_gauge("local_bm25_pending_changes", 0)
+
+
+async def start_local_bm25(app: FastAPI) -> None:
+    """Build the index in the background; callers fall back to Atlas until it is ready."""
+    if settings.bm25_backend != "local" or _state.task is not None:
+        return
+
+    async def _run() -> None:
+        try:
+            await build_local_bm25()
+        except Exception:
+            logger.exception("Local BM25 index build failed; BM25 stays on Atlas Search")
+
+    _state.task = asyncio.create_task(_run())
+    app.state.local_bm25_task = _state.task
+
+
+async def stop_local_bm25(app: FastAPI) -> None:
+    if _state.task is not None and not _state.task.done():
+        _state.task.cancel()
+    _state.task = None
+    app.state.local_bm25_task = None
+
+
+__all__ = [
+    "LocalBM25Index",
+    "pack_ids",
+    "unpack_ids",
+    "local_bm25_ready",
+    "get_local_bm25",
+    "build_local_bm25",
+    "search_local_bm25",
+    "local_bm25_building",
+    "local_bm25_from_snapshot",
+    "local_bm25_pending_changes",
+    "apply_local_bm25_changes",
+    "resync_local_bm25",
+    "start_local_bm25",
+    "stop_local_bm25",
+]
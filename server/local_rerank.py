@@ -0,0 +1,118 @@
+"""Local CPU reranker scoring query–candidate features with NumPy, no network required."""
+from __future__ import annotations
+
+import re
+from typing import Any, Dict, List, Sequence, Set
+
+import numpy as np
+
+from .normalize import normalize_acceptance_metadata, normalize_query_text, sanitize_metadata
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+# Includes the user-story boilerplate ("As a user, I want ... so that ...") that every story shares.
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have i in is it its of on or so that the this to was we "
+    "were will with user want can should my our".split()
+)
+_TITLE_FIELDS = ("title", "name", "summary", "storyTitle")
+
+FEATURE_NAMES = (
+    "term_coverage",
+    "idf_coverage",
+    "title_coverage",
+    "bigram_overlap",
+    "phrase_match",
+    "retrieval_score",
+    "length_prior",
+)
+
+# Hand-tuned weights; a distilled model can replace these (see train_reranker).
+DEFAULT_WEIGHTS = np.array([0.20, 0.30, 0.15, 0.15, 0.05, 0.12, 0.03], dtype=np.float32)
+
+
+def tokenize(text: Any) -> List[str]:
+    if not text:
+        return []
+    return [tok for tok in _TOKEN_RE.findall(str(text).lower()) if tok not in _STOPWORDS]
+
+
+def _title_text(metadata: Dict[str, Any]) -> str:
+    return " ".join(str(metadata.get(field) or "") for field in _TITLE_FIELDS)
+
+
+def candidate_features(query: str, docs: Sequence[Dict[str, Any]]) -> np.ndarray:
+    """Return an ``(n_docs, len(FEATURE_NAMES))`` float32 feature matrix for the candidates."""
+    n = len(docs)
+    features = np.zeros((n, len(FEATURE_NAMES)), dtype=np.float32)
+    query_terms = list(dict.fromkeys(tokenize(query)))
+    if n == 0:
+        return features
+
+    content_tokens = [tokenize(doc.get("content")) for doc in docs]
+    content_sets: List[Set[str]] = [set(tokens) for tokens in content_tokens]
+    title_sets: List[Set[str]] = [set(tokenize(_title_text(doc.get("metadata") or {}))) for doc in docs]
+
+    if query_terms:
+        # Doc × query-term incidence matrices drive the overlap features.
+        content_hits = np.array([[term in terms for term in query_terms] for terms in content_sets], dtype=np.float32)
+        title_hits = np.array([[term in terms for term in query_terms] for terms in title_sets], dtype=np.float32)
+        doc_freq = content_hits.sum(axis=0)
+        idf = np.log1p((n + 1.0) / (doc_freq + 1.0)).astype(np.float32)
+        features[:, 0] = content_hits.mean(axis=1)
+        features[:, 1] = content_hits @ idf / max(float(idf.sum()), 1e-6)
+        features[:, 2] = title_hits.mean(axis=1)
+
+    query_bigrams = set(zip(query_terms, query_terms[1:]))
+    if query_bigrams:
+        features[:, 3] = [
+            len(query_bigrams & set(zip(tokens, tokens[1:]))) / len(query_bigrams) for tokens in content_tokens
+        ]
+
+    phrase = normalize_query_text(query).lower()
+    if phrase:
+        features[:, 4] = [phrase in str(doc.get("content") or "").lower() for doc in docs]
+
+    scores = np.array([float(doc.get("score", 0.0) or 0.0) for doc in docs], dtype=np.float32)
+    max_score = float(scores.max()) if n else 0.0
+    if max_score > 0:
+        features[:, 5] = scores / max_score
+
+    lengths = np.array([len(tokens) for tokens in content_tokens], dtype=np.float32)
+    features[:, 6] = 1.0 / (1.0 + np.log1p(lengths))
+    return features
+
+
+def score_candidates(query: str, docs: Sequence[Dict[str, Any]], weights: np.ndarray = DEFAULT_WEIGHTS) -> np.ndarray:
+    return candidate_features(query, docs) @ weights
+
+
+def apply_scores(docs: Sequence[Dict[str, Any]], scores: np.ndarray, top_k: int, label: str) -> List[Dict[str, Any]]:
+    """Attach ``rerank_score`` to copies of the candidates and return the best ``top_k``."""
+    order = np.argsort(-scores, kind="stable")[:top_k]
+    ranked: List[Dict[str, Any]] = []
+    for idx in order:
+        copy = {**docs[idx]}
+        copy["rerank_score"] = float(scores[idx])
+        copy.setdefault("metadata", {})
+        copy["metadata"] = normalize_acceptance_metadata(sanitize_metadata(copy["metadata"]))
+        copy["metadata"]["rerank_score"] = copy["rerank_score"]
+        copy["metadata"]["reranker"] = label
+        ranked.append(copy)
+    return ranked
+
+
+async def local_rerank(query: str, docs: List[Dict[str, Any]], top_k: int, group: str) -> List[Dict[str, Any]]:
+    if top_k <= 0 or not docs:
+        return []
+    return apply_scores(docs, score_candidates(query, docs), top_k, "local")
+
+
+__all__ = [
+    "FEATURE_NAMES",
+    "DEFAULT_WEIGHTS",
+    "tokenize",
+    "candidate_features",
+    "score_candidates",
+    "apply_scores",
+    "local_rerank",
+]
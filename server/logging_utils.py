@@ -55,7 +55,7 @@ def _extract_top_info(docs: Iterable[Dict[str, Any]], max_items: int = 10) -> Tu
         doc_id = identifier_for_doc(doc)
         ids.append(doc_id)
         score = None
-        for key in ("final_score", "groq_score", "score"):
+        for key in ("final_score", "rerank_score", "groq_score", "score"):
             val = doc.get(key)
             if isinstance(val, (int, float)):
                 score = float(val)
@@ -1,18 +1,46 @@
 import asyncio
+import json
 import logging
+from typing import Any, Dict, List, Optional, Tuple
 
-from fastapi import FastAPI, HTTPException, status
+from fastapi import FastAPI, Header, HTTPException, Query, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 
 from .config import settings
 from .db import connect_to_mongo, close_mongo_connection, get_collection
-from .models import SearchRequest, SearchResponse, SearchResult
+from .candidate_tuning import candidate_policy_snapshot, start_candidate_tuning, stop_candidate_tuning
+from .change_sync import start_change_sync, stop_change_sync
+from .distilled_rerank import close_capture
+from .embedding_cache import close_embedding_cache
+from .exact_vector import start_exact_vectors, stop_exact_vectors
+from .http_client import close_http_clients, open_http_clients
+from .hydration import hydration_cache_stats
+from .local_ann import start_local_ann, stop_local_ann
+from .local_bm25 import start_local_bm25, stop_local_bm25
+from .metrics import snapshot as metrics_snapshot
+from .models import BatchSearchRequest, SearchRequest, SearchResponse, SearchResult
+from .projection import validate_fields
+from .related import related_documents
+from .rerank import available_rerankers
+from .request_context import (
+    DEADLINE_HEADER,
+    DeadlineExceeded,
+    clear_deadline,
+    degraded_stages,
+    mark_degraded,
+    remaining_seconds,
+    resolve_timeout_ms,
+    start_deadline,
+)
 from .search_service import (
         validate_limit,
         search_with_langchain,
-        search_with_atlas_pipeline,
+        search_bm25,
         hybrid_search,
+        hybrid_search_batch,
+        RERANK_MODES,
+        FUSION_STRATEGIES,
         _get_embedding,
     )
 
@@ -33,62 +61,297 @@ app.add_middleware(
 async def startup_event():
     await connect_to_mongo(app)
     logger.info("Connected to MongoDB")
+    await open_http_clients(app)
+    await start_local_bm25(app)
+    await start_local_ann(app)
+    await start_exact_vectors(app)
+    await start_change_sync(app)
+    await start_candidate_tuning(app)
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    await stop_candidate_tuning(app)
+    await stop_change_sync(app)
+    await stop_local_bm25(app)
+    await stop_local_ann(app)
+    await stop_exact_vectors(app)
     await close_mongo_connection(app)
     logger.info("Closed MongoDB connection")
+    await close_http_clients(app)
+    # Join the background writer threads so queued embeddings and capture records are flushed.
+    await asyncio.to_thread(close_embedding_cache)
+    await asyncio.to_thread(close_capture)
 
 
-@app.post("/search", response_model=SearchResponse)
-async def search(req: SearchRequest):
+def _validate_hybrid_options(
+    bm25_ratio: float, rerank_mode: Optional[str], reranker: Optional[str], fusion: Optional[str]
+) -> None:
+    if not 0.0 <= bm25_ratio <= 1.0:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="bm25_ratio must be between 0.0 and 1.0")
+
+    if rerank_mode is not None and rerank_mode not in RERANK_MODES:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"rerank_mode must be one of {', '.join(RERANK_MODES)}",
+        )
+
+    if reranker is not None and reranker not in available_rerankers():
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"reranker must be one of {', '.join(available_rerankers())}",
+        )
+
+    if fusion is not None and fusion not in FUSION_STRATEGIES:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"fusion must be one of {', '.join(FUSION_STRATEGIES)}",
+        )
+
+
+def _validate_search_request(
+    req: SearchRequest, timeout_header: Optional[str] = None
+) -> Tuple[int, Optional[List[str]], float]:
     try:
         limit = validate_limit(req.limit if req.limit is not None else settings.default_limit)
+        fields = validate_fields(req.fields)
+        timeout_ms = resolve_timeout_ms(timeout_header, req.timeout_ms)
     except ValueError as ve:
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(ve)) from ve
+    return limit, fields, timeout_ms
+
+
+@app.post("/search", response_model=SearchResponse)
+async def search(req: SearchRequest, timeout_header: Optional[str] = Header(None, alias=DEADLINE_HEADER)):
+    limit, fields, timeout_ms = _validate_search_request(req, timeout_header)
+    start_deadline(timeout_ms)
 
     try:
         try:
             try:
-                results = await asyncio.wait_for(
-                    search_with_langchain(req.query, limit), timeout=settings.langchain_timeout_seconds
-                )
+                langchain_timeout = remaining_seconds(settings.langchain_timeout_seconds)
+                results = await asyncio.wait_for(search_with_langchain(req.query, limit), timeout=langchain_timeout)
             except asyncio.TimeoutError:
                 logger.warning(
-                    "LangChain retriever timed out after %.2fs, falling back to Atlas",
-                    settings.langchain_timeout_seconds,
+                    "LangChain retriever timed out after %.2fs, falling back to BM25 retrieval", langchain_timeout
                 )
+                mark_degraded("langchain", "timed out; served by BM25 retrieval")
                 raise
 
             total_count = len(results)
             return SearchResponse(results=[SearchResult(**r) for r in results], total_count=total_count)
         except Exception as exc:  # LangChain fallback
             logger.debug("LangChain retriever not available, timed out or failed: %s", exc)
-            docs, total = await search_with_atlas_pipeline(req.query, limit)
-            return SearchResponse(results=[SearchResult(**d) for d in docs], total_count=total)
+            # Same backend dispatch as hybrid search, so BM25_BACKEND=local also serves this route.
+            docs, total = await search_bm25(req.query, limit, fields)
+            return SearchResponse(
+                results=[SearchResult(**d) for d in docs], total_count=total, degraded=degraded_stages()
+            )
     except Exception:
         logger.exception("Search failed")
         raise HTTPException(status_code=500, detail="Internal search error")
+    finally:
+        clear_deadline()
 
 
 @app.post("/hybrid_search")
-async def hybrid(req: SearchRequest, bm25_ratio: float = 0.5):
+async def hybrid(
+    req: SearchRequest,
+    bm25_ratio: float = 0.5,
+    rerank_mode: Optional[str] = None,
+    reranker: Optional[str] = None,
+    fusion: Optional[str] = None,
+    timeout_header: Optional[str] = Header(None, alias=DEADLINE_HEADER),
+):
+    limit, fields, timeout_ms = _validate_search_request(req, timeout_header)
+    _validate_hybrid_options(bm25_ratio, rerank_mode, reranker, fusion)
+    start_deadline(timeout_ms)
     try:
-        limit = validate_limit(req.limit if req.limit is not None else settings.default_limit)
+        res = await hybrid_search(
+            req.query,
+            limit,
+            bm25_ratio,
+            rerank_mode=rerank_mode,
+            reranker=reranker,
+            fusion=fusion,
+            fields=fields,
+        )
+        return res
+    except DeadlineExceeded as exc:
+        raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail=str(exc)) from exc
+    except Exception:
+        logger.exception("Hybrid search failed")
+        raise HTTPException(status_code=500, detail="Hybrid search error")
+    finally:
+        clear_deadline()
+
+
+@app.post("/hybrid_search/batch")
+async def hybrid_batch(
+    req: BatchSearchRequest,
+    bm25_ratio: float = 0.5,
+    rerank_mode: Optional[str] = None,
+    reranker: Optional[str] = None,
+    fusion: Optional[str] = None,
+    timeout_header: Optional[str] = Header(None, alias=DEADLINE_HEADER),
+):
+    """Run many hybrid searches in one call; ``results[i]`` answers ``requests[i]``.
+
+    Query options apply to every item. The timeout header is the default deadline for each
+    item, overridden by an item's own ``timeout_ms``. An item that is invalid or fails comes
+    back as ``{"ok": false, "error": ...}`` without affecting the others.
+    """
+    _validate_hybrid_options(bm25_ratio, rerank_mode, reranker, fusion)
+    if len(req.requests) > settings.batch_max_items:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"batch may contain at most {settings.batch_max_items} requests",
+        )
+    try:
+        default_timeout_ms = resolve_timeout_ms(timeout_header, None)
     except ValueError as ve:
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(ve)) from ve
 
-    if not 0.0 <= bm25_ratio <= 1.0:
-        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="bm25_ratio must be between 0.0 and 1.0")
+    items = []
+    invalid: Dict[int, str] = {}
+    for index, item in enumerate(req.requests):
+        try:
+            limit, fields, timeout_ms = _validate_search_request(item)
+        except HTTPException as exc:
+            invalid[index] = str(exc.detail)
+            continue
+        if item.timeout_ms is None:
+            timeout_ms = default_timeout_ms
+        items.append((index, (item.query, limit, fields, timeout_ms)))
 
     try:
-        res = await hybrid_search(req.query, limit, bm25_ratio)
-        return res
+        res = await hybrid_search_batch(
+            [item for _, item in items], bm25_ratio, rerank_mode=rerank_mode, reranker=reranker, fusion=fusion
+        )
     except Exception:
-        logger.exception("Hybrid search failed")
+        logger.exception("Batch hybrid search failed")
         raise HTTPException(status_code=500, detail="Hybrid search error")
 
+    results: List[Dict[str, Any]] = [{}] * len(req.requests)
+    for (index, _), result in zip(items, res["results"]):
+        results[index] = {**result, "index": index}
+    for index, detail in invalid.items():
+        results[index] = {"index": index, "ok": False, "error": detail}
+    return {**res, "results": results, "count": len(results), "failed": res["failed"] + len(invalid)}
+
+
+@app.get("/related/{doc_id}")
+async def related(
+    doc_id: str,
+    limit: Optional[int] = None,
+    bm25_ratio: float = 0.5,
+    fusion: Optional[str] = None,
+    fields: Optional[List[str]] = Query(None),
+    timeout_header: Optional[str] = Header(None, alias=DEADLINE_HEADER),
+):
+    """Stories related to a stored one, seeded by its stored embedding and key terms (no embedding call)."""
+    _validate_hybrid_options(bm25_ratio, None, None, fusion)
+    if fusion == "none":
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"fusion must be one of {', '.join(FUSION_STRATEGIES[1:])}",
+        )
+    try:
+        limit = validate_limit(limit if limit is not None else settings.default_limit)
+        fields = validate_fields(fields)
+        timeout_ms = resolve_timeout_ms(timeout_header, None)
+    except ValueError as ve:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(ve)) from ve
+    start_deadline(timeout_ms)
+    try:
+        return await related_documents(doc_id, limit, bm25_ratio, fusion=fusion, fields=fields)
+    except LookupError as exc:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(exc)) from exc
+    except Exception:
+        logger.exception("Related search failed")
+        raise HTTPException(status_code=500, detail="Related search error")
+    finally:
+        clear_deadline()
+
+
+def _search_results(docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [
+        SearchResult(
+            content=str(d.get("content") or ""),
+            score=float(d.get("final_score", d.get("score")) or 0.0),
+            metadata=d.get("metadata"),
+        ).model_dump()
+        for d in docs
+    ]
+
+
+def _format_event(event: str, payload: Dict[str, Any], fmt: str) -> str:
+    if fmt == "ndjson":
+        return json.dumps({"event": event, **payload}, default=str) + "\n"
+    return f"event: {event}\ndata: {json.dumps(payload, default=str)}\n\n"
+
+
+@app.post("/hybrid_search/stream")
+async def hybrid_stream(
+    req: SearchRequest,
+    bm25_ratio: float = 0.5,
+    rerank_mode: Optional[str] = None,
+    reranker: Optional[str] = None,
+    fusion: Optional[str] = None,
+    format: str = "sse",
+    timeout_header: Optional[str] = Header(None, alias=DEADLINE_HEADER),
+):
+    """Progressive hybrid search: ``bm25`` and ``vector`` hits as they arrive, then ``final``.
+
+    The two hit events come in completion order, so ``vector`` may precede ``bm25``; ``final``
+    is always last.
+
+    Every event carries ``results`` in the ``SearchResult`` shape; ``final`` adds ``params`` and
+    ``timings``. ``format=ndjson`` emits one JSON object per line instead of Server-Sent Events.
+    """
+    limit, fields, timeout_ms = _validate_search_request(req, timeout_header)
+    _validate_hybrid_options(bm25_ratio, rerank_mode, reranker, fusion)
+    if format not in ("sse", "ndjson"):
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="format must be one of sse, ndjson")
+
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def on_event(event: str, payload: Dict[str, Any]) -> None:
+        await queue.put((event, {**payload, "results": _search_results(payload["results"])}))
+
+    async def run() -> None:
+        start_deadline(timeout_ms)
+        try:
+            res = await hybrid_search(
+                req.query,
+                limit,
+                bm25_ratio,
+                rerank_mode=rerank_mode,
+                reranker=reranker,
+                fusion=fusion,
+                fields=fields,
+                on_event=on_event,
+            )
+            await queue.put(("final", {**res, "results": _search_results(res["results"])}))
+        except Exception:
+            logger.exception("Streaming hybrid search failed")
+            await queue.put(("error", {"detail": "Hybrid search error"}))
+
+    async def events():
+        task = asyncio.create_task(run())
+        try:
+            while True:
+                event, payload = await queue.get()
+                yield _format_event(event, payload, format)
+                if event in ("final", "error"):
+                    break
+        finally:
+            if not task.done():
+                task.cancel()
+
+    media_type = "application/x-ndjson" if format == "ndjson" else "text/event-stream"
+    return StreamingResponse(events(), media_type=media_type, headers={"Cache-Control": "no-cache"})
+
 
 @app.get("/health")
 async def health():
@@ -100,13 +363,24 @@ async def health():
         raise HTTPException(status_code=503, detail="MongoDB unreachable")
 
 
+@app.get("/metrics")
+async def metrics():
+    return JSONResponse({**metrics_snapshot(), "hydration_cache": hydration_cache_stats()})
+
+
+@app.get("/diagnostics/vector_candidates")
+async def vector_candidates():
+    """Current numCandidates policy per k-bucket with the recall it was measured at."""
+    return JSONResponse(candidate_policy_snapshot())
+
+
 @app.get("/embedding_test")
 async def embedding_test(text: str = "hello world"):
     try:
         loop = asyncio.get_running_loop()
-        t0 = asyncio.get_event_loop().time()
-        vec = await loop.run_in_executor(None, _get_embedding, text)
-        t1 = asyncio.get_event_loop().time()
+        t0 = loop.time()
+        vec = await _get_embedding(text)
+        t1 = loop.time()
         return JSONResponse({
             "ok": True,
             "model": settings.embedding_model,
@@ -0,0 +1,46 @@
+"""In-process counters and latency/size summaries exposed on the /metrics route."""
+from __future__ import annotations
+
+import threading
+from typing import Any, Dict
+
+_lock = threading.Lock()
+_counters: Dict[str, float] = {}
+_gauges: Dict[str, float] = {}
+_summaries: Dict[str, Dict[str, float]] = {}
+
+
+def increment(name: str, value: float = 1.0) -> None:
+    with _lock:
+        _counters[name] = _counters.get(name, 0.0) + value
+
+
+def set_gauge(name: str, value: float) -> None:
+    with _lock:
+        _gauges[name] = float(value)
+
+
+def observe(name: str, value: float) -> None:
+    """Record one sample into a count/sum/min/max summary."""
+    value = float(value)
+    with _lock:
+        summary = _summaries.get(name)
+        if summary is None:
+            _summaries[name] = {"count": 1, "sum": value, "min": value, "max": value}
+            return
+        summary["count"] += 1
+        summary["sum"] += value
+        summary["min"] = min(summary["min"], value)
+        summary["max"] = max(summary["max"], value)
+
+
+def snapshot() -> Dict[str, Any]:
+    with _lock:
+        summaries = {
+            name: {**values, "avg": values["sum"] / values["count"] if values["count"] else 0.0}
+            for name, values in _summaries.items()
+        }
+        return {"counters": dict(_counters), "gauges": dict(_gauges), "summaries": summaries}
+
+
+__all__ = ["increment", "set_gauge", "observe", "snapshot"]
@@ -0,0 +1,94 @@
+"""Micro-batching coalescer that merges concurrent submissions into one dispatch call.
+
+Embedding lookups and multi-query rerank prompts both use it; each supplies the dispatch
+callback and, where items differ in cost, a size function for the batch bound.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Awaitable, Callable, Generic, List, Optional, Set, Tuple, TypeVar
+
+from . import metrics
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+Dispatch = Callable[[List[T]], Awaitable[List[R]]]
+
+
+class MicroBatcher(Generic[T, R]):
+    """Collect items for up to ``window_ms`` (or until their total ``size`` reaches ``max_size``) and dispatch them together.
+
+    ``dispatch`` receives the items in submission order and must return one result per item.
+    Metrics are reported as ``<metric_prefix>_batches_total`` and ``<metric_prefix>_batch_wait_ms``.
+    """
+
+    def __init__(
+        self,
+        dispatch: Dispatch,
+        window_ms: float,
+        max_size: int,
+        metric_prefix: str,
+        size: Callable[[T], int] = lambda _item: 1,
+    ) -> None:
+        self._dispatch_fn = dispatch
+        self._window_s = max(0.0, window_ms) / 1000.0
+        self._max_size = max(1, max_size)
+        self._metric_prefix = metric_prefix
+        self._size = size
+        self._pending: List[Tuple[T, asyncio.Future, float]] = []
+        self._pending_size = 0
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._inflight: Set[asyncio.Task] = set()
+
+    async def submit(self, item: T) -> R:
+        loop = asyncio.get_running_loop()
+        size = self._size(item)
+        if self._pending and self._pending_size + size > self._max_size:
+            self._flush()
+        future: asyncio.Future = loop.create_future()
+        self._pending.append((item, future, time.perf_counter()))
+        self._pending_size += size
+        if self._pending_size >= self._max_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self._window_s, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        self._pending_size = 0
+        if not batch:
+            return
+        task = asyncio.create_task(self._dispatch(batch))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch: List[Tuple[T, asyncio.Future, float]]) -> None:
+        dispatched_at = time.perf_counter()
+        metrics.increment(f"{self._metric_prefix}_batches_total")
+        for _, _, queued_at in batch:
+            metrics.observe(f"{self._metric_prefix}_batch_wait_ms", (dispatched_at - queued_at) * 1000)
+
+        try:
+            results = await self._dispatch_fn([item for item, _, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(
+                    f"{self._metric_prefix} batch returned {len(results)} results for {len(batch)} inputs"
+                )
+        except Exception as exc:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+
+        for (_, future, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+__all__ = ["MicroBatcher"]
@@ -6,6 +6,16 @@ from pydantic import BaseModel, Field
 class SearchRequest(BaseModel):
     query: str = Field(..., min_length=1, description="Search query text")
     limit: Optional[int] = Field(None, ge=1, le=100, description="Maximum number of results to return")
+    fields: Optional[List[str]] = Field(
+        None, description="Top-level document fields to return in metadata; defaults to all but excluded heavy fields"
+    )
+    timeout_ms: Optional[int] = Field(
+        None, ge=1, description="Request deadline in milliseconds; the X-Request-Timeout-Ms header takes precedence"
+    )
+
+
+class BatchSearchRequest(BaseModel):
+    requests: List[SearchRequest] = Field(..., min_length=1, description="Searches to run, answered in the same order")
 
 
 class SearchResult(BaseModel):
@@ -17,3 +27,4 @@ class SearchResult(BaseModel):
 class SearchResponse(BaseModel):
     results: List[SearchResult]
     total_count: int
+    degraded: List[Dict[str, str]] = Field(default_factory=list)
@@ -0,0 +1,178 @@
+"""Single-aggregation hybrid retrieval: $vectorSearch + $unionWith($search), or $rankFusion."""
+from __future__ import annotations
+
+import logging
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .Bm25 import build_search_pipeline, build_search_stage, count_from_meta, search_with_atlas_pipeline
+from .candidate_tuning import record_vector_query
+from .config import HYBRID_EXECUTION_MODES, settings
+from .db import get_collection
+from .hydration import hydrate
+from .normalize import normalize_query_text
+from .projection import document_from_result, id_projection_stages, result_projection_stages, stored_source_fields
+from .request_context import mark_degraded, mongo_time_limit
+from .vector_search import build_vector_pipeline, build_vector_stage, get_embedding
+
+
+logger = logging.getLogger("uvicorn.error")
+
+NativeResult = Tuple[List[Dict[str, Any]], int, List[Dict[str, Any]], int, str]
+
+
+def _union_pipeline(
+    query: str, embedding: List[float], fetch_bm25: int, fetch_vector: int, fields: Optional[Sequence[str]]
+) -> List[Dict[str, Any]]:
+    vector_branch = build_vector_pipeline(embedding, fetch_vector, fields) + [{"$set": {"_source": "vector"}}]
+    bm25_branch = build_search_pipeline(query, fetch_bm25, fields) + [{"$set": {"_source": "bm25"}}]
+    group_key = "$_id" if settings.result_source == "ids" else "$document._id"
+
+    def _score_for(source: str) -> Dict[str, Any]:
+        return {"$max": {"$cond": [{"$eq": ["$_source", source]}, "$score", None]}}
+
+    return [
+        *vector_branch,
+        {"$unionWith": {"coll": settings.collection_name, "pipeline": bm25_branch}},
+        # Server-side dedup: one row per document with each source's score tagged separately.
+        {
+            "$group": {
+                "_id": group_key,
+                "vector_score": _score_for("vector"),
+                "bm25_score": _score_for("bm25"),
+                "meta": {"$max": "$meta"},
+                "document": {"$first": "$document"},
+            }
+        },
+    ]
+
+
+def _rank_fusion_pipeline(
+    query: str,
+    embedding: List[float],
+    fetch_bm25: int,
+    fetch_vector: int,
+    bm25_ratio: float,
+    fields: Optional[Sequence[str]] = None,
+) -> List[Dict[str, Any]]:
+    details = {"details": {"$meta": "scoreDetails"}}
+    if settings.result_source == "ids":
+        projection = id_projection_stages("score", details)
+    else:
+        # $rankFusion has no returnStoredSource; project like $vectorSearch does.
+        projection = result_projection_stages("score", fields or stored_source_fields(fields), details)
+    return [
+        {
+            "$rankFusion": {
+                "input": {
+                    "pipelines": {
+                        "vector": [build_vector_stage(embedding, fetch_vector)],
+                        "bm25": [build_search_stage(query), {"$limit": fetch_bm25}],
+                    }
+                },
+                "combination": {"weights": {"vector": 1.0 - bm25_ratio, "bm25": bm25_ratio}},
+                "scoreDetails": True,
+            }
+        },
+        {"$limit": fetch_bm25 + fetch_vector},
+        *projection,
+    ]
+
+
+def _rank_fusion_sources(details: Dict[str, Any], fused: float) -> Dict[str, float]:
+    """Map input pipeline name -> that pipeline's score for pipelines that ranked the document."""
+    sources: Dict[str, float] = {}
+    for entry in (details or {}).get("details") or []:
+        name = entry.get("inputPipelineName")
+        if name and entry.get("rank"):
+            value = entry.get("value")
+            sources[name] = float(value) if isinstance(value, (int, float)) else fused
+    return sources
+
+
+async def search_native_hybrid(
+    query: str,
+    fetch_bm25: int,
+    fetch_vector: int,
+    mode: str,
+    bm25_ratio: float = 0.5,
+    fields: Optional[Sequence[str]] = None,
+) -> NativeResult:
+    """Run BM25 and vector retrieval in one aggregation and split the hits back per source.
+
+    Returns ``(bm25_docs, bm25_total, vector_docs, vector_total, operator)`` in the same shape the
+    two-query path produces, so downstream normalization/dedup/rerank is unchanged.
+    """
+    query = normalize_query_text(query)
+    if not query:
+        return [], 0, [], 0, mode
+    try:
+        embedding = await get_embedding(query)
+    except Exception as exc:
+        # Without a query vector there is no single aggregation to run; keep the BM25 hits.
+        logger.warning("Embedding failed (%s); native hybrid falls back to BM25 only", exc)
+        mark_degraded("vector", f"embedding failed: {type(exc).__name__}")
+        bm25_docs, bm25_total = await search_with_atlas_pipeline(query, fetch_bm25, fields)
+        return bm25_docs, bm25_total, [], 0, "$search"
+    record_vector_query(embedding, fetch_vector)
+
+    if mode == "rank_fusion":
+        pipeline = _rank_fusion_pipeline(query, embedding, fetch_bm25, fetch_vector, bm25_ratio, fields)
+        operator = "$rankFusion"
+    else:
+        pipeline = _union_pipeline(query, embedding, fetch_bm25, fetch_vector, fields)
+        operator = "$vectorSearch+$unionWith($search)"
+
+    rows: List[Dict[str, Any]] = [row async for row in get_collection().aggregate(pipeline, **mongo_time_limit())]
+
+    tagged: List[Tuple[Dict[str, Any], Dict[str, float]]] = []
+    bm25_total: Optional[int] = None
+    if settings.result_source == "ids":
+        hits = [(row["_id"], row.get("score", 0.0) if mode == "rank_fusion" else 0.0) for row in rows]
+        hydrated = {str(doc["metadata"].get("_id")): doc for doc in await hydrate(hits, fields)}
+        for row in rows:
+            doc = hydrated.get(str(row["_id"]))
+            if mode == "rank_fusion":
+                if doc is not None:
+                    doc["metadata"]["rank_fusion_score"] = doc["score"]
+                    tagged.append((doc, _rank_fusion_sources(row.get("details") or {}, doc["score"])))
+                continue
+            if doc is not None:
+                tagged.append((doc, _union_sources(row)))
+            bm25_total = bm25_total if bm25_total is not None else count_from_meta(row)
+    else:
+        for row in rows:
+            doc = document_from_result(row)
+            if mode == "rank_fusion":
+                sources = _rank_fusion_sources(row.get("details") or {}, doc["score"])
+                doc["metadata"]["rank_fusion_score"] = doc["score"]
+            else:
+                sources = _union_sources(row)
+                bm25_total = bm25_total if bm25_total is not None else count_from_meta(row)
+            tagged.append((doc, sources))
+
+    bm25_docs: List[Dict[str, Any]] = []
+    vector_docs: List[Dict[str, Any]] = []
+    for doc, sources in tagged:
+        if "bm25" in sources:
+            bm25_docs.append({**doc, "score": sources["bm25"]})
+        if "vector" in sources:
+            vector_docs.append({**doc, "score": sources["vector"]})
+    bm25_docs.sort(key=lambda d: d["score"], reverse=True)
+    vector_docs.sort(key=lambda d: d["score"], reverse=True)
+
+    logger.info(
+        "native hybrid operator=%s returned bm25=%d vector=%d", operator, len(bm25_docs), len(vector_docs)
+    )
+    return bm25_docs, max(bm25_total or 0, len(bm25_docs)), vector_docs, len(vector_docs), operator
+
+
+def _union_sources(row: Dict[str, Any]) -> Dict[str, float]:
+    sources: Dict[str, float] = {}
+    for name in ("bm25", "vector"):
+        value = row.get(f"{name}_score")
+        if isinstance(value, (int, float)):
+            sources[name] = float(value)
+    return sources
+
+
+__all__ = ["HYBRID_EXECUTION_MODES", "search_native_hybrid"]
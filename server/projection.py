@@ -0,0 +1,90 @@
+"""Aggregation result projection shared by the BM25 and vector pipelines."""
+from __future__ import annotations
+
+import re
+from typing import Any, Dict, List, Optional, Sequence
+
+from .config import settings
+from .normalize import normalize_acceptance_metadata, sanitize_metadata
+
+CONTENT_FIELDS = ("content", "text", "summary")
+_FIELD_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def validate_fields(fields: Optional[Sequence[str]]) -> Optional[List[str]]:
+    """Return the requested top-level field names, rejecting paths and operators."""
+    if not fields:
+        return None
+    cleaned: List[str] = []
+    for field in fields:
+        if not isinstance(field, str) or not _FIELD_RE.match(field):
+            raise ValueError(f"invalid field name: {field!r}")
+        if field not in cleaned:
+            cleaned.append(field)
+    return cleaned
+
+
+def result_projection_stages(
+    score_meta: str,
+    fields: Optional[Sequence[str]] = None,
+    extra: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    """Build the stages that shape each hit as ``{"score", "document"}`` inside the aggregation.
+
+    Heavy fields (``settings.result_exclude_fields``, the embedding by default) are removed on
+    the server so they never cross the wire. With ``fields`` only ``_id``, the content fields
+    and the requested fields are kept. ``extra`` adds computed top-level fields to each hit.
+    """
+    score = {"$meta": score_meta}
+    extra = extra or {}
+    excluded = set(settings.result_exclude_fields or [])
+    if fields:
+        keep = [f for f in dict.fromkeys(["_id", *CONTENT_FIELDS, *fields]) if f not in excluded]
+        return [{"$project": {"_id": 0, "score": score, **extra, "document": {f: f"${f}" for f in keep}}}]
+    stages: List[Dict[str, Any]] = []
+    if excluded:
+        stages.append({"$unset": sorted(excluded)})
+    stages.append({"$project": {"score": score, **extra, "document": "$$ROOT"}})
+    return stages
+
+
+def stored_source_fields(fields: Optional[Sequence[str]] = None) -> Optional[List[str]]:
+    """Return the stored-source field list to use, or ``None`` when stored source cannot serve the request.
+
+    Stored source only applies with ``RESULT_SOURCE=stored`` and when every requested field is
+    part of the index's configured ``storedSource`` definition.
+    """
+    if settings.result_source != "stored" or not settings.stored_source_fields:
+        return None
+    stored = list(settings.stored_source_fields)
+    if fields and not set(fields) <= set(stored) | set(CONTENT_FIELDS) | {"_id"}:
+        return None
+    return stored
+
+
+def id_projection_stages(score_meta: str, extra: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Return only ``_id`` and the score; bodies are hydrated separately."""
+    return [{"$project": {"_id": 1, "score": {"$meta": score_meta}, **(extra or {})}}]
+
+
+def document_from_result(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert one projected aggregation hit into the service's ``{content, score, metadata}`` shape."""
+    root = doc.get("document", {}) or {}
+    content = root.get("content") or root.get("text") or root.get("summary") or ""
+    metadata = {k: v for k, v in root.items() if k not in {"content", "text", "summary", "embedding"}}
+    metadata = normalize_acceptance_metadata(sanitize_metadata(metadata))
+    return {
+        "content": content,
+        "score": float(doc.get("score", 0.0) or 0.0),
+        "metadata": metadata,
+    }
+
+
+__all__ = [
+    "CONTENT_FIELDS",
+    "validate_fields",
+    "result_projection_stages",
+    "id_projection_stages",
+    "stored_source_fields",
+    "document_from_result",
+]
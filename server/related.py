@@ -0,0 +1,149 @@
+"""Related-story retrieval seeded by a stored document instead of query text.
+
+The document's own ``embedding`` drives vector retrieval, so no embedding call is made, and
+the lexical side searches a handful of its most distinctive terms rather than its full text.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import Any, Awaitable, Dict, List, Optional, Sequence, Tuple
+
+from bson import ObjectId
+
+from . import metrics
+from .config import settings
+from .db import get_collection
+from .dedup import identifier_for_doc, prepare_document
+from .fusion import fuse_results
+from .local_bm25 import get_local_bm25, local_bm25_ready
+from .local_rerank import tokenize
+from .request_context import degraded_stages, mark_degraded, mongo_time_limit
+from .search_service import search_bm25, search_vector
+
+
+logger = logging.getLogger("uvicorn.error")
+
+
+def _id_candidates(doc_id: str) -> List[Any]:
+    """Path ids are strings; stories keyed by ObjectId need the parsed form as well."""
+    return [ObjectId(doc_id), doc_id] if ObjectId.is_valid(doc_id) else [doc_id]
+
+
+def key_terms(text: str, max_terms: int) -> List[str]:
+    """Pick the document's most distinctive terms for a short ``$search`` query.
+
+    Terms are ranked by tf-idf when the local BM25 index is loaded (its document frequencies
+    are free to read), otherwise by frequency with longer terms first on ties.
+    """
+    counts = Counter(tokenize(text))
+    if not counts or max_terms <= 0:
+        return []
+    index = get_local_bm25() if local_bm25_ready() else None
+    if index is not None:
+        weight = {term: tf * index.idf(term) for term, tf in counts.items()}
+    else:
+        weight = {term: float(tf) for term, tf in counts.items()}
+    ranked = sorted(counts, key=lambda term: (-weight[term], -len(term), term))
+    return ranked[:max_terms]
+
+
+async def load_source(doc_id: str) -> Optional[Dict[str, Any]]:
+    """Fetch the seed document's ``_id``, ``embedding`` and search fields, or ``None`` if absent."""
+    projection = {"embedding": 1, **{field: 1 for field in settings.search_fields or ["text"]}}
+    return await get_collection().find_one(
+        {"_id": {"$in": _id_candidates(doc_id)}}, projection, **mongo_time_limit(find=True)
+    )
+
+
+async def _retrieve(label: str, awaitable: Optional[Awaitable[Tuple]]) -> Tuple[List[Dict[str, Any]], float, Optional[str]]:
+    """Run one retriever, degrading to no hits on failure; ``None`` means the side is disabled."""
+    if awaitable is None:
+        return [], 0.0, None
+    start = time.perf_counter()
+    operator = None
+    try:
+        result = await awaitable
+        docs = result[0]
+        operator = result[2] if len(result) > 2 else None
+    except Exception as exc:
+        logger.warning("Related %s retrieval failed: %s", label, exc)
+        mark_degraded(label, f"retrieval failed: {type(exc).__name__}")
+        docs = []
+    return docs, (time.perf_counter() - start) * 1000, operator
+
+
+async def related_documents(
+    doc_id: str,
+    limit: int,
+    bm25_ratio: float = 0.5,
+    fusion: Optional[str] = None,
+    fields: Optional[Sequence[str]] = None,
+) -> Dict[str, Any]:
+    """Stories related to ``doc_id``: its stored vector and key terms, fused, with the seed itself removed.
+
+    Raises ``LookupError`` when the document does not exist.
+    """
+    fusion = fusion or settings.related_fusion
+    timings: Dict[str, float] = {}
+    wall_start = time.perf_counter()
+
+    source = await load_source(doc_id)
+    timings["load_ms"] = (time.perf_counter() - wall_start) * 1000
+    if source is None:
+        raise LookupError(f"document {doc_id} not found")
+    self_id = str(source["_id"])
+
+    text = " ".join(str(source.get(field) or "") for field in settings.search_fields or ["text"])
+    terms = key_terms(text, settings.related_key_terms)
+    embedding = source.get("embedding")
+    if not embedding and bm25_ratio < 1.0:
+        mark_degraded("vector", "document has no stored embedding")
+
+    # One extra hit per side makes room for the seed, which both retrievers usually return first.
+    fetch = limit + 1
+    bm25_call = search_bm25(" ".join(terms), fetch, fields) if terms and bm25_ratio > 0 else None
+    vector_call = search_vector("", fetch, fields, embedding=list(embedding)) if embedding and bm25_ratio < 1.0 else None
+    (bm25_docs, timings["bm25_ms"], _), (vec_docs, timings["vector_ms"], vec_operator) = await asyncio.gather(
+        _retrieve("bm25", bm25_call), _retrieve("vector", vector_call)
+    )
+
+    bm25_docs = [doc for doc in bm25_docs if identifier_for_doc(doc) != self_id]
+    vec_docs = [doc for doc in vec_docs if identifier_for_doc(doc) != self_id]
+
+    fusion_start = time.perf_counter()
+    fused = fuse_results(
+        {"bm25": bm25_docs, "vector": vec_docs},
+        fusion,
+        weights={"bm25": bm25_ratio, "vector": 1.0 - bm25_ratio},
+        rrf_k=settings.fusion_rrf_k,
+    )
+    results = []
+    for doc in fused[:limit]:
+        prepared = prepare_document(doc, doc.get("source", "hybrid"))
+        prepared["final_score"] = float(prepared.get("score", 0.0))
+        results.append(prepared)
+    timings["fusion_ms"] = (time.perf_counter() - fusion_start) * 1000
+    timings["total_ms"] = (time.perf_counter() - wall_start) * 1000
+    metrics.increment("related_requests_total")
+
+    return {
+        "results": results,
+        "total_count": len(results),
+        "params": {
+            "doc_id": self_id,
+            "limit": limit,
+            "bm25_ratio": bm25_ratio,
+            "fusion": fusion,
+            "fields": list(fields) if fields else None,
+            "key_terms": terms,
+            "vector_operator": vec_operator,
+        },
+        "timings": timings,
+        "degraded": degraded_stages(),
+    }
+
+
+__all__ = ["key_terms", "load_source", "related_documents"]
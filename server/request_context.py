@@ -0,0 +1,161 @@
+"""Per-request deadline shared by every pipeline stage.
+
+Endpoints start a deadline from the ``X-Request-Timeout-Ms`` header or the body's ``timeout_ms``
+(falling back to ``settings.request_timeout_ms``). Stages read the remaining budget from the
+context: Mongo gets it as ``maxTimeMS``, outbound HTTP calls as their timeout, and optional
+stages are skipped once too little is left. Anything cut short is recorded so the response can
+report which stages were degraded.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import math
+import time
+from typing import Any, Awaitable, Dict, List, Optional, TypeVar
+
+from .config import settings
+
+T = TypeVar("T")
+
+DEADLINE_HEADER = "X-Request-Timeout-Ms"
+
+
+class DeadlineExceeded(Exception):
+    """A stage ran out of request budget."""
+
+    def __init__(self, stage: str) -> None:
+        super().__init__(f"request deadline exceeded during {stage}")
+        self.stage = stage
+
+
+class Deadline:
+    def __init__(self, budget_ms: float) -> None:
+        self.budget_ms = budget_ms
+        self.expires_at = time.monotonic() + budget_ms / 1000.0
+        self.degraded: List[Dict[str, str]] = []
+
+    def remaining(self) -> float:
+        """Seconds left, never negative."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def remaining_ms(self) -> int:
+        return int(self.remaining() * 1000)
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0.0
+
+    def degrade(self, stage: str, reason: str) -> None:
+        if not any(entry["stage"] == stage for entry in self.degraded):
+            self.degraded.append({"stage": stage, "reason": reason})
+
+
+_deadline: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar("request_deadline", default=None)
+
+
+def resolve_timeout_ms(header_value: Optional[str], body_value: Optional[int]) -> float:
+    """Pick the request budget: header, then body, then the configured default; capped at the maximum."""
+    timeout: Optional[float] = None
+    if header_value:
+        try:
+            timeout = float(header_value)
+        except ValueError as exc:
+            raise ValueError(f"{DEADLINE_HEADER} must be a number of milliseconds") from exc
+        # float() accepts "nan" and "inf"; NaN would slip past every comparison below.
+        if not math.isfinite(timeout):
+            raise ValueError(f"{DEADLINE_HEADER} must be a finite number of milliseconds")
+    elif body_value is not None:
+        timeout = float(body_value)
+    if timeout is None:
+        timeout = float(settings.request_timeout_ms)
+    if timeout <= 0:
+        raise ValueError("timeout_ms must be > 0")
+    return min(timeout, float(settings.max_request_timeout_ms))
+
+
+def start_deadline(timeout_ms: float) -> Deadline:
+    deadline = Deadline(timeout_ms)
+    _deadline.set(deadline)
+    return deadline
+
+
+def clear_deadline() -> None:
+    _deadline.set(None)
+
+
+def get_deadline() -> Optional[Deadline]:
+    return _deadline.get()
+
+
+def budget_bucket() -> Optional[int]:
+    """Power-of-two bucket of the remaining budget in ms, so shared work is only joined by similar deadlines."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline.remaining_ms().bit_length()
+
+
+def remaining_seconds(default: float) -> float:
+    """The smaller of a stage's own timeout and the request's remaining budget."""
+    deadline = _deadline.get()
+    return default if deadline is None else min(default, deadline.remaining())
+
+
+def has_budget(min_ms: float = 0.0) -> bool:
+    deadline = _deadline.get()
+    return deadline is None or deadline.remaining() * 1000 > min_ms
+
+
+def mongo_time_limit(find: bool = False) -> Dict[str, Any]:
+    """Server-side time limit keyword for Motor ``aggregate`` (or ``find``), empty without a deadline."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return {}
+    return {"max_time_ms" if find else "maxTimeMS": max(1, deadline.remaining_ms())}
+
+
+def mark_degraded(stage: str, reason: str) -> None:
+    deadline = _deadline.get()
+    if deadline is not None:
+        deadline.degrade(stage, reason)
+
+
+def degraded_stages() -> List[Dict[str, str]]:
+    deadline = _deadline.get()
+    return list(deadline.degraded) if deadline is not None else []
+
+
+async def within_deadline(stage: str, awaitable: Awaitable[T], default_timeout: Optional[float] = None) -> T:
+    """Await ``awaitable`` for at most the remaining budget (and ``default_timeout`` if given)."""
+    deadline = _deadline.get()
+    timeout = default_timeout
+    if deadline is not None:
+        if deadline.expired():
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            mark_degraded(stage, "budget exhausted before start")
+            raise DeadlineExceeded(stage)
+        timeout = deadline.remaining() if timeout is None else min(timeout, deadline.remaining())
+    if timeout is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, timeout=timeout)
+    except asyncio.TimeoutError as exc:
+        mark_degraded(stage, "timed out")
+        raise DeadlineExceeded(stage) from exc
+
+
+__all__ = [
+    "DEADLINE_HEADER",
+    "Deadline",
+    "DeadlineExceeded",
+    "resolve_timeout_ms",
+    "start_deadline",
+    "clear_deadline",
+    "get_deadline",
+    "budget_bucket",
+    "remaining_seconds",
+    "has_budget",
+    "mongo_time_limit",
+    "mark_degraded",
+    "degraded_stages",
+    "within_deadline",
+]
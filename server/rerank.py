@@ -1,20 +1,36 @@
 """Groq-based reranking and score normalization utilities."""
 from __future__ import annotations
 
+import asyncio
+import contextvars
 import json
 import logging
-import math
 import time
-from typing import Any, Dict, List
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 
-import requests
+import numpy as np
 
+from . import metrics
 from .config import settings
-from .normalize import normalize_acceptance_metadata, sanitize_metadata
+from .dedup import identifier_for_doc
+from .distilled_rerank import capture_scores, distilled_rerank
+from .fusion import normalize_max
+from .http_client import get_rerank_client
+from .local_rerank import local_rerank
+from .micro_batcher import MicroBatcher
+from .normalize import normalize_acceptance_metadata, normalize_query_text, sanitize_metadata
+from .request_context import DeadlineExceeded, has_budget, mark_degraded, within_deadline
+from .ttl_cache import TTLCache
 
 
 logger = logging.getLogger("uvicorn.error")
 
+Reranker = Callable[[str, List[Dict[str, Any]], int, str], Awaitable[List[Dict[str, Any]]]]
+# One section of a multi-query prompt = (query, group, candidates); it is scored to an ``{idx: score}`` map.
+Section = Tuple[str, str, List[Dict[str, Any]]]
+
+_score_cache: TTLCache[float] = TTLCache(settings.rerank_cache_max_entries, settings.rerank_cache_ttl_seconds)
+
 
 def groq_available() -> bool:
     return bool(settings.groq_api_key and settings.groq_model)
@@ -29,19 +45,22 @@ def _truncate(text: str, limit: int = 500) -> str:
     return text[:limit] + "…"
 
 
-def groq_rerank(query: str, docs: List[Dict[str, Any]], top_k: int, group: str) -> List[Dict[str, Any]]:
-    if top_k <= 0 or not docs:
-        return []
+def _format_candidates(candidates: List[Dict[str, Any]]) -> str:
+    return "\n".join(
+        f"{idx}: "
+        + _truncate(candidate.get("content"))
+        + (
+            " | metadata: "
+            + _truncate(json.dumps(candidate.get("metadata", {})))
+            if candidate.get("metadata")
+            else ""
+        )
+        for idx, candidate in enumerate(candidates)
+    )
 
-    fallback = sorted(docs, key=lambda x: x.get("score", 0.0), reverse=True)[:top_k]
 
-    if not groq_available():
-        return _enrich_with_local_scores(fallback)
-
-    base_url = (settings.groq_api_base or "https://api.groq.com/openai/v1").rstrip("/")
-    url = f"{base_url}/chat/completions"
-    payload_candidates = docs[: min(len(docs), max(top_k * 2, top_k))]
-    payload = {
+def _build_payload(query: str, group: str, candidates: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
         "model": settings.groq_model,
         "temperature": 0,
         "messages": [
@@ -60,42 +79,186 @@ def groq_rerank(query: str, docs: List[Dict[str, Any]], top_k: int, group: str)
                     + "\nGroup: "
                     + group
                     + "\nCandidates:\n"
-                    + "\n".join(
-                        f"{idx}: "
-                        + _truncate(candidate.get("content"))
-                        + (
-                            " | metadata: "
-                            + _truncate(json.dumps(candidate.get("metadata", {})))
-                            if candidate.get("metadata")
-                            else ""
-                        )
-                        for idx, candidate in enumerate(payload_candidates)
-                    )
+                    + _format_candidates(candidates)
                     + "\nReturn JSON with an entry for each candidate."
                 ),
             },
         ],
     }
 
+
+def _build_batch_payload(sections: List[Section]) -> Dict[str, Any]:
+    """One prompt scoring several (query, candidates) sections independently."""
+    body = "\n\n".join(
+        f"Section {number}\nQuery: {query}\nGroup: {group}\nCandidates:\n{_format_candidates(candidates)}"
+        for number, (query, group, candidates) in enumerate(sections)
+    )
+    return {
+        "model": settings.groq_model,
+        "temperature": 0,
+        "messages": [
+            {
+                "role": "system",
+                "content": (
+                    "You score search results for relevance on a scale from 0 to 1. Each section has its own "
+                    "query; score its candidates against that query only. Respond with JSON:"
+                    "{\"sections\":[{\"section\":int,\"scores\":[{\"idx\":int,\"score\":float}]}]}."
+                ),
+            },
+            {
+                "role": "user",
+                "content": body + "\n\nReturn JSON with an entry for each candidate of every section.",
+            },
+        ],
+    }
+
+
+async def _post_completion(payload: Dict[str, Any]) -> Any:
+    base_url = (settings.groq_api_base or "https://api.groq.com/openai/v1").rstrip("/")
+    url = f"{base_url}/chat/completions"
     headers = {
         "Authorization": f"Bearer {settings.groq_api_key}",
         "Content-Type": "application/json",
     }
+    resp = await get_rerank_client().post(url, headers=headers, json=payload)
+    resp.raise_for_status()
+    content = resp.json().get("choices", [{}])[0].get("message", {}).get("content", "")
+    return json.loads(content)
+
+
+def _parse_scores(scores: Any) -> Dict[int, float]:
+    score_map: Dict[int, float] = {}
+    for entry in scores or []:
+        idx = entry.get("idx")
+        score = entry.get("score")
+        if isinstance(idx, int) and isinstance(score, (int, float)):
+            score_map[idx] = float(score)
+    return score_map
+
+
+async def _request_scores(payload: Dict[str, Any]) -> Dict[int, float]:
+    parsed = await _post_completion(payload)
+    return _parse_scores(parsed.get("scores") if isinstance(parsed, dict) else parsed)
+
+
+async def _request_section_scores(sections: List[Section]) -> List[Dict[int, float]]:
+    """Score several queries' candidates in one completion.
+
+    Sections the model leaves out are retried on their own prompts; one that still fails comes
+    back empty and its caller degrades to retriever scores.
+    """
+    metrics.observe("rerank_batch_sections", len(sections))
+    parsed = await _post_completion(_build_batch_payload(sections))
+    metrics.increment("groq_calls_total")
+    by_section: Dict[int, Dict[int, float]] = {}
+    for entry in (parsed.get("sections") if isinstance(parsed, dict) else parsed) or []:
+        number = entry.get("section") if isinstance(entry, dict) else None
+        if isinstance(number, int) and 0 <= number < len(sections):
+            scores = _parse_scores(entry.get("scores"))
+            if scores:
+                by_section[number] = scores
+    missing = [number for number in range(len(sections)) if number not in by_section]
+    if missing:
+        metrics.increment("groq_section_retries_total", len(missing))
+        metrics.increment("groq_calls_total", len(missing))
+        retries = await asyncio.gather(
+            *(_request_scores(_build_payload(*sections[number])) for number in missing), return_exceptions=True
+        )
+        for number, scores in zip(missing, retries):
+            if isinstance(scores, BaseException):
+                logger.warning("Groq rerank retry for batched section %d failed: %s", number, scores)
+                continue
+            by_section[number] = scores
+    return [by_section.get(number, {}) for number in range(len(sections))]
+
+
+# Bulk callers opt in to sharing one prompt across queries; interactive requests keep their own.
+_batched_prompts: contextvars.ContextVar[bool] = contextvars.ContextVar("rerank_batched_prompts", default=False)
+_BATCHER: Optional[MicroBatcher[Section, Dict[int, float]]] = None
+
+
+def _get_batcher() -> MicroBatcher[Section, Dict[int, float]]:
+    global _BATCHER
+    if _BATCHER is None:
+        # Prompts are bounded by candidate count, so a section weighs as many candidates as it carries.
+        _BATCHER = MicroBatcher(
+            _request_section_scores,
+            window_ms=settings.rerank_batch_window_ms,
+            max_size=settings.rerank_batch_max_candidates,
+            metric_prefix="rerank",
+            size=lambda section: len(section[2]),
+        )
+    return _BATCHER
+
+
+def enable_batched_prompts() -> contextvars.Token:
+    """Route Groq scoring in this context (and tasks it spawns) through the multi-query batcher."""
+    return _batched_prompts.set(True)
+
+
+def reset_batched_prompts(token: contextvars.Token) -> None:
+    _batched_prompts.reset(token)
+
+
+def _score_cache_key(query: str, candidate: Dict[str, Any]) -> Tuple[str, str, str]:
+    return (normalize_query_text(query), identifier_for_doc(candidate), settings.groq_model or "")
+
+
+async def groq_rerank(query: str, docs: List[Dict[str, Any]], top_k: int, group: str) -> List[Dict[str, Any]]:
+    if top_k <= 0 or not docs:
+        return []
+
+    fallback = sorted(docs, key=lambda x: x.get("score", 0.0), reverse=True)[:top_k]
+
+    if not groq_available():
+        return _enrich_with_local_scores(fallback)
+
+    payload_candidates = docs[: min(len(docs), max(top_k * 2, top_k))]
+
+    # Temperature 0 makes scores stable per (query, doc, model); only cache misses go into the prompt.
+    score_map: Dict[int, float] = {}
+    cached_idx = set()
+    misses: List[int] = []
+    for idx, candidate in enumerate(payload_candidates):
+        cached = _score_cache.get(_score_cache_key(query, candidate))
+        if cached is None:
+            misses.append(idx)
+        else:
+            score_map[idx] = cached
+            cached_idx.add(idx)
+    metrics.increment("rerank_cache_hits", len(cached_idx))
+    metrics.increment("rerank_cache_misses", len(misses))
 
     try:
         start = time.perf_counter()
-        resp = requests.post(url, headers=headers, json=payload, timeout=20)
-        resp.raise_for_status()
+        if misses:
+            if not has_budget(settings.rerank_min_budget_ms):
+                mark_degraded("rerank", "skipped: request budget nearly exhausted")
+                raise DeadlineExceeded("rerank")
+            miss_candidates = [payload_candidates[idx] for idx in misses]
+            if _batched_prompts.get():
+                request = _get_batcher().submit((query, group, miss_candidates))
+            else:
+                request = _request_scores(_build_payload(query, group, miss_candidates))
+                metrics.increment("groq_calls_total")
+            miss_scores = await within_deadline("rerank", request, settings.groq_timeout_seconds)
+            if not miss_scores:
+                mark_degraded("rerank", "model returned no scores; kept retriever scores")
+            capture_scores(
+                query,
+                payload_candidates,
+                {idx: miss_scores[local_idx] for local_idx, idx in enumerate(misses) if local_idx in miss_scores},
+                group,
+            )
+            for local_idx, idx in enumerate(misses):
+                score = miss_scores.get(local_idx)
+                if score is None:
+                    continue
+                score_map[idx] = score
+                _score_cache.set(_score_cache_key(query, payload_candidates[idx]), score)
+        else:
+            metrics.increment("groq_calls_skipped")
         elapsed = (time.perf_counter() - start) * 1000
-        content = resp.json().get("choices", [{}])[0].get("message", {}).get("content", "")
-        parsed = json.loads(content)
-        scores = parsed.get("scores") if isinstance(parsed, dict) else parsed
-        score_map: Dict[int, float] = {}
-        for entry in scores or []:
-            idx = entry.get("idx")
-            score = entry.get("score")
-            if isinstance(idx, int) and isinstance(score, (int, float)):
-                score_map[idx] = float(score)
         reranked: List[Dict[str, Any]] = []
         for idx, candidate in enumerate(payload_candidates):
             groq_score = score_map.get(idx)
@@ -107,11 +270,13 @@ def groq_rerank(query: str, docs: List[Dict[str, Any]], top_k: int, group: str)
             copy["metadata"] = normalize_acceptance_metadata(sanitize_metadata(copy["metadata"]))
             copy["metadata"]["groq_score"] = groq_score
             copy["metadata"]["groq_response_ms"] = round(elapsed, 1)
+            copy["metadata"]["groq_cached"] = idx in cached_idx
             reranked.append(copy)
         reranked.sort(key=lambda x: x.get("groq_score", x.get("score", 0.0)), reverse=True)
         return reranked[:top_k]
     except Exception as exc:  # broad to ensure fallback path
         logger.warning("Groq rerank failed, falling back to intrinsic scores: %s", exc)
+        mark_degraded("rerank", "fell back to retriever scores")
         return _enrich_with_local_scores(fallback)
 
 
@@ -127,20 +292,55 @@ def _enrich_with_local_scores(docs: List[Dict[str, Any]]) -> List[Dict[str, Any]
     return enriched
 
 
+async def passthrough_rerank(query: str, docs: List[Dict[str, Any]], top_k: int, group: str) -> List[Dict[str, Any]]:
+    """Keep the retriever's own scores (the same path groq_rerank falls back to)."""
+    if top_k <= 0 or not docs:
+        return []
+    return _enrich_with_local_scores(sorted(docs, key=lambda x: x.get("score", 0.0), reverse=True)[:top_k])
+
+
+_RERANKERS: Dict[str, Reranker] = {
+    "groq": groq_rerank,
+    "local": local_rerank,
+    "distilled": distilled_rerank,
+    "none": passthrough_rerank,
+}
+
+
+def register_reranker(name: str, reranker: Reranker) -> None:
+    """Register a reranker coroutine ``(query, docs, top_k, group) -> ranked docs`` under ``name``."""
+    _RERANKERS[name] = reranker
+
+
+def available_rerankers() -> List[str]:
+    return sorted(_RERANKERS)
+
+
+def get_reranker(name: Optional[str] = None) -> Reranker:
+    name = name or settings.reranker
+    try:
+        return _RERANKERS[name]
+    except KeyError:
+        raise ValueError(f"unknown reranker {name!r}; expected one of {', '.join(available_rerankers())}") from None
+
+
 def normalize_scores(results: List[Dict[str, Any]]) -> None:
     if not results:
         return
-    max_score = max((r.get("score", 0.0) for r in results), default=0.0)
-    if max_score <= 0 or math.isclose(max_score, 0.0):
-        for r in results:
-            r["norm_score"] = 0.0
-    else:
-        for r in results:
-            r["norm_score"] = float(r.get("score", 0.0)) / float(max_score)
+    normalized = normalize_max(np.array([float(r.get("score", 0.0) or 0.0) for r in results]))
+    for r, value in zip(results, normalized.tolist()):
+        r["norm_score"] = value
 
 
 __all__ = [
+    "Reranker",
     "groq_available",
     "groq_rerank",
+    "enable_batched_prompts",
+    "reset_batched_prompts",
+    "passthrough_rerank",
+    "register_reranker",
+    "available_rerankers",
+    "get_reranker",
     "normalize_scores",
 ]
@@ -4,18 +4,49 @@ from __future__ import annotations
 import asyncio
 import logging
 import time
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
 
+from . import metrics
 from .config import settings
 from .dedup import identifier_for_doc, prepare_document
+from .fusion import FUSION_STRATEGIES, fuse_results
 from .normalize import (
     normalize_query_text as _normalize_query_text,
     normalize_acceptance_metadata as _normalize_acceptance_metadata_impl,
     sanitize_metadata as _sanitize_metadata_impl,
 )
-from .rerank import groq_available as _groq_available_impl, groq_rerank as _groq_rerank_impl, normalize_scores
-from .vector_search import get_embedding as _get_embedding_impl, search_vector as _search_vector_impl
+from .rerank import (
+    enable_batched_prompts,
+    get_reranker,
+    groq_available as _groq_available_impl,
+    groq_rerank as _groq_rerank_impl,
+    normalize_scores,
+    reset_batched_prompts,
+)
+from .vector_search import (
+    get_embedding as _get_embedding_impl,
+    prefetch_embeddings,
+    reset_prefetched_embeddings,
+    search_vector as _search_vector_impl,
+    use_prefetched_embeddings,
+)
 from .Bm25 import search_with_atlas_pipeline as _search_with_atlas_pipeline_impl
+from .exact_vector import exact_vector_ready, search_exact_vector
+from .local_ann import local_ann_ready, search_local_ann
+from .local_bm25 import local_bm25_ready, search_local_bm25
+from .native_hybrid import search_native_hybrid
+from .projection import validate_fields
+from .request_context import (
+    budget_bucket,
+    clear_deadline,
+    degraded_stages,
+    get_deadline,
+    mark_degraded,
+    remaining_seconds,
+    start_deadline,
+    within_deadline,
+)
+from .singleflight import SingleFlight
 from .logging_utils import (
     clear_request_context,
     log_stage,
@@ -26,6 +57,10 @@ from .logging_utils import (
 
 logger = logging.getLogger("uvicorn.error")
 
+RERANK_MODES = ("per_group", "joint")
+
+_hybrid_flights = SingleFlight("hybrid_coalesced_requests")
+
 
 def normalize_query_text(text: str) -> str:
     return _normalize_query_text(text)
@@ -43,14 +78,48 @@ def _groq_available() -> bool:
     return _groq_available_impl()
 
 
-def _groq_rerank(query: str, docs: List[Dict[str, Any]], top_k: int, group: str) -> List[Dict[str, Any]]:
-    return _groq_rerank_impl(query, docs, top_k, group)
+async def _groq_rerank(query: str, docs: List[Dict[str, Any]], top_k: int, group: str) -> List[Dict[str, Any]]:
+    return await _groq_rerank_impl(query, docs, top_k, group)
+
+
+async def _rerank(
+    query: str, docs: List[Dict[str, Any]], top_k: int, group: str, reranker: str
+) -> List[Dict[str, Any]]:
+    return await get_reranker(reranker)(query, docs, top_k, group)
 
 
 def _norm_scores(results: List[Dict[str, Any]]) -> None:
     normalize_scores(results)
 
 
+# Progress callback ``(event, payload)`` for streaming clients; see ``hybrid_search``.
+HybridEventCallback = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+
+def _prepare(doc: Dict[str, Any], source: str) -> Dict[str, Any]:
+    prepared = prepare_document(doc, source)
+    prepared["final_score"] = float(
+        prepared.get("rerank_score", prepared.get("groq_score", prepared.get("score", 0.0)))
+    )
+    return prepared
+
+
+async def _emit_hits(
+    on_event: Optional[HybridEventCallback], source: str, docs: List[Dict[str, Any]], total: int, started: float
+) -> None:
+    """Send one retriever's raw hits (before normalization and reranking) to a streaming caller."""
+    if on_event is None:
+        return
+    try:
+        await on_event(source, {
+            "results": [_prepare(doc, source) for doc in docs],
+            "total_count": total,
+            "elapsed_ms": (time.perf_counter() - started) * 1000,
+        })
+    except Exception as exc:
+        logger.warning("Hybrid search %s event failed: %s", source, exc)
+
+
 def validate_limit(limit: Optional[int]) -> int:
     if limit is None:
         return settings.default_limit
@@ -66,15 +135,306 @@ async def search_with_langchain(query: str, limit: int) -> List[Dict[str, Any]]:
     raise RuntimeError("LangChain retriever not configured")
 
 
-async def search_with_atlas_pipeline(query: str, limit: int) -> Tuple[List[Dict[str, Any]], int]:
-    return await _search_with_atlas_pipeline_impl(query, limit)
+async def search_with_atlas_pipeline(
+    query: str, limit: int, fields: Optional[Sequence[str]] = None
+) -> Tuple[List[Dict[str, Any]], int]:
+    return await _search_with_atlas_pipeline_impl(query, limit, fields)
+
+
+async def search_bm25(
+    query: str, limit: int, fields: Optional[Sequence[str]] = None
+) -> Tuple[List[Dict[str, Any]], int]:
+    """BM25 retrieval through the configured backend, falling back to Atlas while the local index loads."""
+    if settings.bm25_backend == "local" and local_bm25_ready():
+        return await search_local_bm25(query, limit, fields)
+    return await search_with_atlas_pipeline(query, limit, fields)
 
 
-async def search_vector(query: str, k: int) -> Tuple[List[Dict[str, Any]], int, str]:
-    return await _search_vector_impl(query, k)
+async def search_vector(
+    query: str, k: int, fields: Optional[Sequence[str]] = None, embedding: Optional[List[float]] = None
+) -> Tuple[List[Dict[str, Any]], int, str]:
+    """Vector retrieval through the configured backend, falling back to Atlas while the local index loads."""
+    if settings.vector_backend == "local-ivf" and local_ann_ready():
+        return await search_local_ann(query, k, fields, embedding)
+    if settings.vector_backend == "exact" and exact_vector_ready():
+        return await search_exact_vector(query, k, fields, embedding)
+    try:
+        return await _search_vector_impl(query, k, fields, embedding)
+    except Exception as exc:
+        if not (settings.exact_vector_fallback and exact_vector_ready()):
+            raise
+        logger.warning("$vectorSearch failed (%s); serving exact results from the local matrix", exc)
+        metrics.increment("vector_exact_fallback_total")
+        return await search_exact_vector(query, k, fields, embedding)
+
+
+async def hybrid_search(
+    query: str,
+    limit: int,
+    bm25_ratio: float = 0.5,
+    rerank_mode: Optional[str] = None,
+    reranker: Optional[str] = None,
+    fusion: Optional[str] = None,
+    fields: Optional[Sequence[str]] = None,
+    on_event: Optional[HybridEventCallback] = None,
+) -> Dict[str, Any]:
+    """Perform hybrid search, sharing one pipeline run between identical in-flight requests.
+
+    With ``fusion`` other than ``"none"`` the per-source quotas are replaced by score fusion;
+    the fused list is only reranked (in one call) when ``rerank_mode="joint"``.
+
+    ``on_event`` receives ``("bm25" | "vector", payload)`` as soon as each retriever returns,
+    before reranking. Streaming callers get their own run rather than joining a shared one.
+    """
+    rerank_mode = rerank_mode or settings.rerank_mode
+    if rerank_mode not in RERANK_MODES:
+        raise ValueError(f"rerank_mode must be one of {', '.join(RERANK_MODES)}")
+    reranker = reranker or settings.reranker
+    get_reranker(reranker)
+    fusion = fusion or settings.fusion_strategy
+    if fusion not in FUSION_STRATEGIES:
+        raise ValueError(f"fusion must be one of {', '.join(FUSION_STRATEGIES)}")
+    fields = validate_fields(fields)
+    if on_event is not None or not settings.hybrid_singleflight_enabled:
+        return await _hybrid_search_once(query, limit, bm25_ratio, rerank_mode, reranker, fusion, fields, on_event)
+    key = (
+        normalize_query_text(query),
+        limit,
+        round(bm25_ratio, 4),
+        rerank_mode,
+        reranker,
+        fusion,
+        tuple(fields) if fields else None,
+        # A shared run executes under its leader's deadline, so only callers with a similar budget join it.
+        budget_bucket(),
+    )
+    # The leader's pipeline honours its own deadline and degrades; a joiner may have started later
+    # than the leader, so its wait is cut off at its own deadline instead.
+    return await _hybrid_flights.do(
+        key,
+        lambda: _hybrid_search_once(query, limit, bm25_ratio, rerank_mode, reranker, fusion, fields),
+        follower_wait=lambda shared: within_deadline("hybrid_search", shared),
+    )
+
+
+async def _joint_rerank(
+    query: str,
+    bm25_unique: List[Dict[str, Any]],
+    vector_unique: List[Dict[str, Any]],
+    desired_bm25: int,
+    desired_vector: int,
+    reranker: str,
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Score the union of both groups in one LLM call, then apply the per-source quotas."""
+    candidates = bm25_unique + vector_unique
+    if not candidates or desired_bm25 + desired_vector <= 0:
+        return [], []
+    bm25_ids = {identifier_for_doc(doc) for doc in bm25_unique}
+    scored = await _rerank(query, candidates, len(candidates), "joint", reranker)
+    bm25_final: List[Dict[str, Any]] = []
+    vector_final: List[Dict[str, Any]] = []
+    for doc in scored:
+        if identifier_for_doc(doc) in bm25_ids:
+            if len(bm25_final) < desired_bm25:
+                bm25_final.append(doc)
+        elif len(vector_final) < desired_vector:
+            vector_final.append(doc)
+    return bm25_final, vector_final
+
+
+def _unique_docs(docs: List[Dict[str, Any]], exclude: Optional[set] = None) -> List[Dict[str, Any]]:
+    seen = set(exclude or ())
+    unique: List[Dict[str, Any]] = []
+    for doc in docs:
+        identifier = identifier_for_doc(doc)
+        if identifier in seen:
+            continue
+        seen.add(identifier)
+        unique.append(doc)
+    return unique
+
+
+async def _pipelined_groups(
+    query: str,
+    fetch_bm25: int,
+    fetch_vector: int,
+    desired_bm25: int,
+    desired_vector: int,
+    reranker: str,
+    fields: Optional[List[str]],
+    timings: Dict[str, float],
+    on_event: Optional[HybridEventCallback] = None,
+) -> Dict[str, Any]:
+    """Run each retriever through normalize -> dedup -> rerank on its own as soon as it returns.
+
+    The BM25 group never waits for vector search; the slower path sets the latency. BM25 keeps
+    precedence for documents both retrievers return, so vector hits that arrive first wait up to
+    ``hybrid_overlap_wait_ms`` for the BM25 ids and drop the overlap before reranking, which keeps
+    the vector prompt identical to the two-query path. Only if BM25 is slower still is the vector
+    group ranked in full and the overlap removed when the two groups are reconciled.
+    """
+    state: Dict[str, Any] = {"bm25_ids": None if fetch_bm25 > 0 else set(), "vector_operator": None}
+    bm25_known = asyncio.Event()
+    if fetch_bm25 <= 0:
+        bm25_known.set()
+    started = time.perf_counter()
+    rerank_window: List[float] = []
+
+    async def _path(label: str, coro, desired: int) -> Tuple[List[Dict[str, Any]], int, List[Dict[str, Any]]]:
+        start = time.perf_counter()
+        try:
+            result = await coro
+        except Exception as exc:
+            logger.warning("Hybrid search sub-task failed (%s): %s", label, exc)
+            mark_degraded(label, f"retrieval failed: {type(exc).__name__}")
+            result = ([], 0)
+        timings[f"{label}_ms"] = (time.perf_counter() - start) * 1000
+        docs, total = list(result[0]), result[1]
+        if label == "vector" and len(result) == 3:
+            state["vector_operator"] = result[2]
+        log_stage(label, docs, duration_ms=timings[f"{label}_ms"])
+        await _emit_hits(on_event, label, docs, total, started)
 
+        norm_start = time.perf_counter()
+        _norm_scores(docs)
+        timings["normalize_ms"] = timings.get("normalize_ms", 0.0) + (time.perf_counter() - norm_start) * 1000
+
+        if label == "vector" and not bm25_known.is_set():
+            try:
+                wait = remaining_seconds(settings.hybrid_overlap_wait_ms / 1000.0)
+                await asyncio.wait_for(bm25_known.wait(), max(wait, 0.0))
+            except asyncio.TimeoutError:
+                metrics.increment("hybrid_overlap_wait_timeouts_total")
+        dedup_start = time.perf_counter()
+        if label == "bm25":
+            unique = _unique_docs(docs)
+            state["bm25_ids"] = {identifier_for_doc(doc) for doc in unique}
+            bm25_known.set()
+        else:
+            unique = _unique_docs(docs, state["bm25_ids"])
+        timings["dedup_ms"] = timings.get("dedup_ms", 0.0) + (time.perf_counter() - dedup_start) * 1000
 
-async def hybrid_search(query: str, limit: int, bm25_ratio: float = 0.5) -> Dict[str, Any]:
+        rerank_start = time.perf_counter()
+        rerank_window.append(rerank_start)
+        # BM25 wins overlaps, so it only needs its quota; a vector group ranked before the BM25 ids
+        # were known is ranked whole, because reconciliation may need candidates past the quota.
+        top_k = desired if label == "bm25" or state["bm25_ids"] is not None else len(unique)
+        ranked = await _rerank(query, unique, top_k, label, reranker) if desired > 0 else []
+        rerank_end = time.perf_counter()
+        rerank_window.append(rerank_end)
+        timings[f"{label}_rerank_ms"] = (rerank_end - rerank_start) * 1000
+        return docs, total, ranked
+
+    tasks = []
+    if fetch_bm25 > 0:
+        tasks.append(_path("bm25", search_bm25(query, fetch_bm25, fields), desired_bm25))
+    if fetch_vector > 0:
+        tasks.append(_path("vector", search_vector(query, fetch_vector, fields), desired_vector))
+    outputs = await asyncio.gather(*tasks)
+    bm25_docs, bm25_total, bm25_ranked = outputs.pop(0) if fetch_bm25 > 0 else ([], 0, [])
+    vec_docs, vec_total, vector_ranked = outputs.pop(0) if fetch_vector > 0 else ([], 0, [])
+
+    reconcile_start = time.perf_counter()
+    bm25_final = bm25_ranked[:desired_bm25]
+    vector_final = _unique_docs(vector_ranked, state["bm25_ids"])[:desired_vector]
+    timings["dedup_ms"] = timings.get("dedup_ms", 0.0) + (time.perf_counter() - reconcile_start) * 1000
+    timings["groq_ms"] = (max(rerank_window) - min(rerank_window)) * 1000 if rerank_window else 0.0
+    log_stage("dedup", bm25_final + vector_final, duration_ms=timings["dedup_ms"])
+
+    return {
+        "bm25_docs": bm25_docs,
+        "bm25_total": bm25_total,
+        "vec_docs": vec_docs,
+        "vec_total": vec_total,
+        "vector_operator": state["vector_operator"],
+        "bm25_final": bm25_final,
+        "vector_final": vector_final,
+    }
+
+
+async def _fetch_all(
+    query: str,
+    execution: str,
+    fetch_bm25: int,
+    fetch_vector: int,
+    bm25_ratio: float,
+    fields: Optional[List[str]],
+    timings: Dict[str, float],
+    on_event: Optional[HybridEventCallback] = None,
+) -> Tuple[List[Dict[str, Any]], int, List[Dict[str, Any]], int, Optional[str]]:
+    """Fetch both sources (natively or as two queries) and wait for all of them."""
+    started = time.perf_counter()
+
+    async def _timed(label: str, coro):
+        start = time.perf_counter()
+        result = await coro
+        timings[f"{label}_ms"] = (time.perf_counter() - start) * 1000
+        if label == "native":
+            await _emit_hits(on_event, "bm25", result[0], result[1], started)
+            await _emit_hits(on_event, "vector", result[2], result[3], started)
+        else:
+            await _emit_hits(on_event, label, result[0], result[1], started)
+        return result
+
+    tasks: List[asyncio.Task] = []
+    labels: List[str] = []
+    if execution != "two_query":
+        tasks.append(asyncio.create_task(_timed(
+            "native",
+            search_native_hybrid(query, fetch_bm25, fetch_vector, execution, bm25_ratio, fields),
+        )))
+        labels.append("native")
+    else:
+        if fetch_bm25 > 0:
+            tasks.append(asyncio.create_task(_timed("bm25", search_bm25(query, fetch_bm25, fields))))
+            labels.append("bm25")
+        if fetch_vector > 0:
+            tasks.append(asyncio.create_task(_timed("vector", search_vector(query, fetch_vector, fields))))
+            labels.append("vector")
+
+    fetch_start = time.perf_counter()
+    results: List[Any] = await asyncio.gather(*tasks, return_exceptions=True) if tasks else []
+    fetch_end = time.perf_counter()
+
+    bm25_docs: List[Dict[str, Any]] = []
+    bm25_total = 0
+    vec_docs: List[Dict[str, Any]] = []
+    vec_total = 0
+    vec_operator: Optional[str] = None
+
+    for idx, result in enumerate(results):
+        label = labels[idx]
+        if isinstance(result, Exception):
+            logger.warning("Hybrid search sub-task failed (%s): %s", label, result)
+            mark_degraded(label, f"retrieval failed: {type(result).__name__}")
+            continue
+        if label == "bm25" and isinstance(result, tuple) and len(result) == 2:
+            bm25_docs, bm25_total = result
+        elif label == "vector" and isinstance(result, tuple):
+            if len(result) == 3:
+                vec_docs, vec_total, vec_operator = result
+            elif len(result) == 2:
+                vec_docs, vec_total = result
+        elif label == "native" and isinstance(result, tuple) and len(result) == 5:
+            bm25_docs, bm25_total, vec_docs, vec_total, vec_operator = result
+
+    docs_duration_ms = (fetch_end - fetch_start) * 1000 if tasks else 0.0
+    log_stage("docs_fetched", list(bm25_docs) + list(vec_docs), duration_ms=docs_duration_ms)
+    log_stage("bm25", bm25_docs, duration_ms=timings.get("bm25_ms"))
+    log_stage("vector", vec_docs, duration_ms=timings.get("vector_ms"))
+    return bm25_docs, bm25_total, vec_docs, vec_total, vec_operator
+
+
+async def _hybrid_search_once(
+    query: str,
+    limit: int,
+    bm25_ratio: float,
+    rerank_mode: str,
+    reranker: str,
+    fusion: str,
+    fields: Optional[List[str]],
+    on_event: Optional[HybridEventCallback] = None,
+) -> Dict[str, Any]:
     """Perform hybrid search with double-fetch, Groq reranking, and deduplication."""
     raw_query = query
     request_id = new_request_id()
@@ -88,94 +448,93 @@ async def hybrid_search(query: str, limit: int, bm25_ratio: float = 0.5) -> Dict
         desired_bm25 = max(0, min(desired_bm25, limit))
         desired_vector = max(0, limit - desired_bm25)
 
-        fetch_bm25 = desired_bm25 * 2 if desired_bm25 > 0 else 0
-        fetch_vector = desired_vector * 2 if desired_vector > 0 else 0
+        if fusion == "none":
+            fetch_bm25 = desired_bm25 * 2 if desired_bm25 > 0 else 0
+            fetch_vector = desired_vector * 2 if desired_vector > 0 else 0
+        else:
+            # Fusion ranks the union directly, so each source only needs `limit` candidates.
+            fetch_bm25 = limit if bm25_ratio > 0 else 0
+            fetch_vector = limit if bm25_ratio < 1 else 0
 
         timings: Dict[str, float] = {}
-
-        async def _timed(label: str, coro):
-            start = time.perf_counter()
-            result = await coro
-            timings[f"{label}_ms"] = (time.perf_counter() - start) * 1000
-            return result
-
-        tasks: List[asyncio.Task] = []
-        labels: List[str] = []
-        if fetch_bm25 > 0:
-            tasks.append(asyncio.create_task(_timed("bm25", search_with_atlas_pipeline(query, fetch_bm25))))
-            labels.append("bm25")
-        if fetch_vector > 0:
-            tasks.append(asyncio.create_task(_timed("vector", search_vector(query, fetch_vector))))
-            labels.append("vector")
-
-        fetch_start = time.perf_counter()
-        results: List[Any] = await asyncio.gather(*tasks, return_exceptions=True) if tasks else []
-        fetch_end = time.perf_counter()
-
-        bm25_docs: List[Dict[str, Any]] = []
-        bm25_total = 0
-        vec_docs: List[Dict[str, Any]] = []
-        vec_total = 0
-        vec_operator: Optional[str] = None
-
-        for idx, result in enumerate(results):
-            label = labels[idx]
-            if isinstance(result, Exception):
-                logger.warning("Hybrid search sub-task failed (%s): %s", label, result)
-                continue
-            if label == "bm25" and isinstance(result, tuple) and len(result) == 2:
-                bm25_docs, bm25_total = result
-            elif label == "vector" and isinstance(result, tuple):
-                if len(result) == 3:
-                    vec_docs, vec_total, vec_operator = result
-                elif len(result) == 2:
-                    vec_docs, vec_total = result
-
-        docs_combined = list(bm25_docs) + list(vec_docs)
-        docs_duration_ms = (fetch_end - fetch_start) * 1000 if tasks else 0.0
-        log_stage("docs_fetched", docs_combined, duration_ms=docs_duration_ms)
-        log_stage("bm25", bm25_docs, duration_ms=timings.get("bm25_ms"))
-        log_stage("vector", vec_docs, duration_ms=timings.get("vector_ms"))
-
-        norm_start = time.perf_counter()
-        _norm_scores(bm25_docs)
-        _norm_scores(vec_docs)
-        timings["normalize_ms"] = (time.perf_counter() - norm_start) * 1000
-
-        dedup_start = time.perf_counter()
-        seen_ids = set()
-        bm25_unique: List[Dict[str, Any]] = []
-        for doc in bm25_docs:
-            identifier = identifier_for_doc(doc)
-            if identifier in seen_ids:
-                continue
-            seen_ids.add(identifier)
-            bm25_unique.append(doc)
-
-        vector_unique: List[Dict[str, Any]] = []
-        for doc in vec_docs:
-            identifier = identifier_for_doc(doc)
-            if identifier in seen_ids:
-                continue
-            seen_ids.add(identifier)
-            vector_unique.append(doc)
-
-        dedup_duration = (time.perf_counter() - dedup_start) * 1000
-        timings["dedup_ms"] = dedup_duration
-        log_stage("dedup", bm25_unique + vector_unique, duration_ms=dedup_duration)
-
-        rerank_start = time.perf_counter()
-        bm25_final = _groq_rerank(query, bm25_unique, desired_bm25, "bm25") if desired_bm25 > 0 else []
-        vector_final = _groq_rerank(query, vector_unique, desired_vector, "vector") if desired_vector > 0 else []
-        timings["groq_ms"] = (time.perf_counter() - rerank_start) * 1000
-
-        def _prepare(doc: Dict[str, Any], source: str) -> Dict[str, Any]:
-            prepared = prepare_document(doc, source)
-            prepared["final_score"] = float(prepared.get("groq_score", prepared.get("score", 0.0)))
-            return prepared
-
-        combined = [_prepare(doc, "bm25") for doc in bm25_final] + [_prepare(doc, "vector") for doc in vector_final]
-        combined.sort(key=lambda x: x.get("final_score", 0.0), reverse=True)
+        wall_start = time.perf_counter()
+
+        execution = settings.hybrid_execution
+        native_ok = (
+            settings.bm25_backend == "atlas"
+            and settings.vector_backend == "atlas"
+            and fetch_bm25 > 0
+            and fetch_vector > 0
+        )
+        if not native_ok:
+            execution = "two_query"
+
+        pipelined = execution == "two_query" and fusion == "none" and rerank_mode == "per_group"
+        if pipelined:
+            grouped = await _pipelined_groups(
+                query, fetch_bm25, fetch_vector, desired_bm25, desired_vector, reranker, fields, timings, on_event
+            )
+            bm25_total = grouped["bm25_total"]
+            vec_total = grouped["vec_total"]
+            vec_operator = grouped["vector_operator"]
+            bm25_final = grouped["bm25_final"]
+            vector_final = grouped["vector_final"]
+            combined = [_prepare(doc, "bm25") for doc in bm25_final] + [_prepare(doc, "vector") for doc in vector_final]
+            combined.sort(key=lambda x: x.get("final_score", 0.0), reverse=True)
+        elif fusion != "none":
+            bm25_docs, bm25_total, vec_docs, vec_total, vec_operator = await _fetch_all(
+                query, execution, fetch_bm25, fetch_vector, bm25_ratio, fields, timings, on_event
+            )
+            fusion_start = time.perf_counter()
+            fused = fuse_results(
+                {"bm25": bm25_docs, "vector": vec_docs},
+                fusion,
+                weights={"bm25": bm25_ratio, "vector": 1.0 - bm25_ratio},
+                rrf_k=settings.fusion_rrf_k,
+            )
+            timings["fusion_ms"] = (time.perf_counter() - fusion_start) * 1000
+            log_stage("fusion", fused, duration_ms=timings["fusion_ms"])
+
+            rerank_start = time.perf_counter()
+            if rerank_mode == "joint":
+                fused_final = await _rerank(query, fused, limit, "joint", reranker)
+            else:
+                fused_final = fused[:limit]
+            timings["groq_ms"] = (time.perf_counter() - rerank_start) * 1000
+
+            combined = [_prepare(doc, doc.get("source", "hybrid")) for doc in fused_final]
+            bm25_final = [doc for doc in fused_final if "bm25" in doc.get("source", "")]
+            vector_final = [doc for doc in fused_final if "vector" in doc.get("source", "")]
+        else:
+            bm25_docs, bm25_total, vec_docs, vec_total, vec_operator = await _fetch_all(
+                query, execution, fetch_bm25, fetch_vector, bm25_ratio, fields, timings, on_event
+            )
+            norm_start = time.perf_counter()
+            _norm_scores(bm25_docs)
+            _norm_scores(vec_docs)
+            timings["normalize_ms"] = (time.perf_counter() - norm_start) * 1000
+
+            dedup_start = time.perf_counter()
+            bm25_unique = _unique_docs(bm25_docs)
+            vector_unique = _unique_docs(vec_docs, {identifier_for_doc(doc) for doc in bm25_unique})
+            dedup_duration = (time.perf_counter() - dedup_start) * 1000
+            timings["dedup_ms"] = dedup_duration
+            log_stage("dedup", bm25_unique + vector_unique, duration_ms=dedup_duration)
+
+            rerank_start = time.perf_counter()
+            if rerank_mode == "joint":
+                bm25_final, vector_final = await _joint_rerank(
+                    query, bm25_unique, vector_unique, desired_bm25, desired_vector, reranker
+                )
+            else:
+                bm25_final, vector_final = await asyncio.gather(
+                    _rerank(query, bm25_unique, desired_bm25, "bm25", reranker),
+                    _rerank(query, vector_unique, desired_vector, "vector", reranker),
+                )
+            timings["groq_ms"] = (time.perf_counter() - rerank_start) * 1000
+
+            combined = [_prepare(doc, "bm25") for doc in bm25_final] + [_prepare(doc, "vector") for doc in vector_final]
+            combined.sort(key=lambda x: x.get("final_score", 0.0), reverse=True)
 
         log_stage("rerank", combined, duration_ms=timings.get("groq_ms"))
 
@@ -184,13 +543,9 @@ async def hybrid_search(query: str, limit: int, bm25_ratio: float = 0.5) -> Dict
         timings.setdefault("normalize_ms", 0.0)
         timings.setdefault("groq_ms", 0.0)
         timings.setdefault("dedup_ms", 0.0)
-        timings["total_ms"] = (
-            timings.get("bm25_ms", 0.0)
-            + timings.get("vector_ms", 0.0)
-            + timings.get("normalize_ms", 0.0)
-            + timings.get("groq_ms", 0.0)
-            + timings.get("dedup_ms", 0.0)
-        )
+        # Stages overlap under pipelining, so the total is wall-clock rather than a sum of stages.
+        timings["total_ms"] = (time.perf_counter() - wall_start) * 1000
+        deadline = get_deadline()
 
         logger.info(
             "hybrid summary: query=%s bm25_final=%d vector_final=%d timings(ms)=%s",
@@ -207,21 +562,96 @@ async def hybrid_search(query: str, limit: int, bm25_ratio: float = 0.5) -> Dict
                 "query": query,
                 "limit": limit,
                 "bm25_ratio": bm25_ratio,
+                "rerank_mode": rerank_mode,
+                "reranker": reranker,
+                "fusion": fusion,
+                "fields": fields,
                 "bm25_final": len(bm25_final),
                 "vector_final": len(vector_final),
                 "bm25_fetch": fetch_bm25,
                 "vector_fetch": fetch_vector,
                 "vector_operator": vec_operator,
-                "groq_model": settings.groq_model if _groq_available() else None,
+                "execution": execution,
+                "pipelined": pipelined,
+                "groq_model": settings.groq_model if reranker == "groq" and _groq_available() else None,
+                "deadline_ms": deadline.budget_ms if deadline is not None else None,
             },
             "timings": timings,
+            "degraded": degraded_stages(),
         }
     finally:
         clear_request_context()
 
 
-def _get_embedding(text: str) -> List[float]:
-    return _get_embedding_impl(text)
+# One entry of a batch: (query, limit, fields, timeout_ms).
+BatchItem = Tuple[str, int, Optional[Sequence[str]], float]
+
+
+async def hybrid_search_batch(
+    items: Sequence[BatchItem],
+    bm25_ratio: float = 0.5,
+    rerank_mode: Optional[str] = None,
+    reranker: Optional[str] = None,
+    fusion: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Run many hybrid searches with shared embedding, Mongo and rerank resources.
+
+    All query texts are embedded up front in list-``input`` calls, at most ``batch_concurrency``
+    searches run at once, and Groq scoring coalesces across items into multi-query prompts.
+    Each item gets its own deadline; failures are reported in place instead of failing the batch.
+    """
+    start = time.perf_counter()
+    timings: Dict[str, float] = {}
+    prefetched: Dict[str, List[float]] = {}
+    if items and bm25_ratio < 1.0:
+        start_deadline(max(timeout_ms for _, _, _, timeout_ms in items))
+        try:
+            prefetched = await prefetch_embeddings([query for query, _, _, _ in items])
+        except Exception as exc:
+            # Items fall back to embedding individually through the regular batcher.
+            logger.warning("Batch embedding prefetch failed: %s", exc)
+        finally:
+            clear_deadline()
+        timings["embedding_prefetch_ms"] = round((time.perf_counter() - start) * 1000, 2)
+
+    semaphore = asyncio.Semaphore(max(1, settings.batch_concurrency))
+
+    async def run(index: int, item: BatchItem) -> Dict[str, Any]:
+        query, limit, fields, timeout_ms = item
+        async with semaphore:
+            start_deadline(timeout_ms)
+            try:
+                res = await hybrid_search(
+                    query, limit, bm25_ratio, rerank_mode=rerank_mode, reranker=reranker, fusion=fusion, fields=fields
+                )
+                return {"index": index, "ok": True, **res}
+            except Exception as exc:
+                logger.warning("Batch item %d failed: %s", index, exc)
+                return {"index": index, "ok": False, "error": str(exc) or type(exc).__name__}
+            finally:
+                clear_deadline()
+
+    embeddings_token = use_prefetched_embeddings(prefetched)
+    prompts_token = enable_batched_prompts()
+    try:
+        results = await asyncio.gather(*(run(index, item) for index, item in enumerate(items)))
+    finally:
+        reset_batched_prompts(prompts_token)
+        reset_prefetched_embeddings(embeddings_token)
+
+    metrics.increment("hybrid_batch_requests_total")
+    metrics.increment("hybrid_batch_items_total", len(items))
+    timings["total_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    return {
+        "results": results,
+        "count": len(results),
+        "failed": sum(1 for result in results if not result["ok"]),
+        "timings": timings,
+    }
+
+
+async def _get_embedding(text: str) -> List[float]:
+    return await _get_embedding_impl(text)
 
 
 __all__ = [
@@ -233,7 +663,12 @@ __all__ = [
     "validate_limit",
     "search_with_langchain",
     "search_with_atlas_pipeline",
+    "search_bm25",
     "search_vector",
     "hybrid_search",
+    "hybrid_search_batch",
+    "HybridEventCallback",
+    "RERANK_MODES",
+    "FUSION_STRATEGIES",
     "_get_embedding",
 ]
@@ -0,0 +1,63 @@
+"""Single-flight coalescing so identical concurrent calls share one execution."""
+from __future__ import annotations
+
+import asyncio
+import copy
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from . import metrics
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task) -> None:
+        self.task = task
+        self.followers = 0
+
+
+class SingleFlight:
+    """Run at most one ``factory()`` per key at a time; late arrivals await the same task.
+
+    When a flight is shared, every caller receives its own deep copy of the result so that
+    per-request mutation (e.g. by response serialization) cannot leak across callers.
+    """
+
+    def __init__(self, coalesced_metric: str) -> None:
+        self._metric = coalesced_metric
+        self._flights: Dict[Hashable, _Flight] = {}
+
+    def inflight(self) -> int:
+        return len(self._flights)
+
+    async def do(
+        self,
+        key: Hashable,
+        factory: Callable[[], Awaitable[Any]],
+        follower_wait: Optional[Callable[[Awaitable[Any]], Awaitable[Any]]] = None,
+    ) -> Any:
+        """Run or join the flight for ``key``.
+
+        ``follower_wait`` wraps a joining caller's wait (e.g. to bound it by that caller's own
+        deadline); the leader always awaits its own execution directly.
+        """
+        flight = self._flights.get(key)
+        if flight is not None:
+            flight.followers += 1
+            metrics.increment(self._metric)
+            # shield: a disconnecting or timed-out follower must not cancel the shared execution.
+            shared = asyncio.shield(flight.task)
+            result = await (follower_wait(shared) if follower_wait is not None else shared)
+            return copy.deepcopy(result)
+
+        task = asyncio.ensure_future(factory())
+        flight = _Flight(task)
+        self._flights[key] = flight
+        task.add_done_callback(lambda _task: self._finish(key, flight))
+        result = await asyncio.shield(task)
+        return copy.deepcopy(result) if flight.followers else result
+
+    def _finish(self, key: Hashable, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+
+__all__ = ["SingleFlight"]
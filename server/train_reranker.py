@@ -0,0 +1,106 @@
+"""Offline training of the distilled reranker from captured Groq scores.
+
+Usage (from the repository root)::
+
+    python -m server.train_reranker --input .cache/rerank_capture.jsonl --output .cache/reranker.json
+"""
+from __future__ import annotations
+
+import argparse
+import datetime as _dt
+import json
+from typing import List, Tuple
+
+import numpy as np
+
+from .local_rerank import FEATURE_NAMES
+
+
+def read_samples(path: str) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+    features: List[List[float]] = []
+    targets: List[float] = []
+    queries: List[str] = []
+    with open(path, "r", encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            vec = record.get("features")
+            if not isinstance(vec, list) or len(vec) != len(FEATURE_NAMES):
+                continue
+            features.append(vec)
+            targets.append(float(record["groq_score"]))
+            queries.append(record.get("query", ""))
+    return np.asarray(features, dtype=np.float64), np.asarray(targets, dtype=np.float64), queries
+
+
+def fit_ridge(x: np.ndarray, y: np.ndarray, l2: float) -> Tuple[np.ndarray, float]:
+    """Closed-form ridge regression with an unpenalized bias term."""
+    x_mean = x.mean(axis=0)
+    y_mean = float(y.mean())
+    xc = x - x_mean
+    gram = xc.T @ xc + l2 * np.eye(x.shape[1])
+    weights = np.linalg.solve(gram, xc.T @ (y - y_mean))
+    bias = y_mean - float(x_mean @ weights)
+    return weights, bias
+
+
+def _split_by_query(queries: List[str], holdout: float, seed: int) -> np.ndarray:
+    """Hold out whole queries so evaluation reflects unseen searches."""
+    unique = sorted(set(queries))
+    rng = np.random.default_rng(seed)
+    held = set(rng.choice(unique, size=int(len(unique) * holdout), replace=False)) if unique else set()
+    return np.array([q in held for q in queries], dtype=bool)
+
+
+def _evaluate(x: np.ndarray, y: np.ndarray, weights: np.ndarray, bias: float) -> dict:
+    if len(y) == 0:
+        return {"samples": 0}
+    pred = x @ weights + bias
+    ss_res = float(((y - pred) ** 2).sum())
+    ss_tot = float(((y - y.mean()) ** 2).sum()) or 1e-12
+    rank_pred = np.argsort(np.argsort(pred))
+    rank_true = np.argsort(np.argsort(y))
+    spearman = float(np.corrcoef(rank_pred, rank_true)[0, 1]) if len(y) > 1 else 0.0
+    return {
+        "samples": int(len(y)),
+        "mae": float(np.abs(y - pred).mean()),
+        "r2": 1.0 - ss_res / ss_tot,
+        "spearman": spearman,
+    }
+
+
+def main(argv: List[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Fit the distilled reranker on captured Groq scores.")
+    parser.add_argument("--input", required=True, help="JSONL capture written when RERANK_CAPTURE_PATH is set")
+    parser.add_argument("--output", required=True, help="where to write the model JSON (DISTILLED_MODEL_PATH)")
+    parser.add_argument("--l2", type=float, default=1.0, help="ridge regularization strength")
+    parser.add_argument("--holdout", type=float, default=0.2, help="fraction of queries held out for evaluation")
+    parser.add_argument("--seed", type=int, default=13)
+    args = parser.parse_args(argv)
+
+    x, y, queries = read_samples(args.input)
+    if len(y) < len(FEATURE_NAMES) + 1:
+        raise SystemExit(f"need at least {len(FEATURE_NAMES) + 1} samples, found {len(y)}")
+
+    held = _split_by_query(queries, args.holdout, args.seed)
+    train = ~held if (~held).sum() > len(FEATURE_NAMES) else np.ones_like(held)
+    weights, bias = fit_ridge(x[train], y[train], args.l2)
+
+    model = {
+        "feature_names": list(FEATURE_NAMES),
+        "weights": [float(w) for w in weights],
+        "bias": bias,
+        "l2": args.l2,
+        "trained_at": _dt.datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "train": _evaluate(x[train], y[train], weights, bias),
+        "holdout": _evaluate(x[held], y[held], weights, bias),
+    }
+    with open(args.output, "w", encoding="utf-8") as fh:
+        json.dump(model, fh, indent=2)
+    print(json.dumps({"output": args.output, "train": model["train"], "holdout": model["holdout"]}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
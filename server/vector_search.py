@@ -2,17 +2,30 @@
 from __future__ import annotations
 
 import asyncio
+import contextvars
 import logging
 import time
-from functools import lru_cache
-from typing import Any, Dict, List, Optional, Tuple
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
-import requests
-from requests import HTTPError
+import httpx
 
 from .config import settings
+from . import metrics
+from .candidate_tuning import num_candidates_for, record_vector_query
 from .db import get_collection
-from .normalize import normalize_query_text, normalize_acceptance_metadata, sanitize_metadata
+from .embedding_cache import get_cached_embedding, get_cached_embeddings, put_cached_embedding
+from .http_client import get_embedding_client
+from .micro_batcher import MicroBatcher
+from .normalize import normalize_query_text
+from .request_context import DeadlineExceeded, has_budget, mongo_time_limit, within_deadline
+from .hydration import hydrate
+from .projection import (
+    document_from_result,
+    id_projection_stages,
+    result_projection_stages,
+    stored_source_fields,
+)
 
 
 logger = logging.getLogger("uvicorn.error")
@@ -20,6 +33,18 @@ logger = logging.getLogger("uvicorn.error")
 
 _EMBEDDING_ENDPOINT: Optional[Tuple[str, Dict[str, str]]] = None
 
+_EMBEDDING_CACHE: "OrderedDict[str, List[float]]" = OrderedDict()
+_EMBEDDING_CACHE_SIZE = 256
+
+_RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+_BATCHER: Optional[MicroBatcher[str, List[float]]] = None
+
+# Vectors fetched up front by a bulk caller; consulted before any cache so a batch never re-embeds.
+_prefetched: contextvars.ContextVar[Optional[Dict[str, List[float]]]] = contextvars.ContextVar(
+    "prefetched_embeddings", default=None
+)
+
 
 def _resolve_embedding_endpoint() -> Tuple[str, Dict[str, str]]:
     global _EMBEDDING_ENDPOINT
@@ -43,83 +68,240 @@ def _resolve_embedding_endpoint() -> Tuple[str, Dict[str, str]]:
     return _EMBEDDING_ENDPOINT
 
 
-@lru_cache(maxsize=256)
-def get_embedding(text: str) -> List[float]:
-    """Fetch an embedding vector from the configured provider, caching by normalized text."""
-    normalized = normalize_query_text(text)
-    if not normalized:
-        raise ValueError("cannot embed empty text")
+def _parse_embedding_body(body: Any, url: str, elapsed: float) -> List[float]:
+    data = body.get("data") if isinstance(body, dict) else None
+    if isinstance(data, list) and data:
+        embedding = data[0].get("embedding")
+        if isinstance(embedding, list):
+            logger.info("Embedding call ok url=%s ms=%.1f", url, elapsed)
+            print(f"[embedding] using url={url} header=bearer ({elapsed:.1f} ms)")
+            return embedding
+    if isinstance(body, dict) and isinstance(body.get("embedding"), list):
+        logger.info("Embedding call ok url=%s ms=%.1f (top-level)", url, elapsed)
+        print(f"[embedding] using url={url} header=bearer (top-level, {elapsed:.1f} ms)")
+        return body["embedding"]
+    if isinstance(body, list):
+        logger.info("Embedding call ok url=%s ms=%.1f (list)", url, elapsed)
+        print(f"[embedding] using url={url} header=bearer (list, {elapsed:.1f} ms)")
+        return body
+    raise RuntimeError(f"Unexpected embedding response format from {url}: {type(body)}")
+
 
+def _parse_embedding_batch_body(body: Any, url: str, elapsed: float, expected: int) -> List[List[float]]:
+    data = body.get("data") if isinstance(body, dict) else None
+    if not isinstance(data, list) or len(data) != expected:
+        raise RuntimeError(f"Unexpected batch embedding response format from {url}: {type(body)}")
+    ordered = sorted(data, key=lambda item: item.get("index", 0)) if all("index" in item for item in data) else data
+    vectors = [item.get("embedding") for item in ordered]
+    if not all(isinstance(vec, list) for vec in vectors):
+        raise RuntimeError(f"Batch embedding response from {url} is missing vectors")
+    logger.info("Embedding batch call ok url=%s size=%d ms=%.1f", url, expected, elapsed)
+    return vectors
+
+
+async def _post_embedding_request(payload: Dict[str, Any]) -> Tuple[Any, str, float]:
+    """POST to the provider over the pooled client, retrying transient failures without blocking the loop."""
     url, headers = _resolve_embedding_endpoint()
-    payload = {"input": normalized, "model": settings.embedding_model}
+    client = get_embedding_client()
+    attempts = max(1, settings.embedding_max_retries + 1)
 
-    for attempt in range(2):
+    for attempt in range(attempts):
         start = time.perf_counter()
         try:
-            resp = requests.post(url, headers=headers, json=payload, timeout=30)
+            resp = await client.post(url, headers=headers, json=payload)
             resp.raise_for_status()
             elapsed = (time.perf_counter() - start) * 1000
-            body = resp.json()
-            data = body.get("data") if isinstance(body, dict) else None
-            if isinstance(data, list) and data:
-                embedding = data[0].get("embedding")
-                if isinstance(embedding, list):
-                    logger.info("Embedding call ok url=%s ms=%.1f", url, elapsed)
-                    print(f"[embedding] using url={url} header=bearer ({elapsed:.1f} ms)")
-                    return embedding
-            if isinstance(body, dict) and isinstance(body.get("embedding"), list):
-                logger.info("Embedding call ok url=%s ms=%.1f (top-level)", url, elapsed)
-                print(f"[embedding] using url={url} header=bearer (top-level, {elapsed:.1f} ms)")
-                return body["embedding"]
-            if isinstance(body, list):
-                logger.info("Embedding call ok url=%s ms=%.1f (list)", url, elapsed)
-                print(f"[embedding] using url={url} header=bearer (list, {elapsed:.1f} ms)")
-                return body
-            raise RuntimeError(f"Unexpected embedding response format from {url}: {type(body)}")
-        except HTTPError as exc:
-            status = exc.response.status_code if exc.response is not None else None
-            if status == 429 and attempt == 0:
-                time.sleep(1.0)
-                continue
-        raise
+            return resp.json(), url, elapsed
+        except httpx.HTTPStatusError as exc:
+            if exc.response.status_code not in _RETRYABLE_STATUS or attempt == attempts - 1:
+                raise
+            logger.warning("Embedding request returned %d, retrying", exc.response.status_code)
+        except httpx.TransportError as exc:
+            if attempt == attempts - 1:
+                raise
+            logger.warning("Embedding request transport error, retrying: %s", exc)
+        backoff = settings.embedding_retry_backoff_seconds * (2 ** attempt)
+        if not has_budget(backoff * 1000):
+            raise DeadlineExceeded("embedding")
+        await asyncio.sleep(backoff)
 
     raise RuntimeError("Embedding request failed after retries")
 
 
-async def search_vector(query: str, k: int) -> Tuple[List[Dict[str, Any]], int, str]:
-    """Perform vector search using MongoDB Atlas $vectorSearch operator."""
+async def _request_embeddings(texts: List[str]) -> List[List[float]]:
+    """Embed normalized texts in one provider round trip, using list ``input`` when batching."""
+    metrics.increment("embedding_requests_total")
+    if len(texts) == 1:
+        body, url, elapsed = await _post_embedding_request({"input": texts[0], "model": settings.embedding_model})
+        return [_parse_embedding_body(body, url, elapsed)]
+    body, url, elapsed = await _post_embedding_request({"input": texts, "model": settings.embedding_model})
+    return _parse_embedding_batch_body(body, url, elapsed, len(texts))
+
+
+async def _embed_batch(texts: List[str]) -> List[List[float]]:
+    """Batcher dispatch: embed each distinct text once and fan the vectors back out."""
+    unique = list(dict.fromkeys(texts))
+    metrics.observe("embedding_batch_size", len(unique))
+    vectors = await _request_embeddings(unique)
+    if len(vectors) != len(unique):
+        raise RuntimeError(f"Embedding batch returned {len(vectors)} vectors for {len(unique)} inputs")
+    by_text = dict(zip(unique, vectors))
+    return [by_text[text] for text in texts]
+
+
+def _get_batcher() -> MicroBatcher[str, List[float]]:
+    global _BATCHER
+    if _BATCHER is None:
+        _BATCHER = MicroBatcher(
+            _embed_batch,
+            window_ms=settings.embedding_batch_window_ms,
+            max_size=settings.embedding_batch_max_size,
+            metric_prefix="embedding",
+        )
+    return _BATCHER
+
+
+async def get_embedding(text: str) -> List[float]:
+    """Fetch an embedding vector from the configured provider, caching by normalized text."""
+    normalized = normalize_query_text(text)
+    if not normalized:
+        raise ValueError("cannot embed empty text")
+
+    prefetched = _prefetched.get()
+    if prefetched is not None and normalized in prefetched:
+        return prefetched[normalized]
+
+    cached = _EMBEDDING_CACHE.get(normalized)
+    if cached is not None:
+        _EMBEDDING_CACHE.move_to_end(normalized)
+        return cached
+
+    # SQLite lookups block, so they run on a worker thread; writes are queued for the cache's writer.
+    embedding = await asyncio.to_thread(get_cached_embedding, settings.embedding_model, normalized)
+    if embedding is not None:
+        _remember(normalized, embedding)
+        return embedding
+
+    if settings.embedding_batching_enabled:
+        embedding = await within_deadline("embedding", _get_batcher().submit(normalized))
+    else:
+        embedding = (await within_deadline("embedding", _request_embeddings([normalized])))[0]
+
+    put_cached_embedding(settings.embedding_model, normalized, embedding)
+    _remember(normalized, embedding)
+    return embedding
+
+
+async def prefetch_embeddings(texts: Sequence[str]) -> Dict[str, List[float]]:
+    """Embed many texts with as few provider calls as possible, keyed by normalized text.
+
+    Cache hits are served locally; the misses go out as list-``input`` requests of at most
+    ``batch_embedding_max_inputs`` texts each and are written back to the persistent cache.
+    """
+    found: Dict[str, List[float]] = {}
+    unseen: List[str] = []
+    for text in texts:
+        normalized = normalize_query_text(text)
+        if not normalized or normalized in found or normalized in unseen:
+            continue
+        embedding = _EMBEDDING_CACHE.get(normalized)
+        if embedding is None:
+            unseen.append(normalized)
+        else:
+            found[normalized] = embedding
+    if unseen:
+        found.update(await asyncio.to_thread(get_cached_embeddings, settings.embedding_model, unseen))
+    misses = [normalized for normalized in unseen if normalized not in found]
+
+    chunk = max(1, settings.batch_embedding_max_inputs)
+    for offset in range(0, len(misses), chunk):
+        batch = misses[offset : offset + chunk]
+        vectors = await within_deadline("embedding", _request_embeddings(batch))
+        for normalized, embedding in zip(batch, vectors):
+            put_cached_embedding(settings.embedding_model, normalized, embedding)
+            found[normalized] = embedding
+    return found
+
+
+def use_prefetched_embeddings(embeddings: Dict[str, List[float]]) -> contextvars.Token:
+    return _prefetched.set(embeddings)
+
+
+def reset_prefetched_embeddings(token: contextvars.Token) -> None:
+    _prefetched.reset(token)
+
+
+def _remember(normalized: str, embedding: List[float]) -> None:
+    _EMBEDDING_CACHE[normalized] = embedding
+    while len(_EMBEDDING_CACHE) > _EMBEDDING_CACHE_SIZE:
+        _EMBEDDING_CACHE.popitem(last=False)
+
+
+def build_vector_stage(
+    embedding: List[float], k: int, num_candidates: int = 0, exact: bool = False
+) -> Dict[str, Any]:
+    """``$vectorSearch`` stage; ``numCandidates`` comes from the adaptive policy unless given.
+
+    ``exact=True`` requests exhaustive (ENN) search, which takes no ``numCandidates``.
+    """
+    stage: Dict[str, Any] = {
+        "index": settings.vector_index_name,
+        "path": "embedding",
+        "queryVector": embedding,
+        "limit": k,
+    }
+    if exact:
+        stage["exact"] = True
+    else:
+        stage["numCandidates"] = num_candidates or num_candidates_for(k)
+    return {"$vectorSearch": stage}
+
+
+def build_vector_pipeline(
+    embedding: List[float], k: int, fields: Optional[Sequence[str]] = None
+) -> List[Dict[str, Any]]:
+    """Build the $vectorSearch aggregation honoring the configured result source."""
+    stage = build_vector_stage(embedding, k)
+    stored = stored_source_fields(fields)
+    if settings.result_source == "ids":
+        return [stage, *id_projection_stages("vectorSearchScore")]
+    if stored is not None:
+        # $vectorSearch has no returnStoredSource; project the requested fields, or else the same
+        # stored field list, so the payload matches the BM25 side and stays small.
+        return [stage, *result_projection_stages("vectorSearchScore", fields or stored)]
+    return [stage, *result_projection_stages("vectorSearchScore", fields)]
+
+
+async def search_vector(
+    query: str, k: int, fields: Optional[Sequence[str]] = None, embedding: Optional[List[float]] = None
+) -> Tuple[List[Dict[str, Any]], int, str]:
+    """Perform vector search using MongoDB Atlas $vectorSearch operator.
+
+    A precomputed ``embedding`` (e.g. a document's stored vector) is used as-is instead of embedding ``query``.
+    """
     query = normalize_query_text(query)
-    if k <= 0 or not query:
+    if k <= 0 or (not query and embedding is None):
         return [], 0, "$vectorSearch"
 
-    loop = asyncio.get_running_loop()
-    embedding = await loop.run_in_executor(None, get_embedding, query)
+    if embedding is None:
+        embedding = await get_embedding(query)
+        # Only real query vectors feed the recall sample: a stored document vector finds
+        # itself first and would make small candidate pools look accurate enough.
+        record_vector_query(embedding, k)
 
     coll = get_collection()
-    stage = {
-        "$vectorSearch": {
-            "index": settings.vector_index_name,
-            "path": "embedding",
-            "queryVector": embedding,
-            "numCandidates": max(100, k * 10),
-            "limit": k,
-        }
-    }
-    pipeline = [stage, {"$project": {"score": {"$meta": "vectorSearchScore"}, "document": "$$ROOT"}}]
+    pipeline = build_vector_pipeline(embedding, k, fields)
+    ids_only = settings.result_source == "ids"
 
     docs: List[Dict[str, Any]] = []
     try:
-        cursor = coll.aggregate(pipeline)
-        async for doc in cursor:
-            root = doc.get("document", {}) or {}
-            content = root.get("content") or root.get("text") or root.get("summary") or ""
-            metadata = {k: v for k, v in root.items() if k not in {"content", "text", "summary", "embedding"}}
-            metadata = normalize_acceptance_metadata(sanitize_metadata(metadata))
-            docs.append({
-                "content": content,
-                "score": float(doc.get("score", 0.0) or 0.0),
-                "metadata": metadata,
-            })
+        cursor = coll.aggregate(pipeline, **mongo_time_limit())
+        if ids_only:
+            hits = [(doc.get("_id"), doc.get("score", 0.0)) async for doc in cursor]
+            docs = await hydrate(hits, fields)
+        else:
+            async for doc in cursor:
+                docs.append(document_from_result(doc))
         logger.info("vector search operator=$vectorSearch returned %d", len(docs))
         print(f"[vector-search] operator=$vectorSearch results={len(docs)}")
         return docs, len(docs), "$vectorSearch"
@@ -131,5 +313,10 @@ async def search_vector(query: str, k: int) -> Tuple[List[Dict[str, Any]], int,
 
 __all__ = [
     "get_embedding",
+    "prefetch_embeddings",
+    "use_prefetched_embeddings",
+    "reset_prefetched_embeddings",
+    "build_vector_stage",
+    "build_vector_pipeline",
     "search_vector",
 ]